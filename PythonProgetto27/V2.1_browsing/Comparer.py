@@ -1,158 +1,236 @@
 import logging
+import multiprocessing
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 import FileWriter
+import Model
+import Renderer
 
 N_ITINERARI_ATTESI = 8 
+MIN_ITINERARI_PER_PROCESSO = 5000  # confronto parallelo: sotto questa soglia per processo si resta sequenziali
+_SWITCH_ASSENTE = (None, None, None)
+_CAMPI_SWITCH = ('SwitchMotorId', 'SwitchMotorName', 'SwitchMotorState')
 
-def compare_data(xml_itine, db_itine, defaultLogger, errorLogger):
+_norm = Model.normalizza_valore
+
+_coppie_condivise = []  # coppie del confronto parallelo, ereditate dai processi avviati con 'fork'
+
+def _switch_normalizzato(switch):
+    """Restituisce (SwitchMotorId, SwitchMotorName, SwitchMotorState) normalizzati a stringa o None."""
+    if switch is None:
+        return _SWITCH_ASSENTE
+    return (_norm(switch.motor_id), _norm(switch.motor_name), _norm(switch.motor_state))
+
+def _scrittore(writer, errorLogger):
+    """Funzione che scrive una riga del report: il `FileWriter.ReportWriter` indicato oppure FileWriter.write_existing_file."""
+    if writer is not None:
+        return writer.write
+    return lambda riga: FileWriter.write_existing_file(riga, errorLogger)
+
+def _differenze(xml_item, db_item):
+    """Elenco delle `Model.Differenza` tra l'itinerario XML e quello del DB (vuoto se coincidono)."""
+    differences = []
+    nome = xml_item.name
+
+    # 2. Confronto TrackCircuitList: LOGICA DI SET PER ISOLARE I MANCANTI
+    xml_tc_names = set(xml_item.track_circuits)
+    xml_tc_names.discard(None)
+    db_tc_names = set(db_item.track_circuits)
+    db_tc_names.discard(None)
+
+    # Calcola le differenze
+    missing_in_db = xml_tc_names - db_tc_names # TC presenti in XML ma non nel DB
+    missing_in_xml = db_tc_names - xml_tc_names # TC presenti in DB ma non nell'XML
+
+    # Nell'ordine della lista dell'itinerario: il report non dipende dall'ordine dei set,
+    # che cambia tra un'esecuzione e l'altra (e tra i processi del confronto parallelo)
+    if missing_in_db:
+        missing_in_db = [tc for tc in dict.fromkeys(xml_item.track_circuits) if tc in missing_in_db]
+    if missing_in_xml:
+        missing_in_xml = [tc for tc in dict.fromkeys(db_item.track_circuits) if tc in missing_in_xml]
+    
+    for tc_name in missing_in_db:
+        differences.append(Model.Differenza(Model.TC_MANCANTE_DB, nome, 'TrackCircuit', tc_name, None))
+    for tc_name in missing_in_xml:
+        differences.append(Model.Differenza(Model.TC_MANCANTE_XML, nome, 'TrackCircuit', None, tc_name))
+
+    # 3. Confronto Switch (Normalizzazione mantenuta)
+    xml_switch = _switch_normalizzato(xml_item.switch)
+    db_switch = _switch_normalizzato(db_item.switch)
+    
+    # Confronto campo per campo (il nome dello switch è meno critico, ma lo teniamo per completezza)
+    for campo, valore_xml, valore_db in zip(_CAMPI_SWITCH, xml_switch, db_switch):
+        if valore_xml != valore_db:
+            differences.append(Model.Differenza(Model.SWITCH_DIVERSO, nome, campo, valore_xml, valore_db))
+
+    return differences
+
+def _differenze_itinerario(xml_item, db_item):
+    """Differenze tra due itinerari con lo stesso nome (tupla vuota se coincidono)."""
+    # Il confronto campo per campo serve solo se la forma di confronto
+    # (calcolata una volta per itinerario) è diversa
+    if xml_item.forma == db_item.forma:
+        return ()
+    if db_item.fingerprint is not None and db_item.fingerprint == Model.fingerprint(xml_item, Model.CODIFICA_SERVER):
+        # Stessa impronta calcolata dal DB: stessa forma canonica, quindi nessuna differenza
+        return ()
+    return tuple(_differenze(xml_item, db_item))
+
+def _confronta_blocco(coppie):
+    """Eseguito in un processo del pool: differenze di ogni coppia (itinerario XML, itinerario DB).
+
+    Le differenze tornano come tuple (tipo, campo, valore XML, valore DB), più veloci da
+    serializzare; il nome dell'itinerario lo conosce già il processo principale.
     """
-    Confronta i dati estratti dall'XML e dal DB e scrive i dettagli delle differenze.
+    return [tuple((d.tipo, d.campo, d.valore_xml, d.valore_db) for d in _differenze_itinerario(xml_item, db_item))
+            for xml_item, db_item in coppie]
+
+def _confronta_blocco_condiviso(posizioni):
+    """Come `_confronta_blocco`, sulle coppie ereditate dal processo principale (avvio con 'fork')."""
+    return _confronta_blocco([_coppie_condivise[p] for p in posizioni])
+
+def _confronta_blocco_compatto(coppie):
+    """Come `_confronta_blocco`, su coppie ridotte con `Model.compatta` (avvio con 'spawn')."""
+    return _confronta_blocco([(Model.espandi(xml_dati), Model.espandi(db_dati)) for xml_dati, db_dati in coppie])
+
+def _blocco_di(nome, n_blocchi):
+    """Blocco del confronto parallelo a cui appartiene l'itinerario (crc32: stabile tra processi ed esecuzioni)."""
+    return zlib.crc32((nome or '').encode('utf-8')) % n_blocchi
+
+def _confronta_coppie(coppie, processi, contesto=None):
+    """Differenze di ogni coppia (itinerario XML, itinerario DB), in parallelo se conviene; nell'ordine delle coppie.
+
+    `contesto` è un contesto di multiprocessing (es. multiprocessing.get_context('spawn'));
+    None = metodo di avvio predefinito della piattaforma.
     """
-    # Per evitare ogni volta di accedere all'elemento del dizionario
-    # creo delle mappe che associano il nome dell'itinerario al suo dizionario
-    xml_itine_map = {it['name']: it for it in xml_itine}
-    db_itine_map = {it['nome']: it for it in db_itine} # Assumendo che 'nome' sia la chiave DB
-    
-    ok_count = 0
-    diff_count = 0
+    global _coppie_condivise
+    if not processi or processi <= 1 or len(coppie) < 2 * MIN_ITINERARI_PER_PROCESSO:
+        return [_differenze_itinerario(xml_item, db_item) for xml_item, db_item in coppie]
+
+    processi = min(processi, len(coppie) // MIN_ITINERARI_PER_PROCESSO)
+    indici = [_blocco_di(xml_item.name, processi) for xml_item, _ in coppie]
+    blocchi = [[] for _ in range(processi)]
+    # Con 'fork' (Linux) i processi ereditano le coppie e ricevono solo le posizioni;
+    # altrimenti ('spawn') ricevono le coppie ridotte a tuple
+    condivise = (contesto or multiprocessing).get_start_method() == 'fork'
+    for posizione, (indice, (xml_item, db_item)) in enumerate(zip(indici, coppie)):
+        blocchi[indice].append(posizione if condivise else (Model.compatta(xml_item), Model.compatta(db_item)))
 
+    if condivise:
+        _coppie_condivise = coppie
+    try:
+        with ProcessPoolExecutor(max_workers=processi, mp_context=contesto) as executor:
+            funzione = _confronta_blocco_condiviso if condivise else _confronta_blocco_compatto
+            risultati = [iter(r) for r in executor.map(funzione, blocchi)]
+    finally:
+        _coppie_condivise = []
+
+    # Ogni blocco mantiene l'ordine delle coppie: si ricompone seguendo l'ordine originale
+    ricomposti = []
+    for indice, (xml_item, _) in zip(indici, coppie):
+        nome = xml_item.name
+        ricomposti.append(tuple(Model.Differenza(tipo, nome, campo, valore_xml, valore_db)
+                                for tipo, campo, valore_xml, valore_db in next(risultati[indice])))
+    return ricomposti
+
+def confronta(xml_itine, db_itine, processi=None, contesto=None):
+    """
+    Confronta i dati estratti dall'XML e dal DB senza scrivere nulla: restituisce un `Model.Esito`
+    con le differenze di ogni itinerario dell'XML (il testo lo producono i Renderer).
+
+    Con `processi` > 1 gli itinerari presenti in entrambi sono divisi in blocchi per hash del
+    nome e confrontati su un ProcessPoolExecutor (solo se ogni processo riceve almeno
+    MIN_ITINERARI_PER_PROCESSO itinerari); i risultati vengono ricomposti nell'ordine
+    dell'XML, per cui l'esito è identico a quello sequenziale. `contesto` sceglie il metodo
+    di avvio dei processi (vedi `_confronta_coppie`).
+    """
+    # Creo delle mappe che associano il nome dell'itinerario al suo `Itinerary`.
+    # Eventuali dizionari nel vecchio formato vengono convertiti qui, una sola volta,
+    # così il ciclo di confronto non deve più riconoscere la forma dei dati.
+    xml_itine_map = {it.name: it for it in map(Model.da_dizionario, xml_itine)}
+    db_itine_map = {it.name: it for it in map(Model.da_dizionario, db_itine)}
+
+    esito = Model.Esito()
+    posizioni = []  # posizione in esito.itinerari degli itinerari presenti in entrambi
+    coppie = []
     for xml_name, xml_item in xml_itine_map.items():
         
         # 1. Prima controllo i nomi degli itinerari (XML -> DB)
-        if xml_name not in db_itine_map:
-            # Qui non ci preoccupiamo della formattazione estesa dei separatori, 
-            # usiamo solo la scrittura di base come fai tu.
-            FileWriter.write_existing_file(f"• Itinerario {xml_name}\n", errorLogger)
-            FileWriter.write_existing_file("    Stato: MANCANTE (presente in XML ma assente nel DB)\n\n", errorLogger)
-            defaultLogger.warning(f"Itinerario '{xml_name}' presente in XML ma assente nel DB.")
+        db_item = db_itine_map.get(xml_name)
+        if db_item is None:
+            # Gli itinerari mancanti non sono contati né tra gli OK né tra quelli con differenze
+            esito.itinerari.append((xml_name, (Model.Differenza(Model.ITINERARIO_MANCANTE_DB, xml_name),)))
             continue
+        posizioni.append(len(esito.itinerari))
+        coppie.append((xml_item, db_item))
+        esito.itinerari.append(None)
 
-        # Ora confronto i dettagli dei vari itinerari
-        db_item = db_itine_map[xml_name]
-        differences = []
+    # Ora confronto i dettagli dei vari itinerari
+    for posizione, (xml_item, _), differences in zip(posizioni, coppie, _confronta_coppie(coppie, processi, contesto)):
+        esito.itinerari[posizione] = (xml_item.name, differences)
+        if differences:
+            esito.diff_count += 1
+        else:
+            esito.ok_count += 1
 
-        # 2. Confronto TrackCircuitList: LOGICA DI SET PER ISOLARE I MANCANTI
-        
-        # Normalizzazione dei nomi TC per XML (possono essere dict con chiave 'name' o stringhe)
-        xml_tc_raw = xml_item.get('trackCircuitList', [])
-        xml_tc_names = set(
-            (tc if isinstance(tc, str) else tc.get('name'))
-            for tc in xml_tc_raw
-            if (tc if isinstance(tc, str) else tc.get('name')) is not None
-        )
-
-        # Normalizzazione dei nomi TC per DB (possono essere dict con chiave 'cdb' o stringhe)
-        db_tc_raw = db_item.get('trackCircuits', [])
-        db_tc_names = set(
-            (tc if isinstance(tc, str) else tc.get('cdb'))
-            for tc in db_tc_raw
-            if (tc if isinstance(tc, str) else tc.get('cdb')) is not None
-        )
-
-        # Calcola le differenze
-        missing_in_db = xml_tc_names - db_tc_names # TC presenti in XML ma non nel DB
-        missing_in_xml = db_tc_names - xml_tc_names # TC presenti in DB ma non nell'XML
-        
-        if missing_in_db:
-            for tc_name in missing_in_db:
-                # Genera il messaggio specifico richiesto
-                differences.append(f"TrackCircuit {tc_name} non trovato nel DB.")
-        
-        if missing_in_xml:
-            for tc_name in missing_in_xml:
-                 # Genera un messaggio specifico per la direzione opposta
-                differences.append(f"TrackCircuit {tc_name} non trovato nell'XML.")
-        
+    return esito
 
-        # 3. Confronto Switch (Normalizzazione mantenuta)
-        def _norm(v):
-            if v is None:
-                return None
-            s = str(v).strip()
-            return s if s != '' else None
-
-        xml_switch = {
-            'SwitchMotorId': _norm(xml_item.get('SwitchMotorId')),
-            'SwitchMotorName': _norm(xml_item.get('SwitchMotorName')),
-            'SwitchMotorState': _norm(xml_item.get('SwitchMotorState')),
-        }
-        # Il DB_extractor popola la chiave 'switch' e può usare due formati:
-        # 1) {'id': ..., 'name': ..., 'state': ...}
-        # 2) {'SwitchMotorId': ..., 'SwitchMotorName': ..., 'SwitchMotorState': ...}
-        db_switch_raw = db_item.get('switch') or {}
-
-        # Rileva il formato e normalizza ai campi usati dall'XML-side
-        if 'SwitchMotorId' in db_switch_raw or 'SwitchMotorName' in db_switch_raw or 'SwitchMotorState' in db_switch_raw:
-            db_switch = {
-                'SwitchMotorId': _norm(db_switch_raw.get('SwitchMotorId')),
-                'SwitchMotorName': _norm(db_switch_raw.get('SwitchMotorName')),
-                'SwitchMotorState': _norm(db_switch_raw.get('SwitchMotorState')),
-            }
-        else:
-            db_switch = {
-                'SwitchMotorId': _norm(db_switch_raw.get('id')),
-                'SwitchMotorName': _norm(db_switch_raw.get('name')),
-                'SwitchMotorState': _norm(db_switch_raw.get('state')),
-            }
-        
-        # Confronto
-        if xml_switch['SwitchMotorId'] != db_switch['SwitchMotorId']:
-            differences.append(
-                f"SwitchMotorId non corrispondente. XML: {xml_switch['SwitchMotorId']}, DB: {db_switch['SwitchMotorId']}"
-            )
-        # Il nome dello switch è meno critico e spesso è lo stesso, ma lo teniamo per completezza
-        if xml_switch['SwitchMotorName'] != db_switch['SwitchMotorName']:
-            differences.append(
-                f"SwitchMotorName non corrispondente. XML: {xml_switch['SwitchMotorName']}, DB: {db_switch['SwitchMotorName']}"
-            )
-        if xml_switch['SwitchMotorState'] != db_switch['SwitchMotorState']:
-            differences.append(
-                f"SwitchMotorState non corrispondente. XML: {xml_switch['SwitchMotorState']}, DB: {db_switch['SwitchMotorState']}"
-            )
-        
-        # --- Scrittura nel report ---
-        FileWriter.write_existing_file(f"• Itinerario {xml_name}\n", errorLogger)
-        if not differences:
-            FileWriter.write_existing_file("    Stato: OK\n\n", errorLogger)
-            ok_count += 1
-        else:
-            FileWriter.write_existing_file("    Stato: DIFFERENZE\n", errorLogger)
-            FileWriter.write_existing_file("    Dettagli:\n", errorLogger)
-            for diff in differences:
-                # Nota: qui ho usato 5 spazi e un trattino per allineare l'output al tuo esempio
-                FileWriter.write_existing_file(f"      - {diff}\n", errorLogger) 
-                errorLogger.error(f"DIFF. Itinerario '{xml_name}': {diff}")
-            FileWriter.write_existing_file("\n", errorLogger)
-            diff_count += 1
-            
-    return ok_count, diff_count
-
-def write_summary(ok_count, diff_count, errorLogger):
+def compare_data(xml_itine, db_itine, defaultLogger, errorLogger, writer=None, processi=None, contesto=None):
+    """
+    Confronta i dati estratti dall'XML e dal DB e scrive i dettagli delle differenze.
+    Con `writer` (FileWriter.ReportWriter) le righe del report passano dal suo buffer;
+    con `processi` > 1 il confronto è parallelo (vedi `confronta`, anche per `contesto`), con lo stesso report.
+    Restituisce il `Model.Esito`, che si spacchetta come (ok_count, diff_count) e può
+    essere riusato da altri Renderer (es. Renderer.scrivi_json) senza ripetere il confronto.
+    """
+    try:
+        esito = confronta(xml_itine, db_itine, processi, contesto)
+    except Exception as e:
+        if not processi or processi <= 1:
+            raise
+        errorLogger.error(f"Errore durante il confronto parallelo, confronto sequenziale: {e}")
+        esito = confronta(xml_itine, db_itine)
+    Renderer.scrivi_report(esito, _scrittore(writer, errorLogger))
+    Renderer.registra_log(esito, defaultLogger, errorLogger)
+    return esito
+
+def write_summary(ok_count, diff_count, errorLogger, writer=None):
     """Scrive il riepilogo nel formato richiesto."""
-    FileWriter.write_existing_file(f" - OK: {ok_count}\n", errorLogger)
-    FileWriter.write_existing_file(f" - Con differenze: {diff_count}\n", errorLogger)
+    scrivi = _scrittore(writer, errorLogger)
+    scrivi(f" - OK: {ok_count}\n")
+    scrivi(f" - Con differenze: {diff_count}\n")
 
-def check_missing_itinerari(xml_items, db_items, defaultLogger, errorLogger):
-    """Verifica la presenza bidirezionale e i conteggi totali."""
-    db_map = {item['nome']: item for item in db_items}
-    xml_map = {item['name']: item for item in xml_items}
+def check_missing_itinerari(xml_items, db_items, defaultLogger, errorLogger, db_nomi=None, writer=None):
+    """Verifica la presenza bidirezionale e i conteggi totali.
+
+    Se il DB è stato estratto solo per i nomi dell'XML (`DbExtractor.get_data(nomi=...)`),
+    `db_nomi` deve contenere tutti i nomi presenti nel DB (`DbExtractor.get_nomi`); gli
+    itinerari presenti solo nel DB sono riportati nell'ordine di `db_nomi`.
+    """
+    scrivi = _scrittore(writer, errorLogger)
+    if db_nomi is None:
+        db_nomi = [item.name for item in map(Model.da_dizionario, db_items)]
+        db_count = len(db_items)
+    else:
+        db_count = len(db_nomi)
+    xml_map = {item.name: item for item in map(Model.da_dizionario, xml_items)}
 
-    FileWriter.write_existing_file("\n", errorLogger) # Riga vuota dopo l'intestazione
+    scrivi("\n") # Riga vuota dopo l'intestazione
     
     # 1. Itinerari nel DB ma non nell'XML
-    for db_name in db_map.keys():
+    for db_name in dict.fromkeys(db_nomi):
         if db_name not in xml_map:
-            FileWriter.write_existing_file(f"  - [MANCANTE] Itinerario {db_name}: presente nel DB ma assente nel XML.\n", errorLogger)
+            scrivi(f"  - [MANCANTE] Itinerario {db_name}: presente nel DB ma assente nel XML.\n")
             defaultLogger.warning(f"Itinerario '{db_name}' presente nel DB ma assente nell'XML.")
     
     # 2. Confronto conteggi totali
-    db_count = len(db_items)
     xml_count = len(xml_items)
     
     if db_count > xml_count:
-        FileWriter.write_existing_file(f"  - [WARNING] Il DB ha più itinerari ({db_count}) del XML ({xml_count})!\n", errorLogger)
+        scrivi(f"  - [WARNING] Il DB ha più itinerari ({db_count}) del XML ({xml_count})!\n")
     elif xml_count > db_count:
-        FileWriter.write_existing_file(f"  - [ERRORE] XML ha più itinerari ({xml_count}) del DB ({db_count})!\n", errorLogger)
+        scrivi(f"  - [ERRORE] XML ha più itinerari ({xml_count}) del DB ({db_count})!\n")
 
     # 3. Check sul numero atteso di itinerari
     if db_count != N_ITINERARI_ATTESI:
-        FileWriter.write_existing_file(f"  - [ANOMALIA] Numero itinerari trovati nel DB: {db_count}, aspettati: {N_ITINERARI_ATTESI}\n", errorLogger)
\ No newline at end of file
+        scrivi(f"  - [ANOMALIA] Numero itinerari trovati nel DB: {db_count}, aspettati: {N_ITINERARI_ATTESI}\n")
\ No newline at end of file
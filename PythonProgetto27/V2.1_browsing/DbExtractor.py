@@ -1,107 +1,583 @@
-import pyodbc
-import logging 
+import logging
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import groupby
+from operator import itemgetter
+import Model
+from Model import Itinerary, Switch
+import DbPool
+import DbSnapshot
+import DbSource
 
 STATE_MAP = {'R' : 2, 'N' : 1} # Mappa per convertire lo stato da stringa a intero
 
-def get_data(conn_string, defaultLogger, errorLogger):
+# Modalità di estrazione:
+# - 'merge': tre query sulle tabelle complete e merge lato Python (comportamento storico, usato anche come fallback)
+# - 'join': una sola query con JOIN lato server, ordinata per id_itine e raggruppata in streaming
+MODALITA_MERGE = 'merge'
+MODALITA_JOIN = 'join'
+
+# Estrazione da più database: connessioni contemporanee al massimo verso lo stesso server
+MAX_PER_SERVER = 2
+
+# Filtro per nome: fino a MAX_NOMI_IN_LISTA nomi si usa una lista IN parametrizzata,
+# oltre si caricano i nomi in una tabella temporanea (SQL Server ammette al massimo 2100 parametri)
+MAX_NOMI_IN_LISTA = 500
+
+# Le query contengono i segnaposto {schema} (prefisso delle tabelle, dalla sorgente: vedi DbSource)
+# e {filtro}, vuoto se si estraggono tutti gli itinerari
+QUERY_ITINERARI = "SELECT id_itine, nome FROM {schema}itinerari WHERE id_itine IS NOT NULL{filtro};"
+QUERY_NOMI = "SELECT nome FROM {schema}itinerari WHERE id_itine IS NOT NULL ORDER BY nome;"
+QUERY_BLOCCHI = "SELECT id_itine, cdb, ente, id_ente FROM {schema}tc_bloccamenti_dv_itine{filtro};"
+QUERY_SWITCH = "SELECT id_itine, id_cassa, nome, statocassa FROM {schema}tc_it_lib_dev_percorso{filtro};"
+
+# Il LEFT JOIN sugli switch replica la regola del merge: lo switch si cerca solo per i blocchi
+# con cdb != ente, su (id_itine, id_cassa = id_ente). p.id_cassa indica se la riga esiste.
+# {collazione} rende il confronto sensibile alle maiuscole come in Python, qualunque sia la
+# collation del database; statocassa non è confrontato in SQL (lo converte STATE_MAP).
+QUERY_JOIN = """
+SELECT i.id_itine, i.nome, b.cdb, b.ente, b.id_ente, p.id_cassa, p.nome, p.statocassa
+FROM {schema}itinerari AS i
+LEFT JOIN {schema}tc_bloccamenti_dv_itine AS b
+       ON b.id_itine = i.id_itine
+LEFT JOIN {schema}tc_it_lib_dev_percorso AS p
+       ON p.id_itine = b.id_itine
+      AND p.id_cassa = b.id_ente
+      AND LTRIM(RTRIM(b.cdb)){collazione} <> LTRIM(RTRIM(b.ente)){collazione}
+WHERE i.id_itine IS NOT NULL{filtro}
+ORDER BY i.id_itine;
+"""
+
+
+class _FiltroNomi:
+    """Restrizione delle query ai soli itinerari con i nomi indicati.
+
+    `elenco` è la parte destra della condizione IN: '(?, ?, ...)' con i nomi come
+    parametri, oppure la SELECT sulla tabella temporanea (senza parametri).
+    """
+    __slots__ = ('sorgente', 'elenco', 'parametri')
+
+    def __init__(self, sorgente, elenco, parametri=()):
+        self.sorgente = sorgente
+        self.elenco = elenco
+        self.parametri = tuple(parametri)
+
+    def su_nome(self, colonna):
+        """Condizione sulla colonna del nome (tabella itinerari)."""
+        return f" AND {self.sorgente.colonna_nome(colonna)} IN {self.elenco}"
+
+    def su_id_itine(self):
+        """Condizione per le tabelle collegate tramite id_itine."""
+        return (f" WHERE id_itine IN (SELECT id_itine FROM {self.sorgente.schema}itinerari"
+                f" WHERE {self.sorgente.colonna_nome('nome')} IN {self.elenco})")
+
+
+def _prepara_filtro(cursor, sorgente, nomi):
+    """Restituisce il `_FiltroNomi` per l'insieme di nomi, oppure None se `nomi` è None (nessun filtro)."""
+    if nomi is None:
+        return None
+    nomi = sorted({n.strip() for n in nomi if n})
+    if not nomi:
+        return _FiltroNomi(sorgente, "(NULL)")  # nessun nome: le query non restituiscono righe
+    if len(nomi) <= MAX_NOMI_IN_LISTA:
+        return _FiltroNomi(sorgente, "(" + ", ".join("?" * len(nomi)) + ")", nomi)
+
+    sorgente.crea_tabella_nomi(cursor)
+    sorgente.inserisci_nomi(cursor, nomi)
+    return _FiltroNomi(sorgente, f"(SELECT nome FROM {sorgente.tabella_nomi})")
+
+
+def _esegui(cursor, sorgente, query, filtro, condizione):
+    """Esegue la query applicando (se presente) il filtro sui nomi tramite `condizione(filtro)`."""
+    sql = sorgente.query(query, filtro='' if filtro is None else condizione(filtro))
+    if filtro is not None and filtro.parametri:
+        cursor.execute(sql, filtro.parametri)
+    else:
+        cursor.execute(sql)
+
+
+def _righe(cursor, dimensione_batch=None):
+    """Righe del risultato corrente.
+
+    Senza `dimensione_batch` si usa fetchall(); altrimenti le righe vengono lette a blocchi
+    con fetchmany (e cursor.arraysize impostato di conseguenza), così in memoria resta al
+    più un blocco di righe alla volta.
+    """
+    if not dimensione_batch:
+        return cursor.fetchall()
+    return _righe_a_blocchi(cursor, dimensione_batch)
+
+
+def _righe_a_blocchi(cursor, dimensione_batch):
+    cursor.arraysize = dimensione_batch
+    while True:
+        blocco = cursor.fetchmany(dimensione_batch)
+        if not blocco:
+            return
+        yield from blocco
+
+
+def _carica_itinerari(cursor, sorgente, filtro=None, dimensione_batch=None):
+    """QUERY 1: {nome: id_itine} dalla tabella itinerari."""
     db_itinerari = {}
+    _esegui(cursor, sorgente, QUERY_ITINERARI, filtro, lambda f: f.su_nome('nome'))
+    for row in _righe(cursor, dimensione_batch):  # con fetchall() ottengo una lista di tuple, ovvero tutte quelle risultanti dalla query
+        id_itine = row[0]
+        nome_itine = row[1].strip()
+        db_itinerari[nome_itine] = id_itine
+    return db_itinerari
+
+
+def _carica_blocchi(cursor, sorgente, filtro=None, dimensione_batch=None):
+    """QUERY 2: {id_itine: [(cdb, ente, id_ente), ...]} dalla tabella tc_bloccamenti_dv_itine."""
+    _esegui(cursor, sorgente, QUERY_BLOCCHI, filtro, _FiltroNomi.su_id_itine)
+    blocchi_per_itine = {}
+    intern = sys.intern
+    for id_itine_b, cdb, ente, id_ente in _righe(cursor, dimensione_batch):
+        # associo ad ogni id una lista di tuple (cdb, ente, id_ente): i nomi sono internati,
+        # così le molte righe con lo stesso cdb/ente condividono la stessa stringa
+        # usare setdefault mi permette di inizializzare la lista se la chiave non esiste
+        blocchi_per_itine.setdefault(id_itine_b, []).append((intern(cdb.strip()), intern(ente.strip()), id_ente))
+    return blocchi_per_itine
+
+
+def _carica_switch(cursor, sorgente, filtro=None, dimensione_batch=None):
+    """QUERY 3: {(id_itine, id_cassa): (nome, stato)} dalla tabella tc_it_lib_dev_percorso."""
+    _esegui(cursor, sorgente, QUERY_SWITCH, filtro, _FiltroNomi.su_id_itine)
+    percorsi_switch = {}
+    for ps_id_itine, id_cassa, nome, stato_symbol in _righe(cursor, dimensione_batch):
+        nome = sys.intern(nome.strip()) if nome else None
+        stato_symbol = stato_symbol.strip() if stato_symbol else None
+        stato = STATE_MAP.get(stato_symbol, None)
+        # Usiamo (id_itine, id_ente) come chiave; qui id_cassa funge da id_ente per il join
+        percorsi_switch[(ps_id_itine, id_cassa)] = (nome, stato)
+    return percorsi_switch
+
+
+# Tabelle lette dal merge: (nome, colonne, funzione di caricamento)
+_TABELLE = (
+    ('itinerari', ('id_itine', 'nome'), _carica_itinerari),
+    ('tc_bloccamenti_dv_itine', ('id_itine', 'cdb', 'ente', 'id_ente'), _carica_blocchi),
+    ('tc_it_lib_dev_percorso', ('id_itine', 'id_cassa', 'nome', 'statocassa'), _carica_switch),
+)
+
+
+def _merge(db_itinerari, blocchi_per_itine, percorsi_switch):
+    """Merge lato Python di blocchi e switch sugli itinerari; restituisce la lista di `Itinerary`."""
+    risultato = []
+    nessun_blocco = ()
+    for nome_itine, id_itine in db_itinerari.items():
+        track_circuits = []
+        switch = None
+        for cdb, ente, id_ente in blocchi_per_itine.get(id_itine, nessun_blocco):
+
+            # Track circuits
+            if cdb:
+                track_circuits.append(cdb)
+
+            # Switch: se cdb != ente, prova join su (id_itine, id_ente)
+            if cdb != ente:
+                percorso_data = percorsi_switch.get((id_itine, id_ente))
+                if percorso_data is not None:
+                    switch = Switch(id_ente, *percorso_data)
+
+        # Deduplica mantenendo l'ordine
+        risultato.append(Itinerary(id_itine, nome_itine, dict.fromkeys(track_circuits), switch))
+    return risultato
+
+
+def _estrai_merge(cursor, sorgente, defaultLogger, filtro=None, dimensione_batch=None):
+    """Estrazione storica: tre query sulle tabelle complete e merge lato Python."""
+    # --- QUERY 1: Recupero degli itinerari dalla tabella itinerari ---
+    defaultLogger.info("Recupero degli itinerari dal database...")
+    db_itinerari = _carica_itinerari(cursor, sorgente, filtro, dimensione_batch)
+    defaultLogger.info(f"Operazione completata con successo. Sono stati caricati: {len(db_itinerari)} itinerari.")
+
+    # --- QUERY 2 e 3: blocchi e switch ---
+    blocchi_per_itine = _carica_blocchi(cursor, sorgente, filtro, dimensione_batch)
+    percorsi_switch = _carica_switch(cursor, sorgente, filtro, dimensione_batch)
+
+    return _merge(db_itinerari, blocchi_per_itine, percorsi_switch)
+
+
+def impronte_xml(itinerari):
+    """Impronte da passare a `get_data(impronte=...)`: {nome: insieme delle impronte}.
+
+    `itinerari` è una lista di `Itinerary` oppure un dizionario plantId -> lista (come
+    restituito da `Parser.parsing` con più plant). Le impronte usano la codifica del server
+    (`Model.CODIFICA_SERVER`); un nome presente in più plant può avere più impronte.
+    """
+    liste = itinerari.values() if isinstance(itinerari, dict) else (itinerari,)
+    impronte = {}
+    for lista in liste:
+        for itinerario in map(Model.da_dizionario, lista):
+            impronte.setdefault(itinerario.name, set()).add(Model.fingerprint(itinerario, Model.CODIFICA_SERVER))
+    return impronte
+
+
+def _confronta_impronte(cursor, sorgente, defaultLogger, filtro, dimensione_batch, impronte):
+    """Legge dal DB un'impronta per itinerario e la confronta con quelle dell'XML.
+
+    Restituisce ({nome: impronta DB}, itinerari coincidenti, nomi da leggere in dettaglio).
+    Un itinerario coincide se la sua impronta è l'unica impronta XML per quel nome: per questi
+    si crea un `Itinerary` senza dettagli (solo id, nome e impronta); gli altri, compresi quelli
+    con impronta NULL, vanno letti in dettaglio.
+    """
+    defaultLogger.info("Recupero delle impronte degli itinerari dal database...")
+    _esegui(cursor, sorgente, sorgente.QUERY_FINGERPRINT, filtro, lambda f: f.su_nome('i.nome'))
+    db_impronte = {}
+    for row in _righe(cursor, dimensione_batch):
+        db_impronte[row[1].strip()] = (row[0], row[2])  # a parità di nome vale l'ultimo, come nel merge
+
+    coincidenti = []
+    da_dettagliare = set()
+    for nome, (id_itine, impronta) in db_impronte.items():
+        attese = impronte.get(nome)
+        if isinstance(attese, str):
+            attese = {attese}
+        if impronta is not None and attese == {impronta}:
+            coincidenti.append(Itinerary(id_itine, nome, fingerprint=impronta))
+        else:
+            da_dettagliare.add(nome)
+    defaultLogger.info(f"Impronte coincidenti: {len(coincidenti)} itinerari; "
+                       f"da leggere in dettaglio: {len(da_dettagliare)} itinerari.")
+    return {nome: impronta for nome, (_, impronta) in db_impronte.items()}, coincidenti, da_dettagliare
+
+
+def _carica_tabelle_con_snapshot(cursor, sorgente, defaultLogger, dimensione_batch, percorso):
+    """Dati delle tre tabelle, riletti dal DB solo per le tabelle cambiate rispetto allo snapshot locale.
+
+    Per ogni tabella si esegue la sonda della sorgente (conteggio e checksum aggregato):
+    se coincide con quella salvata si riusano i dati dello snapshot, altrimenti la tabella
+    viene riletta per intero. La sonda precede la lettura, quindi una modifica avvenuta nel
+    frattempo verrà rilevata al giro successivo.
+    """
+    try:
+        snapshot = DbSnapshot.carica(percorso)
+    except Exception as e:
+        defaultLogger.warning(f"Snapshot del DB non leggibile ({percorso}), verrà ricreato: {e}")
+        snapshot = {}
+
+    dati = []
+    ricaricate = []
+    for tabella, colonne, caricamento in _TABELLE:
+        cursor.execute(sorgente.query_sonda(tabella, colonne))
+        # fetchall legge il risultato fino in fondo: con il pool ogni query ha il suo cursore e, senza
+        # MARS, SQL Server rifiuterebbe la query successiva ("Connection is busy with results for another hstmt")
+        sonda = tuple(cursor.fetchall()[0])
+        voce = snapshot.get(tabella)
+        if voce is not None and voce[0] == sonda:
+            dati.append(voce[1])
+            continue
+        valori = caricamento(cursor, sorgente, None, dimensione_batch)
+        snapshot[tabella] = (sonda, valori)
+        dati.append(valori)
+        ricaricate.append(tabella)
+
+    if ricaricate:
+        defaultLogger.info(f"Tabelle ricaricate dal database: {', '.join(ricaricate)}.")
+        try:
+            DbSnapshot.salva(percorso, snapshot)
+        except OSError as e:
+            defaultLogger.warning(f"Impossibile salvare lo snapshot del DB ({percorso}): {e}")
+    else:
+        defaultLogger.info("Nessuna tabella modificata: uso lo snapshot locale del database.")
+    return dati
+
+
+def _estrai_snapshot(cursor, sorgente, defaultLogger, nomi, dimensione_batch, percorso):
+    """Merge sui dati dello snapshot locale; il filtro sui nomi è applicato qui, dopo il merge."""
+    db_itinerari, blocchi_per_itine, percorsi_switch = _carica_tabelle_con_snapshot(
+        cursor, sorgente, defaultLogger, dimensione_batch, percorso)
+    defaultLogger.info(f"Operazione completata con successo. Sono stati caricati: {len(db_itinerari)} itinerari.")
+    if nomi is not None:
+        richiesti = {n.strip() for n in nomi if n}
+        db_itinerari = {nome: id_itine for nome, id_itine in db_itinerari.items() if nome in richiesti}
+    return _merge(db_itinerari, blocchi_per_itine, percorsi_switch)
+
+
+@contextmanager
+def _cursore_dedicato(conn_string, sorgente, pool=None):
+    """Cursore su una nuova connessione, chiusa all'uscita, oppure su una connessione prestata da `pool`."""
+    if pool is not None:
+        voce = pool.acquisisci()
+        try:
+            yield voce.cursore
+        except BaseException:
+            pool.rilascia(voce, valida=False)
+            raise
+        pool.rilascia(voce)
+        return
+
+    conn = sorgente.connetti(conn_string)
+    try:
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+
+def _estrai_merge_parallelo(cursor, sorgente, defaultLogger, filtro, dimensione_batch, conn_string, nomi, pool=None):
+    """Come `_estrai_merge`, ma le tre query sono eseguite in contemporanea.
+
+    La query degli itinerari usa la connessione già aperta; blocchi e switch usano due
+    connessioni dedicate (prese da `pool`, se indicato), in un piccolo pool di thread
+    (pyodbc rilascia il GIL durante l'I/O). Il merge parte quando tutte e tre sono
+    terminate; eventuali errori vengono rilanciati qui e gestiti da `get_data` come
+    nel caso sequenziale. Il parallelismo è utile con SQL Server; con SQLite le query
+    restano di fatto sequenziali.
+    """
+    def su_nuova_connessione(caricamento):
+        with _cursore_dedicato(conn_string, sorgente, pool) as cursor_thread:
+            # Le tabelle temporanee sono legate alla connessione: il filtro va preparato su ognuna
+            filtro_thread = _prepara_filtro(cursor_thread, sorgente, nomi)
+            return caricamento(cursor_thread, sorgente, filtro_thread, dimensione_batch)
+
+    defaultLogger.info("Recupero degli itinerari dal database (query in parallelo)...")
+    with ThreadPoolExecutor(max_workers=2) as esecutore:
+        futuro_blocchi = esecutore.submit(su_nuova_connessione, _carica_blocchi)
+        futuro_switch = esecutore.submit(su_nuova_connessione, _carica_switch)
+        db_itinerari = _carica_itinerari(cursor, sorgente, filtro, dimensione_batch)
+        blocchi_per_itine = futuro_blocchi.result()
+        percorsi_switch = futuro_switch.result()
+    defaultLogger.info(f"Operazione completata con successo. Sono stati caricati: {len(db_itinerari)} itinerari.")
+
+    return _merge(db_itinerari, blocchi_per_itine, percorsi_switch)
+
+
+def _estrai_join(cursor, sorgente, defaultLogger, filtro=None, dimensione_batch=None):
+    """Estrazione con una sola query JOIN ordinata per id_itine.
+
+    Le righe vengono consumate in streaming e raggruppate per id_itine: in memoria resta
+    solo l'itinerario in costruzione, più la lista finale.
+    """
+    defaultLogger.info("Recupero degli itinerari dal database con query JOIN lato server...")
+    _esegui(cursor, sorgente, QUERY_JOIN, filtro, lambda f: f.su_nome('i.nome'))
+    db_itinerari = {}
+    righe_join = _righe_a_blocchi(cursor, dimensione_batch) if dimensione_batch else cursor
+    for id_itine, righe in groupby(righe_join, key=itemgetter(0)):
+        nome_itine = None
+        track_circuits = []
+        switch = None
+        for row in righe:
+            nome_itine = row[1].strip()
+            cdb, ente, id_ente = row[2], row[3], row[4]
+            if cdb is None:
+                continue  # itinerario senza blocchi (LEFT JOIN)
+            cdb = cdb.strip()
+            if cdb:
+                track_circuits.append(cdb)
+            # p.id_cassa valorizzato: esiste lo switch su (id_itine, id_ente) e cdb != ente
+            if row[5] is not None:
+                nome = row[6].strip() if row[6] else None
+                stato_symbol = row[7].strip() if row[7] else None
+                switch = Switch(id_ente, nome, STATE_MAP.get(stato_symbol, None))
+        # Stessa regola del merge: a parità di nome vale l'ultimo itinerario
+        db_itinerari[nome_itine] = Itinerary(id_itine, nome_itine, dict.fromkeys(track_circuits), switch)
+    defaultLogger.info(f"Operazione completata con successo. Sono stati caricati: {len(db_itinerari)} itinerari.")
+    return list(db_itinerari.values())
+
+
+def _con_cursore(conn_string, sorgente, defaultLogger, errorLogger, operazione, vuoto, pool=None):
+    """Apre la connessione, esegue `operazione(cursor)` e chiude sempre cursore e connessione.
+
+    Con `pool` (vedi DbPool) la connessione viene presa in prestito e poi restituita,
+    invece di essere aperta e chiusa. In caso di errore lo registra e restituisce `vuoto`.
+    """
     conn = None
     cursor = None
+    voce = None
+    riuscita = False
 
     defaultLogger.info("Connessione al database in corso...")
     try:
         # Connessione al database
-        conn = pyodbc.connect(conn_string)
-        cursor = conn.cursor()
+        if pool is None:
+            conn = sorgente.connetti(conn_string)
+            cursor = conn.cursor()
+        else:
+            voce = pool.acquisisci()
+            cursor = voce.cursore
         defaultLogger.info("Connessione al database avvenuta con successo.")
+        risultato = operazione(cursor)
+        riuscita = True
+        return risultato
 
-        # --- QUERY 1: Recupero degli itinerari dalla tabella dbo.itinerari ---
-        defaultLogger.info("Recupero degli itinerari dal database...")
-        cursor.execute("SELECT id_itine, nome FROM dbo.itinerari WHERE id_itine IS NOT NULL;")
-        for row in cursor.fetchall():  # tramite fetchall() ottengo una lista di tuple, ovvero tutte quelle risultanti dalla query
-            id_itine = row[0]
-            nome_itine = row[1].strip()
-            db_itinerari[nome_itine] = {
-                'id': id_itine,
-                'nome': nome_itine,
-                'trackCircuits': [],
-                'switch': None
-            }
-        defaultLogger.info(f"Operazione completata con successo. Sono stati caricati: {len(db_itinerari)} itinerari.")
-
-        # --- QUERY 2: Recupero delle informazioni sui vari blocchi nella tabella dbo.tc_bloccamenti_dv_itine ---
-        cursor.execute("SELECT id_itine, cdb, ente, id_ente FROM dbo.tc_bloccamenti_dv_itine;")
-        blocchi_per_itine = {}
-        for row in cursor.fetchall():
-            id_itine_b = row[0]
-            cdb = row[1].strip() 
-            ente = row[2].strip()
-            id_ente = row[3]
-            
-            # associo ad ogni id una lista di elementi (cdb, ente, id_ente)
-            # usare setdefault mi permette di inizializzare la lista se la chiave non esiste
-            blocchi_per_itine.setdefault(id_itine_b, []).append({
-                'cdb': cdb,
-                'ente': ente,
-                'id_ente': id_ente
-            })
-
-        # --- QUERY 3: Recupero info switch (tc_it_lib_dev_percorso) ---
-        cursor.execute("SELECT id_itine, id_cassa, nome, statocassa FROM dbo.tc_it_lib_dev_percorso;")
-        percorsi_switch = {}
-        for row in cursor.fetchall():
-            ps_id_itine = row[0]
-            id_cassa = row[1]
-            nome = row[2].strip() if row[2] else None
-            stato_symbol = row[3].strip() if row[3] else None
-            stato = STATE_MAP.get(stato_symbol, None)
-            # Usiamo (id_itine, id_ente) come chiave; qui id_cassa funge da id_ente per il join
-            percorsi_switch[(ps_id_itine, id_cassa)] = {'name': nome, 'state': stato}
-
-        # Merge: blocchi e switch sugli itinerari
-        for _, itine_dict in db_itinerari.items():
-            id_itine = itine_dict['id']
-            for blocco in blocchi_per_itine.get(id_itine, []):
-                
-                # Track circuits
-                cdb_name = blocco.get('cdb')
-                if cdb_name:
-                    itine_dict['trackCircuits'].append(cdb_name)
-
-                # Switch: se cdb != ente, prova join su (id_itine, id_ente)
-                if blocco.get('cdb') != blocco.get('ente'):
-                    key = (id_itine, blocco.get('id_ente'))
-                    percorso_data = percorsi_switch.get(key)
-                    if percorso_data:
-                        itine_dict['switch'] = {
-                            'SwitchMotorId': blocco.get('id_ente'),
-                            'SwitchMotorName': percorso_data.get('name'),
-                            'SwitchMotorState': percorso_data.get('state')
-                        }
-
-            # Deduplica mantenendo l'ordine
-            if itine_dict['trackCircuits']:
-                itine_dict['trackCircuits'] = list(dict.fromkeys(itine_dict['trackCircuits']))
-
-        defaultLogger.info("Recupero e merge dei dati completato con successo.")
-        return list(db_itinerari.values())
-
-    except pyodbc.Error as err:
+    except sorgente.errori as err:
         msg = err.args if getattr(err, 'args', None) else str(err)
         errorLogger.error(f"Errore durante l'accesso al database: {msg}", exc_info=True)
-        return []
+        return vuoto
     except Exception as e:
         errorLogger.error(
             f"Errore inaspettato durante l'estrazione dei dati: {type(e).__name__}: {e} | args={getattr(e, 'args', None)}",
             exc_info=True
         )
-        return []
+        return vuoto
     finally:
         try:
-            if cursor is not None:
-                cursor.close()
-            if conn is not None:
-                conn.close()
-            defaultLogger.info("Connessione al database chiusa.")
+            if voce is not None:
+                # Dopo un errore la connessione non torna nel pool
+                pool.rilascia(voce, valida=riuscita)
+                defaultLogger.info("Connessione al database restituita al pool.")
+            else:
+                if cursor is not None:
+                    cursor.close()
+                if conn is not None:
+                    conn.close()
+                defaultLogger.info("Connessione al database chiusa.")
         except Exception as close_err:
             errorLogger.error(f"Errore durante la chiusura della connessione al database: {close_err}")
+
+
+def get_data(conn_string, defaultLogger, errorLogger, modalita=MODALITA_MERGE, nomi=None, dimensione_batch=None,
+             parallelo=False, pool=None, sorgente=None, snapshot=False, cartella_snapshot=None, impronte=None):
+    """Estrae gli itinerari dal DB e restituisce una lista di `Itinerary` (lista vuota in caso di errore).
+
+    Con `modalita='join'` viene eseguita una sola query con JOIN lato server, che trasferisce
+    solo le righe utili; se la query non va a buon fine si ripiega sul merge lato Python.
+    Con `nomi` (es. i nomi degli itinerari dell'XML) l'estrazione è limitata lato server
+    agli itinerari con quei nomi; per l'elenco completo dei nomi nel DB vedi `get_nomi`.
+    Con `dimensione_batch` le righe sono lette a blocchi (fetchmany) invece che con fetchall().
+    Con `parallelo=True` le tre query del merge sono eseguite in contemporanea su connessioni separate.
+    Con `pool` (un `DbPool.PoolConnessioni`) le connessioni sono prese dal pool e riusate tra le chiamate.
+    `sorgente` è un `DbSource.SorgenteDati` (default SQL Server tramite pyodbc); con `DbSource.SQLITE`
+    `conn_string` è il percorso del file SQLite.
+    Con `snapshot=True` gli ultimi dati letti sono salvati in locale (vedi DbSnapshot, nella
+    cartella della cache o in `cartella_snapshot`) e ad ogni esecuzione si rileggono solo le
+    tabelle cambiate; in questo caso le tabelle sono lette per intero e `modalita`,
+    `parallelo` e il filtro lato server non si applicano (i nomi sono filtrati in locale).
+    Con `impronte` (vedi `impronte_xml`) il DB restituisce prima un'impronta per itinerario e i
+    dettagli (TC e switch) vengono letti solo per gli itinerari la cui impronta non coincide con
+    quella dell'XML; gli altri hanno solo id, nome e `fingerprint`, che il Comparer riconosce.
+    Se la query delle impronte non è supportata si ripiega sull'estrazione completa.
+    """
+    sorgente = sorgente or DbSource.SQL_SERVER
+
+    def operazione(cursor):
+        if snapshot:
+            percorso = DbSnapshot.percorso_snapshot(conn_string, sorgente, cartella_snapshot)
+            risultato = _estrai_snapshot(cursor, sorgente, defaultLogger, nomi, dimensione_batch, percorso)
+            defaultLogger.info("Recupero e merge dei dati completato con successo.")
+            return risultato
+
+        filtro = _prepara_filtro(cursor, sorgente, nomi)
+        if filtro is not None:
+            defaultLogger.info(f"Estrazione limitata a {len(nomi)} nomi di itinerario.")
+
+        nomi_dettaglio = nomi
+        db_impronte = {}
+        coincidenti = []
+        if impronte is not None and sorgente.QUERY_FINGERPRINT is None:
+            defaultLogger.warning(f"La sorgente '{sorgente.nome}' non calcola le impronte: leggo tutti i dettagli.")
+        elif impronte is not None:
+            try:
+                db_impronte, coincidenti, nomi_dettaglio = _confronta_impronte(
+                    cursor, sorgente, defaultLogger, filtro, dimensione_batch, impronte)
+                filtro = _prepara_filtro(cursor, sorgente, nomi_dettaglio)
+            except sorgente.errori as err:
+                defaultLogger.warning(f"Query delle impronte non riuscita ({err}): leggo tutti i dettagli.")
+            else:
+                if not nomi_dettaglio:
+                    defaultLogger.info("Recupero e merge dei dati completato con successo.")
+                    return coincidenti
+
+        risultato = None
+        if modalita == MODALITA_JOIN:
+            try:
+                risultato = _estrai_join(cursor, sorgente, defaultLogger, filtro, dimensione_batch)
+            except sorgente.errori as err:
+                defaultLogger.warning(f"Query JOIN non riuscita ({err}): uso il merge lato Python.")
+        if risultato is None and parallelo:
+            risultato = _estrai_merge_parallelo(cursor, sorgente, defaultLogger, filtro, dimensione_batch, conn_string,
+                                                 nomi_dettaglio, pool)
+        elif risultato is None:
+            risultato = _estrai_merge(cursor, sorgente, defaultLogger, filtro, dimensione_batch)
+
+        for itinerario in risultato:
+            itinerario.fingerprint = db_impronte.get(itinerario.name)
+        defaultLogger.info("Recupero e merge dei dati completato con successo.")
+        return coincidenti + risultato
+
+    return _con_cursore(conn_string, sorgente, defaultLogger, errorLogger, operazione, [], pool)
+
+
+def get_nomi(conn_string, defaultLogger, errorLogger, pool=None, sorgente=None):
+    """Restituisce la lista ordinata e senza ripetizioni dei nomi di tutti gli itinerari nel DB.
+
+    Query leggera, usata insieme a `get_data(nomi=...)` per individuare gli itinerari
+    presenti solo nel DB (vedi `Comparer.check_missing_itinerari`). In caso di errore
+    restituisce None, da non confondere con un DB senza itinerari (lista vuota).
+    """
+    sorgente = sorgente or DbSource.SQL_SERVER
+
+    def operazione(cursor):
+        cursor.execute(sorgente.query(QUERY_NOMI))
+        db_nomi = list(dict.fromkeys(row[0].strip() for row in cursor))
+        defaultLogger.info(f"Trovati {len(db_nomi)} nomi di itinerario nel database.")
+        return db_nomi
+
+    return _con_cursore(conn_string, sorgente, defaultLogger, errorLogger, operazione, None, pool)
+
+
+_RE_SERVER = re.compile(r'(?:^|;)\s*(?:SERVER|ADDRESS|ADDR)\s*=\s*([^;]*)', re.IGNORECASE)
+
+
+def server_di(conn_string):
+    """Server a cui punta la stringa di connessione (chiave SERVER=), usato per i limiti di concorrenza.
+
+    Se la chiave manca (es. file SQLite) si usa la stringa stessa.
+    """
+    m = _RE_SERVER.search(conn_string)
+    return m.group(1).strip().lower() if m else conn_string
+
+
+def get_data_multi(targets, defaultLogger, errorLogger, max_workers=None, max_per_server=MAX_PER_SERVER,
+                   con_nomi=False, opzioni_target=None, **opzioni):
+    """Estrae gli itinerari da più database in parallelo (es. uno per impianto di una linea).
+
+    `targets` è una lista di stringhe di connessione oppure un dizionario nome -> stringa di
+    connessione. Le estrazioni girano in un pool di `max_workers` thread, con al più
+    `max_per_server` connessioni contemporanee verso lo stesso server (vedi `server_di`).
+    Le `opzioni` sono passate a `get_data` per ogni database; `opzioni_target` ({target: {opzione:
+    valore}}) le sostituisce per i singoli database (es. `nomi` e `impronte` del solo plant).
+    Un `pool` di connessioni vale per un solo database e non va quindi indicato qui.
+    Restituisce {target: lista di `Itinerary`} nell'ordine dei target; come per `get_data`,
+    un database non raggiungibile viene registrato in errorLogger e ha lista vuota.
+    Con `con_nomi=True` ogni valore è la coppia (itinerari, `get_nomi`), da usare quando
+    l'estrazione è filtrata per nome: le due letture usano un pool dedicato al database e
+    quindi la stessa connessione.
+    """
+    if not isinstance(targets, dict):
+        targets = {conn_string: conn_string for conn_string in targets}
+    if not targets:
+        return {}
+    opzioni_target = opzioni_target or {}
+
+    semafori = {}
+    for conn_string in targets.values():
+        semafori.setdefault(server_di(conn_string), threading.BoundedSemaphore(max_per_server))
+
+    def estrai(nome, conn_string):
+        opzioni_db = {**opzioni, **opzioni_target.get(nome, {})}
+        with semafori[server_di(conn_string)]:
+            defaultLogger.info(f"Estrazione dal database '{nome}'...")
+            if not con_nomi:
+                return get_data(conn_string, defaultLogger, errorLogger, **opzioni_db)
+            sorgente = opzioni_db.get('sorgente')
+            with DbPool.PoolConnessioni(conn_string, sorgente=sorgente) as pool:
+                itinerari = get_data(conn_string, defaultLogger, errorLogger, pool=pool, **opzioni_db)
+                return itinerari, get_nomi(conn_string, defaultLogger, errorLogger, pool=pool, sorgente=sorgente)
+
+    with ThreadPoolExecutor(max_workers=max_workers or min(len(targets), 8)) as esecutore:
+        futuri = {nome: esecutore.submit(estrai, nome, conn_string) for nome, conn_string in targets.items()}
+        risultati = {nome: futuro.result() for nome, futuro in futuri.items()}
+
+    for nome, risultato in risultati.items():
+        defaultLogger.info(f"Database '{nome}': {len(risultato[0] if con_nomi else risultato)} itinerari.")
+    return risultati
@@ -0,0 +1,174 @@
+import threading
+import time
+
+import DbSource
+
+# --- CONFIGURAZIONE POOL ---
+MAX_CONNESSIONI = 4            # connessioni aperte al massimo (in uso + inattive)
+TIMEOUT_INATTIVITA = 300       # secondi dopo i quali una connessione inattiva viene chiusa
+TIMEOUT_ATTESA = 60            # secondi di attesa di una connessione libera prima di rinunciare
+QUERY_VERIFICA = "SELECT 1;"   # controllo della connessione al momento del prestito
+# ---------------------------
+
+
+class CursorePreparato:
+    """Cursore che mantiene un cursore pyodbc distinto per ogni testo SQL.
+
+    pyodbc riusa lo statement preparato quando un cursore riesegue lo stesso SQL:
+    tenendo un cursore per query, le estrazioni ripetute sulla stessa connessione
+    non devono preparare di nuovo le query. Espone la parte dell'interfaccia dei
+    cursori usata da DbExtractor; `close()` non chiude nulla, i cursori vengono
+    chiusi insieme alla connessione.
+    """
+    __slots__ = ('_conn', '_cursori', '_corrente', 'arraysize', 'fast_executemany')
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._cursori = {}
+        self._corrente = None
+        self.arraysize = 1
+        self.fast_executemany = False
+
+    def _cursore_per(self, sql):
+        cursor = self._cursori.get(sql)
+        if cursor is None:
+            cursor = self._cursori[sql] = self._conn.cursor()
+        self._corrente = cursor
+        return cursor
+
+    def execute(self, sql, *parametri):
+        self._cursore_per(sql).execute(sql, *parametri)
+        return self
+
+    def executemany(self, sql, parametri):
+        cursor = self._cursore_per(sql)
+        if self.fast_executemany:
+            cursor.fast_executemany = True  # solo pyodbc: i cursori sqlite3 non hanno l'attributo
+        cursor.executemany(sql, parametri)
+
+    def fetchone(self):
+        return self._corrente.fetchone()
+
+    def fetchall(self):
+        return self._corrente.fetchall()
+
+    def fetchmany(self, dimensione=None):
+        self._corrente.arraysize = self.arraysize
+        return self._corrente.fetchmany(dimensione or self.arraysize)
+
+    def __iter__(self):
+        return iter(self._corrente)
+
+    def close(self):
+        pass
+
+    def chiudi(self):
+        """Chiude tutti i cursori (da chiamare prima di chiudere la connessione)."""
+        for cursor in self._cursori.values():
+            cursor.close()
+        self._cursori.clear()
+        self._corrente = None
+
+
+class ConnessionePool:
+    """Connessione prestata dal pool, con il suo `CursorePreparato`."""
+    __slots__ = ('connessione', 'cursore', 'ultimo_uso')
+
+    def __init__(self, connessione):
+        self.connessione = connessione
+        self.cursore = CursorePreparato(connessione)
+        self.ultimo_uso = time.monotonic()
+
+    def chiudi(self):
+        try:
+            self.cursore.chiudi()
+        finally:
+            self.connessione.close()
+
+
+class PoolConnessioni:
+    """Pool di connessioni verso un database, condivisibile tra thread.
+
+    Al prestito (`acquisisci`) le connessioni inattive da più di `timeout_inattivita`
+    secondi vengono chiuse e quella scelta viene verificata con `QUERY_VERIFICA`;
+    se non risponde si passa alla successiva o se ne apre una nuova. Le connessioni
+    aperte non superano mai `max_connessioni`. `sorgente` (vedi DbSource, default SQL
+    Server) fornisce la connessione e gli errori del driver; `connetti` la sostituisce.
+    """
+
+    def __init__(self, conn_string, max_connessioni=MAX_CONNESSIONI, timeout_inattivita=TIMEOUT_INATTIVITA,
+                 timeout_attesa=TIMEOUT_ATTESA, connetti=None, sorgente=None):
+        sorgente = sorgente or DbSource.SQL_SERVER
+        self.conn_string = conn_string
+        self.timeout_inattivita = timeout_inattivita
+        self.timeout_attesa = timeout_attesa
+        self._connetti = connetti or sorgente.connetti
+        self._errori = sorgente.errori
+        self._libere = []  # connessioni inattive, la più recente in fondo
+        self._lock = threading.Lock()
+        self._posti = threading.BoundedSemaphore(max_connessioni)
+
+    def _verifica(self, voce):
+        try:
+            # fetchall legge il risultato fino in fondo: senza MARS SQL Server rifiuterebbe la query
+            # successiva (su un altro cursore) con "Connection is busy with results for another hstmt"
+            voce.cursore.execute(QUERY_VERIFICA).fetchall()
+            return True
+        except self._errori:
+            return False
+
+    def acquisisci(self):
+        """Presta una `ConnessionePool` funzionante; va restituita con `rilascia`."""
+        if not self._posti.acquire(timeout=self.timeout_attesa):
+            raise TimeoutError(f"Nessuna connessione libera nel pool dopo {self.timeout_attesa} secondi.")
+        try:
+            while True:
+                with self._lock:
+                    if not self._libere:
+                        break
+                    voce = self._libere.pop()
+                if time.monotonic() - voce.ultimo_uso > self.timeout_inattivita or not self._verifica(voce):
+                    self._scarta(voce)
+                    continue
+                return voce
+            return ConnessionePool(self._connetti(self.conn_string))
+        except BaseException:
+            self._posti.release()
+            raise
+
+    def rilascia(self, voce, valida=True):
+        """Restituisce la connessione al pool; con `valida=False` (es. dopo un errore) viene chiusa."""
+        try:
+            if valida:
+                try:
+                    # Chiude l'eventuale transazione implicita aperta dalle SELECT
+                    voce.connessione.rollback()
+                except self._errori:
+                    valida = False
+            if valida:
+                voce.ultimo_uso = time.monotonic()
+                with self._lock:
+                    self._libere.append(voce)
+            else:
+                self._scarta(voce)
+        finally:
+            self._posti.release()
+
+    def _scarta(self, voce):
+        try:
+            voce.chiudi()
+        except self._errori:
+            pass
+
+    def chiudi(self):
+        """Chiude tutte le connessioni inattive."""
+        with self._lock:
+            libere, self._libere = self._libere, []
+        for voce in libere:
+            self._scarta(voce)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.chiudi()
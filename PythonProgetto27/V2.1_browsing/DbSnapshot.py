@@ -0,0 +1,38 @@
+import hashlib
+import os
+import pickle
+
+import ParserCache
+
+# --- CONFIGURAZIONE SNAPSHOT ---
+SNAPSHOT_FORMAT_VERSION = 2   # da incrementare se cambia la forma dei dati salvati
+PREFISSO = "db_"              # i file stanno nella cartella della cache del Parser: Cache/db_<chiave>.snap
+ESTENSIONE = ".snap"          # diversa da ParserCache.ESTENSIONE: ParserCache.pulisci non elimina gli snapshot
+# -------------------------------
+
+
+def percorso_snapshot(conn_string, sorgente, cartella=None):
+    """File dello snapshot per il database indicato (la stringa di connessione non compare nel nome)."""
+    cartella = cartella or ParserCache.cartella_cache()
+    chiave = hashlib.sha256(f"{sorgente.nome}\n{conn_string}".encode("utf-8")).hexdigest()[:32]
+    return os.path.join(cartella, PREFISSO + chiave + ESTENSIONE)
+
+
+def carica(percorso):
+    """Restituisce {tabella: (sonda, dati)} salvato in `percorso`; dizionario vuoto se manca o ha un altro formato."""
+    if not os.path.exists(percorso):
+        return {}
+    with open(percorso, "rb") as f:
+        dati = pickle.load(f)
+    if dati.get("formato") != SNAPSHOT_FORMAT_VERSION:
+        return {}
+    return dati["tabelle"]
+
+
+def salva(percorso, tabelle):
+    """Salva lo snapshot in modo atomico (file temporaneo + rename)."""
+    os.makedirs(os.path.dirname(percorso) or ".", exist_ok=True)
+    temporaneo = f"{percorso}.{os.getpid()}.tmp"
+    with open(temporaneo, "wb") as f:
+        pickle.dump({"formato": SNAPSHOT_FORMAT_VERSION, "tabelle": tabelle}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporaneo, percorso)
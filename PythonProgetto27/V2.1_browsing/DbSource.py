@@ -0,0 +1,267 @@
+from abc import ABC, abstractmethod
+import hashlib
+import sqlite3
+import zlib
+
+try:
+    import pyodbc
+except ImportError:  # driver ODBC non installato: resta disponibile la sorgente SQLite
+    pyodbc = None
+
+
+class SorgenteDati(ABC):
+    """Sorgente dei dati per DbExtractor: connessione e differenze di dialetto SQL.
+
+    Le query di DbExtractor sono scritte una volta sola con il segnaposto {schema};
+    la sorgente fornisce il prefisso delle tabelle, gli errori del driver, la colonna
+    usata per confrontare i nomi e la tabella temporanea dei nomi dell'XML.
+    """
+    nome = None
+    schema = ''               # prefisso delle tabelle, es. 'dbo.'
+    tabella_nomi = 'nomi_xml'  # tabella temporanea per il filtro sui nomi
+    collazione_binaria = ''    # segnaposto {collazione}: confronto byte per byte (maiuscole distinte), come in Python;
+                               # vuoto se le espressioni si confrontano già così (in SQLite LTRIM/RTRIM danno BINARY)
+
+    @property
+    @abstractmethod
+    def errori(self):
+        """Tupla delle eccezioni del driver, da usare in `except`."""
+
+    @abstractmethod
+    def connetti(self, conn_string):
+        """Apre una connessione DB-API verso `conn_string`."""
+
+    def query(self, modello, **valori):
+        """Sostituisce {schema}, {collazione} (e gli altri segnaposto indicati) nel testo della query."""
+        return modello.format(schema=self.schema, collazione=self.collazione_binaria, **valori)
+
+    def colonna_nome(self, colonna):
+        """Espressione SQL con cui confrontare il nome dell'itinerario con i nomi dell'XML.
+
+        I nomi dell'XML arrivano già senza spazi ai bordi (strip in DbExtractor), quindi
+        anche il nome del DB va ripulito, come nelle altre query (LTRIM/RTRIM).
+        """
+        return f"LTRIM(RTRIM({colonna}))"
+
+    @abstractmethod
+    def crea_tabella_nomi(self, cursor):
+        """Crea (vuota) la tabella temporanea `tabella_nomi` sulla connessione del cursore."""
+
+    def inserisci_nomi(self, cursor, nomi):
+        cursor.executemany(f"INSERT INTO {self.tabella_nomi} (nome) VALUES (?);", [(n,) for n in nomi])
+
+    @abstractmethod
+    def query_sonda(self, tabella, colonne):
+        """Query economica che restituisce una riga che cambia quando cambia il contenuto della tabella."""
+
+    # Query (id_itine, nome, impronta) con l'impronta di ogni itinerario calcolata lato server:
+    # SHA-256 in UTF-16LE della stessa forma canonica di Model.forma_canonica. L'impronta è NULL
+    # se l'itinerario ha più switch candidati (il merge ne sceglierebbe uno in base all'ordine
+    # delle righe): in quel caso l'itinerario va letto in dettaglio. Segnaposto: {schema}, {filtro}.
+    # LTRIM/RTRIM tolgono solo gli spazi, mentre Model.normalizza_valore usa strip() (anche tab e
+    # a capo): con altri caratteri di spaziatura ai bordi l'impronta del DB non coincide e
+    # l'itinerario viene letto e confrontato in dettaglio, quindi la differenza non nasconde errori.
+    # None = impronte non supportate dalla sorgente (DbExtractor legge tutti i dettagli).
+    QUERY_FINGERPRINT = None
+
+
+class SorgenteSqlServer(SorgenteDati):
+    """Database SQL Server tramite pyodbc (tabelle nello schema dbo)."""
+    nome = 'sqlserver'
+    schema = 'dbo.'
+    tabella_nomi = '#nomi_xml'
+    collazione_binaria = ' COLLATE Latin1_General_BIN2'  # la collation del database è di solito case-insensitive
+
+    QUERY_CREA_TABELLA_NOMI = """
+IF OBJECT_ID('tempdb..#nomi_xml') IS NOT NULL DROP TABLE #nomi_xml;
+CREATE TABLE #nomi_xml (nome NVARCHAR(255) COLLATE DATABASE_DEFAULT PRIMARY KEY);
+"""
+
+    @property
+    def errori(self):
+        return (pyodbc.Error,) if pyodbc is not None else ()
+
+    def connetti(self, conn_string):
+        if pyodbc is None:
+            raise ImportError("pyodbc non è installato: la sorgente SQL Server non è disponibile.")
+        return pyodbc.connect(conn_string)
+
+    def crea_tabella_nomi(self, cursor):
+        cursor.execute(self.QUERY_CREA_TABELLA_NOMI)
+
+    def inserisci_nomi(self, cursor, nomi):
+        cursor.fast_executemany = True
+        super().inserisci_nomi(cursor, nomi)
+
+    # STRING_AGG richiede SQL Server 2017; l'ordinamento BIN2 coincide con sorted() di Python
+    QUERY_FINGERPRINT = """
+WITH tc AS (
+    SELECT DISTINCT id_itine, CAST(LTRIM(RTRIM(cdb)) AS NVARCHAR(4000)) COLLATE Latin1_General_BIN2 AS cdb
+    FROM {schema}tc_bloccamenti_dv_itine
+    WHERE LTRIM(RTRIM(cdb)) <> N''
+),
+tc_agg AS (
+    SELECT id_itine, STRING_AGG(CAST(cdb AS NVARCHAR(MAX)), NCHAR(30)) WITHIN GROUP (ORDER BY cdb) AS tcs
+    FROM tc
+    GROUP BY id_itine
+),
+sw AS (
+    SELECT b.id_itine, COUNT(*) AS n,
+           MAX(CAST(b.id_ente AS NVARCHAR(40))) AS motor_id,
+           MAX(COALESCE(LTRIM(RTRIM(p.nome)), N'')) AS motor_name,
+           MAX(CASE LTRIM(RTRIM(p.statocassa)) COLLATE Latin1_General_BIN2
+                   WHEN 'R' THEN N'2' WHEN 'N' THEN N'1' ELSE N'' END) AS motor_state
+    FROM {schema}tc_bloccamenti_dv_itine AS b
+    JOIN {schema}tc_it_lib_dev_percorso AS p
+      ON p.id_itine = b.id_itine AND p.id_cassa = b.id_ente
+    WHERE LTRIM(RTRIM(b.cdb)) COLLATE Latin1_General_BIN2 <> LTRIM(RTRIM(b.ente)) COLLATE Latin1_General_BIN2
+    GROUP BY b.id_itine
+)
+SELECT i.id_itine, i.nome,
+       CASE WHEN COALESCE(sw.n, 0) > 1 THEN NULL
+            ELSE LOWER(CONVERT(VARCHAR(64), HASHBYTES('SHA2_256',
+                 CAST(LTRIM(RTRIM(i.nome)) AS NVARCHAR(MAX)) + NCHAR(31) + COALESCE(tc_agg.tcs, N'')
+                 + NCHAR(31) + COALESCE(sw.motor_id, N'') + NCHAR(31) + COALESCE(sw.motor_name, N'')
+                 + NCHAR(31) + COALESCE(sw.motor_state, N'')), 2))
+       END
+FROM {schema}itinerari AS i
+LEFT JOIN tc_agg ON tc_agg.id_itine = i.id_itine
+LEFT JOIN sw ON sw.id_itine = i.id_itine
+WHERE i.id_itine IS NOT NULL{filtro};
+"""
+
+    def query_sonda(self, tabella, colonne):
+        # CHECKSUM_AGG può non rilevare modifiche che si compensano: insieme al conteggio
+        # è comunque una sonda sufficiente per decidere se ricaricare la tabella
+        return f"SELECT COUNT_BIG(*), CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM {self.schema}{tabella};"
+
+
+def _checksum_riga(*valori):
+    return zlib.crc32(repr(valori).encode("utf-8"))
+
+
+class _ChecksumAgg:
+    """Aggregato XOR dei checksum di riga, come CHECKSUM_AGG di SQL Server."""
+
+    def __init__(self):
+        self.valore = 0
+
+    def step(self, checksum):
+        if checksum is not None:
+            self.valore ^= checksum
+
+    def finalize(self):
+        return self.valore
+
+
+def _sha256_utf16(testo):
+    return None if testo is None else hashlib.sha256(testo.encode("utf-16-le")).hexdigest()
+
+
+class _ConcatOrdinato:
+    """Concatenazione ordinata con il separatore dei TC (group_concat non garantisce l'ordine)."""
+
+    def __init__(self):
+        self.valori = []
+
+    def step(self, valore):
+        self.valori.append(valore)
+
+    def finalize(self):
+        return "\x1e".join(sorted(self.valori))
+
+
+class SorgenteSqlite(SorgenteDati):
+    """Database SQLite con le stesse tre tabelle di dbo, per test e benchmark senza SQL Server.
+
+    `conn_string` è il percorso del file.
+    """
+    nome = 'sqlite'
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS itinerari (id_itine INTEGER, nome TEXT);",
+        "CREATE TABLE IF NOT EXISTS tc_bloccamenti_dv_itine (id_itine INTEGER, cdb TEXT, ente TEXT, id_ente INTEGER);",
+        "CREATE TABLE IF NOT EXISTS tc_it_lib_dev_percorso (id_itine INTEGER, id_cassa INTEGER, nome TEXT, statocassa TEXT);",
+        "CREATE INDEX IF NOT EXISTS ix_bloccamenti_itine ON tc_bloccamenti_dv_itine (id_itine);",
+        "CREATE INDEX IF NOT EXISTS ix_percorso_itine ON tc_it_lib_dev_percorso (id_itine, id_cassa);",
+    )
+
+    @property
+    def errori(self):
+        return (sqlite3.Error,)
+
+    def connetti(self, conn_string):
+        # Le connessioni possono passare tra thread (query parallele, pool)
+        conn = sqlite3.connect(conn_string, check_same_thread=False)
+        # Equivalenti delle funzioni di SQL Server usate dalla sonda degli snapshot
+        conn.create_function("BINARY_CHECKSUM", -1, _checksum_riga, deterministic=True)
+        conn.create_aggregate("CHECKSUM_AGG", 1, _ChecksumAgg)
+        # Equivalenti di HASHBYTES su NVARCHAR e di STRING_AGG ... WITHIN GROUP, per le impronte
+        conn.create_function("SHA256_UTF16", 1, _sha256_utf16, deterministic=True)
+        conn.create_aggregate("CONCAT_ORDINATO", 1, _ConcatOrdinato)
+        return conn
+
+    def crea_tabella_nomi(self, cursor):
+        cursor.execute("DROP TABLE IF EXISTS temp.nomi_xml;")
+        cursor.execute("CREATE TEMP TABLE nomi_xml (nome TEXT PRIMARY KEY);")
+
+    QUERY_FINGERPRINT = """
+WITH tc AS (
+    SELECT DISTINCT id_itine, LTRIM(RTRIM(cdb)) AS cdb
+    FROM {schema}tc_bloccamenti_dv_itine
+    WHERE LTRIM(RTRIM(cdb)) <> ''
+),
+tc_agg AS (
+    SELECT id_itine, CONCAT_ORDINATO(cdb) AS tcs
+    FROM tc
+    GROUP BY id_itine
+),
+sw AS (
+    SELECT b.id_itine, COUNT(*) AS n,
+           MAX(CAST(b.id_ente AS TEXT)) AS motor_id,
+           MAX(COALESCE(LTRIM(RTRIM(p.nome)), '')) AS motor_name,
+           MAX(CASE LTRIM(RTRIM(p.statocassa)) WHEN 'R' THEN '2' WHEN 'N' THEN '1' ELSE '' END) AS motor_state
+    FROM {schema}tc_bloccamenti_dv_itine AS b
+    JOIN {schema}tc_it_lib_dev_percorso AS p
+      ON p.id_itine = b.id_itine AND p.id_cassa = b.id_ente
+    WHERE LTRIM(RTRIM(b.cdb)) <> LTRIM(RTRIM(b.ente))
+    GROUP BY b.id_itine
+)
+SELECT i.id_itine, i.nome,
+       CASE WHEN COALESCE(sw.n, 0) > 1 THEN NULL
+            ELSE SHA256_UTF16(
+                 LTRIM(RTRIM(i.nome)) || char(31) || COALESCE(tc_agg.tcs, '')
+                 || char(31) || COALESCE(sw.motor_id, '') || char(31) || COALESCE(sw.motor_name, '')
+                 || char(31) || COALESCE(sw.motor_state, ''))
+       END
+FROM {schema}itinerari AS i
+LEFT JOIN tc_agg ON tc_agg.id_itine = i.id_itine
+LEFT JOIN sw ON sw.id_itine = i.id_itine
+WHERE i.id_itine IS NOT NULL{filtro};
+"""
+
+    def query_sonda(self, tabella, colonne):
+        return f"SELECT COUNT(*), CHECKSUM_AGG(BINARY_CHECKSUM({', '.join(colonne)})) FROM {tabella};"
+
+    def crea_schema(self, conn):
+        """Crea le tre tabelle (se mancano) nel database aperto con `conn`."""
+        for istruzione in self.SCHEMA:
+            conn.execute(istruzione)
+        conn.commit()
+
+    def popola(self, conn, itinerari=(), blocchi=(), switch=()):
+        """Inserisce le righe nelle tabelle, con le stesse colonne lette da DbExtractor.
+
+        itinerari: (id_itine, nome); blocchi: (id_itine, cdb, ente, id_ente);
+        switch: (id_itine, id_cassa, nome, statocassa).
+        """
+        conn.executemany("INSERT INTO itinerari (id_itine, nome) VALUES (?, ?);", itinerari)
+        conn.executemany("INSERT INTO tc_bloccamenti_dv_itine (id_itine, cdb, ente, id_ente) VALUES (?, ?, ?, ?);", blocchi)
+        conn.executemany("INSERT INTO tc_it_lib_dev_percorso (id_itine, id_cassa, nome, statocassa) VALUES (?, ?, ?, ?);", switch)
+        conn.commit()
+
+
+SQL_SERVER = SorgenteSqlServer()
+SQLITE = SorgenteSqlite()
+
+SORGENTI = {s.nome: s for s in (SQL_SERVER, SQLITE)}
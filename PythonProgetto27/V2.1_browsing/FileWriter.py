@@ -1,8 +1,16 @@
 import os
+import time
 from datetime import datetime
 import Logger
 import sys
 
+# --- CONFIGURAZIONE SCRITTURA REPORT ---
+DIMENSIONE_BUFFER = 64 * 1024  # caratteri accumulati prima di scrivere su disco
+INTERVALLO_FLUSH = 5.0         # secondi massimi tra due scritture su disco (il report resta leggibile durante il run)
+# --------------------------------------
+
+_writer_attivo = None  # ReportWriter aperto con `with`: write_existing_file scrive lì
+
 
 def _report_path():
     base = Logger.get_output_dir()
@@ -40,11 +48,106 @@ def file_create(defaultLogger=None, errorLogger=None):
         raise
 
 
+class ReportWriter:
+    """
+    Scrittura bufferizzata di Report.txt: il file resta aperto per tutta l'esecuzione
+    e le righe vengono scritte su disco ogni DIMENSIONE_BUFFER caratteri o INTERVALLO_FLUSH secondi.
+
+    Usato con `with`, mentre è aperto anche write_existing_file scrive attraverso di lui:
+        with FileWriter.ReportWriter(errorLogger=errorLogger) as report:
+            Comparer.compare_data(..., writer=report)
+    """
+
+    def __init__(self, percorso=None, errorLogger=None, defaultLogger=None,
+                 dimensione_buffer=DIMENSIONE_BUFFER, intervallo_flush=INTERVALLO_FLUSH):
+        self.percorso = percorso
+        self.errorLogger = errorLogger
+        self.defaultLogger = defaultLogger
+        self.dimensione_buffer = dimensione_buffer
+        self.intervallo_flush = intervallo_flush
+        self._file = None
+        self._buffer = []
+        self._caratteri = 0
+        self._ultimo_flush = 0.0
+        self._precedente = None
+
+    def apri(self):
+        """Apre il report in append (creandolo con l'intestazione se non esiste)."""
+        if self.defaultLogger is None:
+            self.defaultLogger = Logger.get_default_logger()
+        if self.errorLogger is None:
+            self.errorLogger = Logger.get_error_logger()
+        if self.percorso is None:
+            self.percorso = _report_path()
+            if not os.path.exists(self.percorso):
+                self.errorLogger.error("Il file Report.txt non esiste... Tentativo di creazione in corso.")
+                file_create(self.defaultLogger, self.errorLogger)
+        try:
+            self._file = open(self.percorso, "a", encoding='utf-8')
+        except Exception as e:
+            self.errorLogger.error(f"Errore durante l'apertura del file Report.txt: {e}")
+            raise
+        self._ultimo_flush = time.monotonic()
+        return self
+
+    def write(self, line: str):
+        """Aggiunge una riga (come write_existing_file, il ritorno a capo finale è aggiunto qui)."""
+        self._buffer.append(line)
+        self._buffer.append("\n")
+        self._caratteri += len(line) + 1
+        if self._caratteri >= self.dimensione_buffer or time.monotonic() - self._ultimo_flush >= self.intervallo_flush:
+            self.flush()
+
+    def flush(self):
+        """Scrive su disco le righe accumulate."""
+        if self._buffer:
+            try:
+                self._file.write("".join(self._buffer))
+                self._file.flush()
+            except Exception as e:
+                self.errorLogger.error(f"Errore durante la scrittura nel file Report.txt: {e}")
+                raise
+            self._buffer.clear()
+            self._caratteri = 0
+        self._ultimo_flush = time.monotonic()
+
+    def chiudi(self):
+        """Scrive le righe rimaste e chiude il file."""
+        if self._file is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        global _writer_attivo
+        self.apri()
+        self._precedente, _writer_attivo = _writer_attivo, self
+        return self
+
+    def __exit__(self, *exc):
+        global _writer_attivo
+        _writer_attivo = self._precedente
+        self.chiudi()
+
+
+def writer_attivo():
+    """ReportWriter attualmente aperto con `with`, oppure None."""
+    return _writer_attivo
+
+
 def write_existing_file(line: str, errorLogger=None, defaultLogger=None):
     """
     Appende una riga a Report.txt nella cartella di output.
-    Se il file non esiste tenta di crearlo usando i logger disponibili.
+    Se è aperto un ReportWriter la riga passa dal suo buffer; altrimenti il file viene
+    aperto e chiuso a ogni chiamata e, se non esiste, si tenta di crearlo usando i logger disponibili.
     """
+    if _writer_attivo is not None:
+        _writer_attivo.write(line)
+        return
+
     if defaultLogger is None:
         defaultLogger = Logger.get_default_logger()
     if errorLogger is None:
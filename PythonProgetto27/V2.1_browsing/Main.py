@@ -2,7 +2,11 @@ import FileWriter
 import Parser
 import Logger
 import Comparer
+import Renderer
 import DbExtractor
+import DbPool
+import TcIndex
+import XmlDiff
 import datetime
 import os
 
@@ -11,58 +15,189 @@ from utils.file_dialog import choose_xml_file, choose_output_directory
 
 # --- CONFIGURAZIONE ---
 CONNECTION_STRING = "DRIVER={ODBC Driver 17 for SQL Server};SERVER=localhost\\SQLEXPRESS;DATABASE=Stroncone_TC_2102_01;Trusted_Connection=Yes;Encrypt=Yes;TrustServerCertificate=Yes;"
+DB_TARGETS = None  # un database per plantId, estratti in parallelo, es. {'164': CONNECTION_STRING, ...}; None = solo CONNECTION_STRING
+DB_MAX_PER_SERVER = DbExtractor.MAX_PER_SERVER  # con DB_TARGETS: estrazioni contemporanee al massimo sullo stesso server
 REPORT_PATH = ""
+CONFRONTO_PROCESSI = None  # processi per il confronto XML/DB (None o 1 = sequenziale); il report non cambia
+REPORT_JSON = False  # salva anche le differenze in formato strutturato (Differenze_<plantId>.json nella cartella di output)
+REPORT_TC_MANCANTI = False  # per ogni TC non trovato nel DB elenca tutti gli itinerari del plant che lo attraversano
+PARSING_STREAMING = True  # lettura incrementale dell'XML (memoria costante)
+XML_SORGENTI = None  # lista di file o glob (es. 'Input/*.xml') da analizzare in parallelo; None = scelta interattiva
+XML_DA_STDIN = False  # legge l'XML dallo standard input (es. export in pipe dagli strumenti di archivio), senza dialog
+PLANT_IDS = {'164'}  # plantId da verificare (insieme, oppure 'all'); l'XML viene letto una sola volta
+USA_CACHE_PARSER = True  # riusa il parsing salvato se ITINERARI.xml non è cambiato (False per forzare il parsing)
+SOLO_ITINERARI_MODIFICATI = False  # confronta col DB solo gli itinerari aggiunti/modificati rispetto all'export precedente
+PARSER_PROIEZIONE = None  # campi aggiuntivi da estrarre, es. Parser.Proiezione(['direction', 'speed'], ['PointList'])
+PARSER_BACKEND = None  # 'etree', 'iterparse', 'expat' o 'lxml'; None = scelta in base a PARSING_STREAMING (vedi utils/benchmark_parser.py)
+DB_MODALITA = DbExtractor.MODALITA_JOIN  # 'join' = una query JOIN lato server, 'merge' = tre query e merge in Python
+DB_FILTRA_PER_NOMI_XML = True  # estrae dal DB solo gli itinerari con i nomi presenti nell'XML
+DB_DIMENSIONE_BATCH = 5000  # righe lette per fetchmany (memoria limitata al blocco); None = fetchall
+DB_QUERY_PARALLELE = False  # in modalità 'merge' esegue le tre query in parallelo su connessioni separate
+DB_USA_POOL = True  # riusa le connessioni (e le query preparate) tra le estrazioni dello stesso processo
+DB_USA_SNAPSHOT = False  # copia locale delle tabelle: si rileggono solo quelle cambiate (sonda COUNT + CHECKSUM_AGG)
+DB_CONFRONTO_IMPRONTE = True  # impronte calcolate dal DB: dettagli trasferiti solo per gli itinerari diversi (SQL Server 2017+)
 # ----------------------
 
-# Setup iniziale della cartella e dei logger
-output_path = choose_output_directory(initial_dir=os.getcwd())
-loggers = Logger.setup_directory_and_logger(output_path)
-defaultLogger = loggers[0]
-errorLogger = loggers[1]
-
-if not output_path:
-    errorLogger.error("Nessuna directory di output selezionata. Uscita dal programma.")
-    raise SystemExit(1)
-
-# --- SCRITTURA INTESTAZIONE REPORT INIZIALE ---
-# Questa funzione sovrascrive il file e aggiunge l'intestazione
-FileWriter.file_create(defaultLogger, errorLogger)
-
-# Parsing del file XML
-xml_path = choose_xml_file(initial_dir=os.getcwd())
-if not xml_path or not os.path.isfile(xml_path):
-    errorLogger.error("Nessun file XML selezionato o il percorso non è valido. Uscita dal programma.")
-    raise SystemExit(1)
-
-listaItinerari = Parser.parsing(xml_path, defaultLogger, errorLogger)
-defaultLogger.info(f"Trovati {len(listaItinerari)} itinerari con plantId '164' nel file XML.")
-
-# Estrazione dati dal DB
-db_itinerari = DbExtractor.get_data(CONNECTION_STRING, defaultLogger, errorLogger)
-defaultLogger.info(f"Trovati {len(db_itinerari)} itinerari nel database.")
-
-
-# --- CONFRONTO E STAMPA RISULTATI ---
-if db_itinerari:
-    defaultLogger.info("Inizio confronto tra XML e database...")
-    
-    # 1. Intestazione 'Confronto itinerari'
-    FileWriter.write_existing_file("\n=== CONFRONTO ITINERARI ===", errorLogger)
-    
-    # 2. Esegui il confronto principale
-    ok_count, diff_count = Comparer.compare_data(listaItinerari, db_itinerari, defaultLogger, errorLogger)
-
-    # 3. Scrivi il riepilogo
-    FileWriter.write_existing_file("\n=== RIEPILOGO ITINERARI ===", errorLogger)
-    Comparer.write_summary(ok_count, diff_count, errorLogger)
-
-    # 4. Esegui le verifiche aggiuntive
-    FileWriter.write_existing_file("\n=== VERIFICHE AGGIUNTIVE ===", errorLogger)
-    Comparer.check_missing_itinerari(listaItinerari, db_itinerari, defaultLogger, errorLogger)
-
-    defaultLogger.info("Confronto completato con successo.")
-else:
-    errorLogger.error("Il confronto non è stato eseguito a causa di errori di connessione al database.")
-
-# Alla fine il root logger stampa un messaggio di completamento su console
-Logger.termination_message()
\ No newline at end of file
+def main():
+    # Setup iniziale della cartella e dei logger
+    output_path = choose_output_directory(initial_dir=os.getcwd())
+    loggers = Logger.setup_directory_and_logger(output_path)
+    defaultLogger = loggers[0]
+    errorLogger = loggers[1]
+
+    if not output_path:
+        errorLogger.error("Nessuna directory di output selezionata. Uscita dal programma.")
+        raise SystemExit(1)
+
+    # --- SCRITTURA INTESTAZIONE REPORT INIZIALE ---
+    # Questa funzione sovrascrive il file e aggiunge l'intestazione
+    FileWriter.file_create(defaultLogger, errorLogger)
+
+    # Parsing del file XML (oppure di più file in parallelo se XML_SORGENTI è configurato)
+    if XML_SORGENTI:
+        itinerari_per_plant = Parser.parsing_multi(XML_SORGENTI, defaultLogger, errorLogger, streaming=PARSING_STREAMING,
+                                                   backend=PARSER_BACKEND, plant_ids=PLANT_IDS, usa_cache=USA_CACHE_PARSER,
+                                                   proiezione=PARSER_PROIEZIONE)
+    else:
+        xml_path = Parser.STDIN if XML_DA_STDIN else choose_xml_file(initial_dir=os.getcwd())
+        if not xml_path or (xml_path != Parser.STDIN and not os.path.isfile(xml_path)):
+            errorLogger.error("Nessun file XML selezionato o il percorso non è valido. Uscita dal programma.")
+            raise SystemExit(1)
+
+        itinerari_per_plant = Parser.parsing(xml_path, defaultLogger, errorLogger, streaming=PARSING_STREAMING,
+                                             backend=PARSER_BACKEND, plant_ids=PLANT_IDS, usa_cache=USA_CACHE_PARSER,
+                                             proiezione=PARSER_PROIEZIONE)
+    for plant_id, listaItinerari in itinerari_per_plant.items():
+        defaultLogger.info(f"Trovati {len(listaItinerari)} itinerari con plantId '{plant_id}' nel file XML.")
+
+    # Impronte degli itinerari: confronto con l'export precedente (salvate nella cartella di output)
+    percorso_fingerprints = os.path.join(output_path, XmlDiff.FINGERPRINT_FILE_NAME)
+    # Le impronte vengono salvate solo a confronto col DB riuscito (vedi sotto)
+    differenze_xml = XmlDiff.diff_export(itinerari_per_plant, percorso_fingerprints, defaultLogger, errorLogger,
+                                         aggiorna=False)
+    itinerari_da_confrontare = itinerari_per_plant
+    if SOLO_ITINERARI_MODIFICATI and differenze_xml is not None:
+        itinerari_da_confrontare = XmlDiff.filtra_cambiati(itinerari_per_plant, differenze_xml)
+
+    # Estrazione dati dal DB
+    # Con DB_TARGETS (plantId -> stringa di connessione) ogni database è confrontato solo con gli
+    # itinerari del suo plant; l'unico database di CONNECTION_STRING li contiene tutti
+    if DB_TARGETS:
+        for plant_id in DB_TARGETS.keys() - itinerari_per_plant.keys():
+            errorLogger.error(f"Il plantId '{plant_id}' di DB_TARGETS non è presente tra quelli letti dall'XML.")
+        for plant_id in itinerari_per_plant.keys() - DB_TARGETS.keys():
+            errorLogger.error(f"Nessun database configurato in DB_TARGETS per il plantId '{plant_id}': plant non verificato.")
+        plant_per_target = {plant_id: [plant_id] for plant_id in DB_TARGETS if plant_id in itinerari_per_plant}
+    else:
+        plant_per_target = {None: list(itinerari_per_plant)}
+
+    # Nomi (filtro dell'estrazione) e impronte degli itinerari da confrontare con ogni database
+    opzioni_target = {}
+    for target, plant_ids in plant_per_target.items():
+        da_confrontare = [it for plant_id in plant_ids for it in itinerari_da_confrontare[plant_id]]
+        opzioni_target[target] = {
+            'nomi': {it.name for it in da_confrontare} if DB_FILTRA_PER_NOMI_XML else None,
+            'impronte': DbExtractor.impronte_xml(da_confrontare) if DB_CONFRONTO_IMPRONTE else None,
+        }
+
+    if DB_TARGETS:
+        # Un database per impianto: estrazioni in parallelo, il tempo è quello del database più lento
+        db_per_target = DbExtractor.get_data_multi({plant_id: DB_TARGETS[plant_id] for plant_id in plant_per_target},
+                                                   defaultLogger, errorLogger, max_per_server=DB_MAX_PER_SERVER,
+                                                   con_nomi=DB_FILTRA_PER_NOMI_XML, opzioni_target=opzioni_target,
+                                                   modalita=DB_MODALITA, dimensione_batch=DB_DIMENSIONE_BATCH,
+                                                   parallelo=DB_QUERY_PARALLELE, snapshot=DB_USA_SNAPSHOT)
+        if not DB_FILTRA_PER_NOMI_XML:
+            db_per_target = {nome: (itinerari, None) for nome, itinerari in db_per_target.items()}
+    else:
+        nomi_xml = opzioni_target[None]['nomi']
+        pool_db = DbPool.PoolConnessioni(CONNECTION_STRING) if DB_USA_POOL else None
+        db_nomi = None
+        db_itinerari = DbExtractor.get_data(CONNECTION_STRING, defaultLogger, errorLogger, modalita=DB_MODALITA, nomi=nomi_xml,
+                                            dimensione_batch=DB_DIMENSIONE_BATCH, parallelo=DB_QUERY_PARALLELE, pool=pool_db,
+                                            snapshot=DB_USA_SNAPSHOT, impronte=opzioni_target[None]['impronte'])
+        defaultLogger.info(f"Trovati {len(db_itinerari)} itinerari nel database.")
+        if nomi_xml is not None:
+            # Elenco completo dei nomi nel DB, per gli itinerari presenti solo nel DB
+            db_nomi = DbExtractor.get_nomi(CONNECTION_STRING, defaultLogger, errorLogger, pool=pool_db)
+        if pool_db is not None:
+            pool_db.chiudi()
+        db_per_target = {None: (db_itinerari, db_nomi)}
+
+
+    # --- CONFRONTO E STAMPA RISULTATI ---
+    # Report.txt resta aperto (scrittura bufferizzata) per tutto il confronto
+    # Con plant senza database le impronte non vanno aggiornate (quei plant non sono stati verificati)
+    confronto_riuscito = all(any(plant_id in plant_ids for plant_ids in plant_per_target.values())
+                             for plant_id in itinerari_per_plant)
+    with FileWriter.ReportWriter(errorLogger=errorLogger, defaultLogger=defaultLogger) as report:
+        for target, (db_itinerari, db_nomi) in db_per_target.items():
+            plant_ids = plant_per_target[target]
+            nomi_xml = opzioni_target[target]['nomi']
+
+            # Con più database ogni blocco del report è preceduto dal plantId del database
+            if target is not None:
+                report.write(f"\n##### DATABASE {target} #####")
+
+            if nomi_xml is None:
+                db_letto = bool(db_itinerari)
+            else:
+                # db_nomi None = elenco dei nomi non letto; nomi in comune ma nessun itinerario = estrazione fallita
+                db_letto = db_nomi is not None and (bool(db_itinerari) or nomi_xml.isdisjoint(db_nomi))
+
+            if db_letto:
+                # Il confronto viene ripetuto per ogni plant del database, senza rileggere l'XML
+                for plant_id in plant_ids:
+                    defaultLogger.info(f"Inizio confronto tra XML e database per il plantId '{plant_id}'...")
+
+                    # Con più plant ogni blocco del report è preceduto dal plantId
+                    if len(plant_ids) > 1:
+                        report.write(f"\n##### PLANT {plant_id} #####")
+
+                    # 1. Intestazione 'Confronto itinerari'
+                    report.write("\n=== CONFRONTO ITINERARI ===")
+
+                    # 2. Esegui il confronto principale
+                    esito = Comparer.compare_data(itinerari_da_confrontare[plant_id], db_itinerari, defaultLogger, errorLogger,
+                                                  writer=report, processi=CONFRONTO_PROCESSI)
+                    ok_count, diff_count = esito
+                    if REPORT_JSON:
+                        Renderer.scrivi_json(esito, os.path.join(output_path, f"Differenze_{plant_id}.json"))
+
+                    # 3. Scrivi il riepilogo
+                    report.write("\n=== RIEPILOGO ITINERARI ===")
+                    Comparer.write_summary(ok_count, diff_count, errorLogger, writer=report)
+
+                    # Impatto dei TC mancanti sulla rete: indice per TC di tutti gli itinerari del plant
+                    if REPORT_TC_MANCANTI:
+                        report.write("\n=== TRACK CIRCUIT MANCANTI NEL DB ===")
+                        Renderer.scrivi_tc_mancanti(esito, TcIndex.IndiceTc(itinerari_per_plant[plant_id]), report.write)
+
+                # 4. Esegui le verifiche aggiuntive, una sola volta per database: gli itinerari solo nel DB
+                # e i conteggi vanno valutati sull'unione dei plant, non su ogni plant separatamente
+                if len(plant_ids) > 1:
+                    report.write(f"\n##### PLANT {', '.join(plant_ids)} #####")
+                report.write("\n=== VERIFICHE AGGIUNTIVE ===")
+                itinerari_xml = [it for plant_id in plant_ids for it in itinerari_per_plant[plant_id]]
+                Comparer.check_missing_itinerari(itinerari_xml, db_itinerari, defaultLogger, errorLogger, db_nomi=db_nomi,
+                                                 writer=report)
+
+                defaultLogger.info("Confronto completato con successo.")
+            else:
+                errorLogger.error("Il confronto non è stato eseguito a causa di errori di connessione al database.")
+                confronto_riuscito = False
+
+    # Con un confronto mancato le impronte precedenti restano: al prossimo avvio le modifiche vanno riverificate
+    if confronto_riuscito:
+        XmlDiff.aggiorna_fingerprints(itinerari_per_plant, percorso_fingerprints, defaultLogger, errorLogger)
+    else:
+        defaultLogger.warning("Impronte dell'export non aggiornate: il confronto col database non è stato completato.")
+
+    # Alla fine il root logger stampa un messaggio di completamento su console
+    Logger.termination_message()
+
+
+# Con il metodo spawn (Windows) i processi del confronto e del parsing reimportano questo modulo:
+# lo script va eseguito solo nel processo principale
+if __name__ == "__main__":
+    main()
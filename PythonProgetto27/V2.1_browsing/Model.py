@@ -0,0 +1,304 @@
+import hashlib
+import sys
+
+# Separatori usati nella forma canonica (caratteri di controllo, non presenti nei nomi)
+_SEP_CAMPI = "\x1f"
+_SEP_TC = "\x1e"
+
+# Codifica con cui il DB calcola le impronte lato server (HASHBYTES su NVARCHAR in SQL Server)
+CODIFICA_SERVER = "utf-16-le"
+
+
+def _intern(valore):
+    """sys.intern per le stringhe, gli altri valori (None, interi) restano invariati."""
+    return sys.intern(valore) if type(valore) is str else valore
+
+
+class Switch:
+    """Switch (cassa di manovra) associato a un itinerario.
+
+    I valori sono quelli letti dalla sorgente, senza conversioni: stringhe per l'XML,
+    id_ente intero e stato mappato (STATE_MAP) per il DB.
+    """
+    __slots__ = ('motor_id', 'motor_name', 'motor_state')
+
+    # Chiavi dei vecchi dizionari -> attributi (compatibilità con il codice che usa sw['...'])
+    _CHIAVI = {
+        'SwitchMotorId': 'motor_id', 'SwitchMotorName': 'motor_name', 'SwitchMotorState': 'motor_state',
+        'id': 'motor_id', 'name': 'motor_name', 'state': 'motor_state',
+    }
+
+    def __init__(self, motor_id=None, motor_name=None, motor_state=None):
+        self.motor_id = _intern(motor_id)
+        self.motor_name = _intern(motor_name)
+        self.motor_state = _intern(motor_state)
+
+    def __getitem__(self, chiave):
+        return getattr(self, self._CHIAVI[chiave])
+
+    def get(self, chiave, default=None):
+        attributo = self._CHIAVI.get(chiave)
+        return default if attributo is None else getattr(self, attributo)
+
+    def __eq__(self, altro):
+        if not isinstance(altro, Switch):
+            return NotImplemented
+        return (self.motor_id, self.motor_name, self.motor_state) == \
+            (altro.motor_id, altro.motor_name, altro.motor_state)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Switch({self.motor_id!r}, {self.motor_name!r}, {self.motor_state!r})"
+
+    def __reduce__(self):
+        # Serializzazione compatta (cache del Parser, processi del confronto parallelo):
+        # quella predefinita degli oggetti con __slots__ è molto più lenta
+        return Switch, (self.motor_id, self.motor_name, self.motor_state)
+
+
+class Itinerary:
+    """Itinerario prodotto sia da Parser (XML) sia da DbExtractor (DB).
+
+    `id` mantiene il significato dei vecchi dizionari: plantId per l'XML, id_itine per il DB.
+    I track circuit sono una tupla di nomi internati; `switch` è uno `Switch` oppure None.
+    `extra` contiene i campi aggiuntivi richiesti con una proiezione del Parser (None se assente).
+    `fingerprint` è l'impronta calcolata dal DB (codifica CODIFICA_SERVER), se richiesta a DbExtractor.
+    `forma` è la forma di confronto (vedi `forma_confronto`), calcolata al primo uso e poi riusata.
+    """
+    __slots__ = ('id', 'name', 'track_circuits', 'switch', 'source_file', 'group_name', 'extra', 'fingerprint', '_forma')
+    _CAMPI = __slots__[:-1]  # campi confrontati da __eq__ (esclusa la forma in cache)
+
+    # Chiavi dei vecchi dizionari (XML e DB) -> attributi
+    _CHIAVI = {
+        'id': 'id', 'name': 'name', 'nome': 'name',
+        'trackCircuitList': 'track_circuits', 'trackCircuits': 'track_circuits',
+        'switch': 'switch', 'sourceFile': 'source_file', 'groupName': 'group_name',
+    }
+    _CHIAVI_SWITCH = ('SwitchMotorId', 'SwitchMotorName', 'SwitchMotorState')
+
+    def __init__(self, id=None, name=None, track_circuits=(), switch=None, source_file=None, group_name=None,
+                 extra=None, fingerprint=None):
+        self.id = _intern(id)
+        self.name = _intern(name)
+        self.track_circuits = tuple(_intern(tc) for tc in track_circuits)
+        self.switch = switch
+        self.source_file = source_file
+        self.group_name = _intern(group_name)
+        self.extra = extra
+        self.fingerprint = fingerprint
+        self._forma = None
+
+    @property
+    def forma(self):
+        forma = self._forma
+        if forma is None:
+            forma = self._forma = forma_confronto(self)
+        return forma
+
+    def __getitem__(self, chiave):
+        if chiave in self._CHIAVI_SWITCH:
+            # Formato piatto dell'XML: SwitchMotorId/Name/State direttamente sull'itinerario
+            return None if self.switch is None else self.switch[chiave]
+        attributo = self._CHIAVI.get(chiave)
+        if attributo is None:
+            # Campi aggiuntivi della proiezione (es. 'direction', 'PointList')
+            if self.extra is None:
+                raise KeyError(chiave)
+            return self.extra[chiave]
+        return getattr(self, attributo)
+
+    def get(self, chiave, default=None):
+        try:
+            return self[chiave]
+        except KeyError:
+            return default
+
+    def __eq__(self, altro):
+        if not isinstance(altro, Itinerary):
+            return NotImplemented
+        return all(getattr(self, a) == getattr(altro, a) for a in self._CAMPI)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Itinerary({self.id!r}, {self.name!r}, {self.track_circuits!r}, {self.switch!r})"
+
+    def __reduce__(self):
+        # Come per Switch; la forma di confronto già calcolata viene conservata
+        return espandi, (compatta(self),)
+
+
+# Chiavi con cui `Itinerary[...]` legge i propri campi: un campo aggiuntivo (extra) con lo
+# stesso nome non sarebbe mai raggiungibile
+CHIAVI_ITINERARIO = frozenset(Itinerary._CHIAVI).union(Itinerary._CHIAVI_SWITCH)
+
+
+def compatta(itinerario):
+    """Campi di un `Itinerary` come tupla di valori semplici (switch compreso), molto più veloce
+    da serializzare degli oggetti (es. per inviarla ai processi del confronto parallelo).
+    `espandi` ricostruisce l'itinerario.
+    """
+    switch = itinerario.switch
+    if switch is not None:
+        switch = (switch.motor_id, switch.motor_name, switch.motor_state)
+    return (itinerario.id, itinerario.name, itinerario.track_circuits, switch, itinerario.source_file,
+            itinerario.group_name, itinerario.extra, itinerario.fingerprint, itinerario._forma)
+
+
+def espandi(dati):
+    """Ricostruisce un `Itinerary` da `compatta`, senza ripetere le conversioni del costruttore."""
+    itinerario = Itinerary.__new__(Itinerary)
+    (itinerario.id, itinerario.name, itinerario.track_circuits, switch, itinerario.source_file,
+     itinerario.group_name, itinerario.extra, itinerario.fingerprint, itinerario._forma) = dati
+    if switch is not None:
+        switch = Switch.__new__(Switch)
+        switch.motor_id, switch.motor_name, switch.motor_state = dati[3]
+    itinerario.switch = switch
+    return itinerario
+
+
+def _nome_tc(tc, chiave):
+    return tc if isinstance(tc, str) else tc.get(chiave)
+
+
+def da_dizionario(dati):
+    """Converte un itinerario nel vecchio formato a dizionario (XML o DB) in `Itinerary`.
+
+    Formato XML: 'name', 'trackCircuitList' (stringhe o dict con 'name'), SwitchMotorId/Name/State.
+    Formato DB: 'nome', 'trackCircuits' (stringhe o dict con 'cdb'), 'switch' come dict con
+    chiavi SwitchMotorId/Name/State oppure id/name/state.
+    Gli oggetti già di tipo `Itinerary` vengono restituiti così come sono.
+    """
+    if isinstance(dati, Itinerary):
+        return dati
+
+    if 'nome' in dati and 'name' not in dati:
+        track_circuits = [_nome_tc(tc, 'cdb') for tc in dati.get('trackCircuits') or []]
+        switch_raw = dati.get('switch') or {}
+        if any(k in switch_raw for k in Itinerary._CHIAVI_SWITCH):
+            valori = tuple(switch_raw.get(k) for k in Itinerary._CHIAVI_SWITCH)
+        else:
+            valori = (switch_raw.get('id'), switch_raw.get('name'), switch_raw.get('state'))
+        nome = dati.get('nome')
+    else:
+        track_circuits = [_nome_tc(tc, 'name') for tc in dati.get('trackCircuitList') or []]
+        valori = tuple(dati.get(k) for k in Itinerary._CHIAVI_SWITCH)
+        nome = dati.get('name')
+
+    return Itinerary(
+        id=dati.get('id'),
+        name=nome,
+        track_circuits=track_circuits,
+        switch=Switch(*valori) if any(v is not None for v in valori) else None,
+        source_file=dati.get('sourceFile'),
+        group_name=dati.get('groupName'),
+    )
+
+
+def normalizza_valore(v):
+    """Normalizza un valore per il confronto: stringa senza spazi ai bordi, None se vuoto."""
+    if v is None:
+        return None
+    s = str(v).strip()
+    return s if s != '' else None
+
+
+def forma_confronto(itinerario):
+    """Forma normalizzata usata dal Comparer: insieme ordinato dei TC e switch normalizzato, senza il nome.
+
+    Rispecchia le regole del Comparer (i TC sono confrontati come insieme, lo switch
+    con i valori normalizzati), per cui due itinerari con la stessa forma non hanno
+    differenze al confronto, qualunque sia la loro sorgente. È una stringa (non tracciata
+    dal garbage collector): per gli `Itinerary` conviene l'attributo `forma`, calcolato una sola volta.
+    """
+    tcs = sorted({tc for tc in itinerario.track_circuits if tc is not None})
+    switch = itinerario.switch
+    if switch is None:
+        valori_switch = ('', '', '')
+    else:
+        valori_switch = tuple(normalizza_valore(v) or '' for v in (switch.motor_id, switch.motor_name, switch.motor_state))
+    return _SEP_CAMPI.join((_SEP_TC.join(tcs),) + valori_switch)
+
+
+def forma_canonica(itinerario):
+    """Forma canonica di un itinerario: nome seguito dalla forma di confronto (`forma_confronto`)."""
+    return _SEP_CAMPI.join((itinerario.name or '', itinerario.forma))
+
+
+def fingerprint(itinerario, codifica='utf-8'):
+    """Impronta stabile (SHA-256 esadecimale) della forma canonica dell'itinerario.
+
+    Con `codifica=CODIFICA_SERVER` si ottiene la stessa impronta calcolata lato DB da DbExtractor.
+    """
+    return hashlib.sha256(forma_canonica(itinerario).encode(codifica)).hexdigest()
+
+
+# Tipi di differenza prodotti dal Comparer (vedi `Differenza`)
+ITINERARIO_MANCANTE_DB = 'itinerario_mancante_db'  # itinerario presente nell'XML ma assente nel DB
+TC_MANCANTE_DB = 'tc_mancante_db'                  # TrackCircuit dell'XML non trovato nel DB
+TC_MANCANTE_XML = 'tc_mancante_xml'                # TrackCircuit del DB non trovato nell'XML
+SWITCH_DIVERSO = 'switch_diverso'                  # campo dello switch (SwitchMotorId/Name/State) diverso
+
+
+class Differenza:
+    """Differenza trovata dal Comparer su un itinerario.
+
+    `campo` è 'TrackCircuit' o il campo dello switch ('SwitchMotorId', ...), None per un
+    itinerario mancante; i valori sono quelli normalizzati usati nel confronto. Il testo
+    per report e log viene prodotto solo dai Renderer.
+    """
+    __slots__ = ('tipo', 'itinerario', 'campo', 'valore_xml', 'valore_db')
+
+    def __init__(self, tipo, itinerario, campo=None, valore_xml=None, valore_db=None):
+        self.tipo = tipo
+        self.itinerario = itinerario
+        self.campo = campo
+        self.valore_xml = valore_xml
+        self.valore_db = valore_db
+
+    def __eq__(self, altro):
+        if not isinstance(altro, Differenza):
+            return NotImplemented
+        return all(getattr(self, a) == getattr(altro, a) for a in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return (f"Differenza({self.tipo!r}, {self.itinerario!r}, {self.campo!r}, "
+                f"{self.valore_xml!r}, {self.valore_db!r})")
+
+
+class Esito:
+    """Risultato di `Comparer.compare_data`.
+
+    `itinerari` è la lista (nome, tupla di `Differenza`) nell'ordine dell'XML: tupla vuota
+    se l'itinerario è OK, una sola differenza ITINERARIO_MANCANTE_DB se manca nel DB.
+    Si spacchetta come la vecchia coppia: `ok_count, diff_count = esito`.
+    """
+    __slots__ = ('itinerari', 'ok_count', 'diff_count')
+
+    def __init__(self, itinerari=None, ok_count=0, diff_count=0):
+        self.itinerari = [] if itinerari is None else itinerari
+        self.ok_count = ok_count
+        self.diff_count = diff_count
+
+    @property
+    def differenze(self):
+        """Tutte le differenze, nell'ordine degli itinerari."""
+        return [d for _, differenze in self.itinerari for d in differenze]
+
+    def __iter__(self):
+        return iter((self.ok_count, self.diff_count))
+
+    def __eq__(self, altro):
+        if isinstance(altro, tuple):
+            return (self.ok_count, self.diff_count) == altro
+        if not isinstance(altro, Esito):
+            return NotImplemented
+        return all(getattr(self, a) == getattr(altro, a) for a in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Esito(ok={self.ok_count}, differenze={self.diff_count}, itinerari={len(self.itinerari)})"
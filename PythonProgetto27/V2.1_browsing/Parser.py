@@ -1,76 +1,700 @@
 
+import bz2
+import contextlib
+import glob
+import gzip
+import io
+import logging
+import lzma
+import os
+import sys
 import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from xml.parsers import expat
 import Logger
+import ParserCache
+import Model
+from Model import Itinerary, Switch
 
+# lxml è opzionale: se non è installato il relativo backend non è disponibile
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
 
-def parsing(xml_path=None, defaultLogger=None, errorLogger=None):
-    """Analizza l'XML fornito e restituisce una lista di itinerari per plantId '164'.
+PLANT_ID_DEFAULT = '164'
+TUTTI_I_PLANT = 'all'
 
-    La firma mette `xml_path` come primo argomento per permettere di chiamare
-    `Parser.parsing()` nei test senza passare argomenti. Se i logger non vengono
-    forniti, vengono ottenuti dal modulo `Logger`.
+BACKEND_DEFAULT = 'etree'
+BACKEND_STREAMING = 'iterparse'
+
+# Dimensione dei blocchi letti dal file per il backend expat
+EXPAT_CHUNK_SIZE = 64 * 1024
+
+# Sorgente speciale: legge l'XML dallo standard input
+STDIN = '-'
+
+# Firme (magic bytes) dei formati compressi riconosciuti -> classe per la decompressione in streaming
+_FORMATI_COMPRESSI = (
+    (b'\x1f\x8b', lambda f: gzip.GzipFile(fileobj=f, mode='rb')),
+    (b'BZh', bz2.BZ2File),
+    (b'\xfd7zXZ\x00', lzma.LZMAFile),
+)
+
+# Errori che indicano un file XML illeggibile o mal formattato, per qualunque backend
+# (EOFError e LZMAError arrivano da archivi compressi troncati o corrotti)
+_ERRORI_XML = (ET.ParseError, expat.ExpatError, OSError, EOFError, lzma.LZMAError)
+if lxml_etree is not None:
+    _ERRORI_XML += (lxml_etree.XMLSyntaxError,)
+
+
+# Lunghezza della firma più lunga (xz)
+_LUNGHEZZA_FIRMA = max(len(firma) for firma, _ in _FORMATI_COMPRESSI)
+
+
+class _FlussoConIntestazione(io.RawIOBase):
+    """Flusso che restituisce prima i byte dell'intestazione già letti e poi il resto di `flusso`."""
+
+    def __init__(self, intestazione, flusso):
+        self.intestazione = intestazione
+        self.flusso = flusso
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.intestazione:
+            dati, self.intestazione = self.intestazione[:len(buffer)], self.intestazione[len(buffer):]
+        else:
+            dati = self.flusso.read1(len(buffer))
+        buffer[:len(dati)] = dati
+        return len(dati)
+
+
+def _leggi_intestazione(grezzo):
+    """Primi byte della sorgente (meno solo se il contenuto è più corto) e il flusso da cui proseguire la lettura."""
+    intestazione = grezzo.peek(_LUNGHEZZA_FIRMA)[:_LUNGHEZZA_FIRMA]
+    if len(intestazione) == _LUNGHEZZA_FIRMA:
+        return intestazione, grezzo
+    # peek fa al più una lettura: da una pipe possono arrivare meno byte della firma.
+    # read(n) invece aspetta n byte o la fine del flusso; i byte letti vengono rimessi in testa.
+    intestazione = grezzo.read(_LUNGHEZZA_FIRMA)
+    return intestazione, io.BufferedReader(_FlussoConIntestazione(intestazione, grezzo))
+
+
+@contextlib.contextmanager
+def apri_sorgente(xml_path):
+    """Apre la sorgente XML in binario, decomprimendola al volo se necessario.
+
+    `xml_path` può essere un percorso oppure '-' per leggere dallo standard input.
+    La compressione (gzip, bzip2, xz) viene riconosciuta dai primi byte, non
+    dall'estensione, e il contenuto viene decompresso in streaming senza file temporanei.
+    """
+    if xml_path == STDIN:
+        grezzo, chiudi = sys.stdin.buffer, False
+    else:
+        grezzo, chiudi = open(xml_path, 'rb'), True
+    try:
+        intestazione, flusso = _leggi_intestazione(grezzo)
+        for firma, decompressore in _FORMATI_COMPRESSI:
+            if intestazione.startswith(firma):
+                with decompressore(flusso) as decompresso:
+                    yield decompresso
+                break
+        else:
+            yield flusso
+    finally:
+        if chiudi:
+            grezzo.close()
+
+
+class Proiezione:
+    """Campi aggiuntivi da estrarre da ogni 'IXLItem', oltre a nome, plantId, TC e switch.
+
+    `attributi`: attributi dell'IXLItem da copiare (es. 'direction', 'speed', 'signalId',
+    'startPointId', 'endPointId'); se mancanti valgono None.
+    `liste`: figli diretti dell'IXLItem da estrarre per intero (es. 'PointList', 'NodeList',
+    'Plants'); ognuno diventa una lista di dizionari, uno per elemento figlio, con i suoi
+    attributi, i figli raggruppati per tag e l'eventuale testo sotto la chiave '#text'.
+    I valori estratti finiscono in `Itinerary.extra`; i nomi già usati dai campi di base
+    (`Model.CHIAVI_ITINERARIO`, es. 'name') sono rifiutati con ValueError.
+
+    L'oggetto è già il piano di estrazione usato dai backend: viene costruito una volta
+    e tutti i figli non elencati vengono ignorati.
+    """
+    __slots__ = ('attributi', 'liste')
+
+    def __init__(self, attributi=(), liste=()):
+        self.attributi = tuple(dict.fromkeys(attributi))
+        self.liste = frozenset(liste)
+        riservati = Model.CHIAVI_ITINERARIO.intersection(self.liste.union(self.attributi))
+        if riservati:
+            raise ValueError(f"Campi della proiezione già usati dall'itinerario: {sorted(riservati)}")
+
+    def parametri(self):
+        """Rappresentazione serializzabile, usata come parte della chiave della cache."""
+        return {"attributi": sorted(self.attributi), "liste": sorted(self.liste)}
+
+
+def _piano(proiezione):
+    """Piano di estrazione: None se la proiezione non aggiunge campi (percorso veloce di sempre)."""
+    if proiezione is None or (not proiezione.attributi and not proiezione.liste):
+        return None
+    return proiezione
+
+
+def _elemento_in_dict(elem):
+    """Converte un elemento (e i suoi discendenti) in dizionario: attributi, figli per tag, testo in '#text'."""
+    dati = dict(elem.attrib)
+    # In lxml anche commenti e processing instruction sono figli: il loro tag non è una stringa
+    figli = [figlio for figlio in elem if isinstance(figlio.tag, str)]
+    for figlio in figli:
+        dati.setdefault(figlio.tag, []).append(_elemento_in_dict(figlio))
+    if not figli:
+        testo = (elem.text or '').strip()
+        if testo:
+            dati['#text'] = testo
+    return dati
+
+
+def _estrai_extra(itinerario, piano):
+    """Campi aggiuntivi richiesti dal piano; per le liste vale la prima occorrenza, se assenti sono vuote."""
+    extra = {nome: itinerario.get(nome) for nome in piano.attributi}
+    for figlio in itinerario:
+        if figlio.tag in piano.liste and figlio.tag not in extra:
+            extra[figlio.tag] = [_elemento_in_dict(e) for e in figlio if isinstance(e.tag, str)]
+    for nome in piano.liste:
+        extra.setdefault(nome, [])
+    return extra
+
+
+def _estrai_itinerario(itinerario, piano=None):
+    """Costruisce l'`Itinerary` a partire dal suo elemento 'IXLItem'.
+
+    Funziona sia con gli elementi di `xml.etree.ElementTree` sia con quelli di `lxml`.
+    Con un piano di estrazione (vedi `Proiezione`) vengono estratti anche i campi aggiuntivi.
+    """
+    # Prossimo nodo a cui accedere: 'TrackCircuitList' - Ci interessano solo i nomi dei vari trackCircuit
+    track_circuits = ()
+    trackCircuitList = itinerario.find('TrackCircuitList')
+    if trackCircuitList is not None:
+        track_circuits = [trackCircuit.get('name') for trackCircuit in trackCircuitList.findall('TrackCircuit')]
+
+    # Prossimo nodo a cui accedere: Switch - protezione contro elementi mancanti
+    switch_element = None
+    point_list = itinerario.find('PointList')
+    if point_list is not None:
+        first_point = point_list.find('Point')
+        if first_point is not None:
+            switch_element = first_point.find('Switch')
+
+    switch = None
+    if switch_element is not None:
+        switch = Switch(
+            switch_element.get('switchMotorId'),
+            switch_element.get('switchMotorName'),
+            switch_element.get('switchMotorState'),
+        )
+
+    extra = None if piano is None else _estrai_extra(itinerario, piano)
+    return Itinerary(itinerario.get('plantId'), itinerario.get('name'), track_circuits, switch, extra=extra)
+
+
+def _normalizza_plant_ids(plant_ids):
+    """Converte `plant_ids` nel filtro usato dai backend: un frozenset di stringhe, o None per tutti i plant."""
+    if plant_ids is None:
+        return frozenset((PLANT_ID_DEFAULT,))
+    if plant_ids == TUTTI_I_PLANT:
+        return None
+    if isinstance(plant_ids, (str, int)):
+        plant_ids = (plant_ids,)
+    return frozenset(str(p) for p in plant_ids)
+
+
+def _descrivi_plant(piante):
+    if piante is None:
+        return "tutti i plantId"
+    return "plantId " + ", ".join(f"'{p}'" for p in sorted(piante))
+
+
+def itinerario_da_frammento(frammento, proiezione=None):
+    """Costruisce l'`Itinerary` da un frammento XML (bytes o str) che contiene un solo elemento 'IXLItem'.
+
+    Usato per le letture puntuali tramite l'indice di `XmlIndex`.
+    """
+    return _estrai_itinerario(ET.fromstring(frammento), _piano(proiezione))
+
+
+# --- BACKEND ---
+# Ogni backend è un generatore che riceve il percorso (o un file aperto in binario), il
+# filtro sui plant (frozenset di plantId, o None per tutti) e il piano di estrazione (None
+# per i soli campi di base) e restituisce gli itinerari selezionati (`Itinerary`), nell'ordine del file.
+# Gli errori di lettura/sintassi vengono propagati al chiamante.
+
+def _itinerari_da_radice(root, piante, piano):
+    """Itinerari dei plant richiesti di un albero già caricato in memoria."""
+    for itinerario in root.findall('./IXLItemList/IXLItem'):
+        # Accedo all'attributo 'plantId' con .get()
+        if piante is None or itinerario.get('plantId') in piante:
+            yield _estrai_itinerario(itinerario, piano)
+
+
+def _itinerari_da_eventi(eventi, piante, piano):
+    """Itinerari dei plant richiesti a partire da una sequenza di eventi ('start'/'end', elemento).
+
+    Ogni 'IXLItem' viene convertito appena arriva il suo tag di chiusura, dopodiché
+    l'elemento e i suoi fratelli già letti vengono rimossi dall'albero: la memoria
+    occupata resta costante qualunque sia la dimensione del file.
+    """
+    # Pila degli elementi aperti: percorso[0] è la radice, percorso[1] il figlio diretto, ecc.
+    percorso = []
+    for evento, elem in eventi:
+        if evento == 'start':
+            percorso.append(elem)
+            continue
+
+        percorso.pop()
+        profondita = len(percorso)
+
+        # Stesso percorso di root.findall('./IXLItemList/IXLItem')
+        if profondita == 2 and elem.tag == 'IXLItem' and percorso[1].tag == 'IXLItemList':
+            if piante is None or elem.get('plantId') in piante:
+                yield _estrai_itinerario(elem, piano)
+            # Libero l'elemento appena letto e tutti i fratelli precedenti
+            elem.clear()
+            del percorso[1][:]
+        elif profondita == 1:
+            # Fine di un figlio diretto della radice (IXLItemList, versioneGraphConsole, ...)
+            elem.clear()
+            del percorso[0][:]
+
+
+def _backend_etree(sorgente, piante, piano):
+    """Backend storico: carica l'intero albero con `ET.parse`."""
+    return _itinerari_da_radice(ET.parse(sorgente).getroot(), piante, piano)
+
+
+def _backend_iterparse(sorgente, piante, piano):
+    """Backend streaming basato su `ET.iterparse`, a memoria costante."""
+    return _itinerari_da_eventi(ET.iterparse(sorgente, events=('start', 'end')), piante, piano)
+
+
+def _backend_lxml(sorgente, piante, piano):
+    """Backend streaming basato su `lxml.etree.iterparse` (richiede lxml)."""
+    return _itinerari_da_eventi(lxml_etree.iterparse(sorgente, events=('start', 'end')), piante, piano)
+
+
+class _GestoreExpat:
+    """Callback per pyexpat: costruisce gli itinerari senza creare alcun elemento.
+
+    Reagisce solo ai tag di apertura che servono (IXLItem, TrackCircuitList/TrackCircuit,
+    PointList/Point/Switch) e replica la semantica di `_estrai_itinerario`: viene
+    considerata solo la prima 'TrackCircuitList', e lo switch è il primo 'Switch'
+    del primo 'Point' della prima 'PointList'. Con un piano di estrazione raccoglie
+    anche gli attributi e le liste richieste, ignorando tutti gli altri sottoalberi.
+    """
+
+    def __init__(self, piante, piano=None):
+        self.piante = piante    # frozenset dei plantId richiesti, None per tutti
+        self.piano = piano      # piano di estrazione (Proiezione) oppure None
+        self.extra = None
+        self.lista_attiva = None  # lista della proiezione in fase di raccolta
+        self.raccolta = []        # pila di [dizionario, frammenti di testo, ha_figli] dentro la lista attiva
+        self.pila = []          # tag aperti: pila[0] è la radice
+        self.pronti = []        # itinerari completati non ancora restituiti
+        self.corrente = None    # (plantId, name) dell'itinerario in costruzione (None se fuori da un IXLItem utile)
+
+    def start(self, tag, attributi):
+        pila = self.pila
+        pila.append(tag)
+        livello = len(pila)
+        if livello == 3:
+            if tag == 'IXLItem' and pila[1] == 'IXLItemList' and \
+                    (self.piante is None or attributi.get('plantId') in self.piante):
+                self.corrente = (attributi.get('plantId'), attributi.get('name'))
+                self.track_circuits = []
+                self.switch = None
+                self.tcl_vista = self.tcl_attiva = False
+                self.pl_vista = self.pl_attiva = False
+                self.point_visto = self.point_attivo = False
+                self.switch_visto = False
+                if self.piano is not None:
+                    self.extra = {nome: attributi.get(nome) for nome in self.piano.attributi}
+            return
+        if self.corrente is None:
+            return
+        if self.piano is not None:
+            self._start_proiezione(tag, attributi, livello)
+        if livello == 4:
+            if tag == 'TrackCircuitList' and not self.tcl_vista:
+                self.tcl_vista = self.tcl_attiva = True
+            elif tag == 'PointList' and not self.pl_vista:
+                self.pl_vista = self.pl_attiva = True
+        elif livello == 5:
+            if self.tcl_attiva and tag == 'TrackCircuit':
+                self.track_circuits.append(attributi.get('name'))
+            elif self.pl_attiva and tag == 'Point' and not self.point_visto:
+                self.point_visto = self.point_attivo = True
+        elif livello == 6 and self.point_attivo and tag == 'Switch' and not self.switch_visto:
+            self.switch_visto = True
+            self.switch = Switch(
+                attributi.get('switchMotorId'),
+                attributi.get('switchMotorName'),
+                attributi.get('switchMotorState'),
+            )
+
+    def _start_proiezione(self, tag, attributi, livello):
+        if livello == 4:
+            if tag in self.piano.liste and tag not in self.extra:
+                self.lista_attiva = self.extra[tag] = []
+        elif self.lista_attiva is not None:
+            dati = dict(attributi)
+            if livello == 5:
+                self.lista_attiva.append(dati)
+            else:
+                padre = self.raccolta[-1]
+                padre[2] = True
+                padre[0].setdefault(tag, []).append(dati)
+            self.raccolta.append([dati, [], False])
+
+    def testo(self, dati):
+        if self.raccolta:
+            self.raccolta[-1][1].append(dati)
+
+    def end(self, tag):
+        livello = len(self.pila)
+        self.pila.pop()
+        if self.corrente is None:
+            return
+        if self.piano is not None and livello > 3:
+            if livello == 4:
+                self.lista_attiva = None
+            elif self.lista_attiva is not None:
+                dati, frammenti, ha_figli = self.raccolta.pop()
+                testo = ''.join(frammenti).strip()
+                if not ha_figli and testo:
+                    dati['#text'] = testo
+        if livello == 3:
+            plant_id, nome = self.corrente
+            extra = None
+            if self.piano is not None:
+                extra = self.extra
+                for nome_lista in self.piano.liste:
+                    extra.setdefault(nome_lista, [])
+            self.pronti.append(Itinerary(plant_id, nome, self.track_circuits, self.switch, extra=extra))
+            self.corrente = None
+        elif livello == 4:
+            self.tcl_attiva = self.pl_attiva = False
+        elif livello == 5:
+            self.point_attivo = False
+
+
+def _backend_expat(sorgente, piante, piano):
+    """Backend a callback su pyexpat: nessun albero, solo i tag di interesse."""
+    gestore = _GestoreExpat(piante, piano)
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = gestore.start
+    parser.EndElementHandler = gestore.end
+    if piano is not None:
+        # Il testo serve solo per le liste della proiezione
+        parser.CharacterDataHandler = gestore.testo
+
+    while True:
+        blocco = sorgente.read(EXPAT_CHUNK_SIZE)
+        parser.Parse(blocco, not blocco)
+        if gestore.pronti:
+            yield from gestore.pronti
+            gestore.pronti.clear()
+        if not blocco:
+            break
+
+
+BACKENDS = {
+    'etree': _backend_etree,
+    'iterparse': _backend_iterparse,
+    'expat': _backend_expat,
+    'lxml': _backend_lxml,
+}
+
+
+def backend_disponibili():
+    """Nomi dei backend utilizzabili su questa macchina (lxml solo se installato)."""
+    return [nome for nome in BACKENDS if nome != 'lxml' or lxml_etree is not None]
+
+
+def iter_itinerari(xml_path, defaultLogger=None, errorLogger=None, backend=BACKEND_STREAMING, plant_ids=None,
+                   proiezione=None):
+    """Generatore: restituisce gli itinerari man mano che vengono letti.
+
+    `plant_ids` ha lo stesso significato che in `parsing` (default: solo plantId '164').
+    `xml_path` può essere compresso (gzip/bzip2/xz) oppure '-' per lo standard input.
+    `proiezione` indica gli eventuali campi aggiuntivi da estrarre (vedi `Proiezione`).
+    Con il backend di default ('iterparse') l'XML non viene mai caricato per intero
+    in memoria. Gli errori di lettura/sintassi (es. `ET.ParseError`, `OSError`)
+    vengono propagati al chiamante, che decide come gestirli.
     """
     if defaultLogger is None:
         defaultLogger = Logger.get_default_logger()
-    if errorLogger is None:
-        errorLogger = Logger.get_error_logger()
+    if backend not in backend_disponibili():
+        raise ValueError(f"Backend XML non disponibile: '{backend}'. Disponibili: {backend_disponibili()}")
 
-    if not xml_path:
-        errorLogger.error("Nessun percorso XML fornito a Parser.parsing.")
-        return []
+    with apri_sorgente(xml_path) as sorgente:
+        for itinerario in BACKENDS[backend](sorgente, _normalizza_plant_ids(plant_ids), _piano(proiezione)):
+            defaultLogger.info(f"Parsing itinerario: {itinerario.name} completato con successo.")
+            yield itinerario
+
+
+def _raggruppa_per_plant(itinerari, piante):
+    """Partiziona gli itinerari per plantId, mantenendo l'ordine del file.
+
+    Con un insieme esplicito di plant, quelli senza itinerari compaiono con lista vuota.
+    """
+    per_plant = {} if piante is None else {plant_id: [] for plant_id in sorted(piante)}
+    for itinerario in itinerari:
+        per_plant.setdefault(itinerario.id, []).append(itinerario)
+    return per_plant
+
+
+def _esegui_parsing(xml_path, defaultLogger, errorLogger, backend, piante, plant_ids, proiezione):
+    """Esegue il parsing vero e proprio; restituisce (lista di itinerari, completato senza errori)."""
+    if backend != BACKEND_DEFAULT:
+        defaultLogger.info(f"Inizio parsing degli itinerari con {_descrivi_plant(piante)}")
+        try:
+            itinerari = iter_itinerari(xml_path, defaultLogger, errorLogger, backend=backend, plant_ids=plant_ids,
+                                       proiezione=proiezione)
+            return list(itinerari), True
+        except _ERRORI_XML as e:
+            errorLogger.error(f"Errore durante il caricamento del file XML: {e}")
+        except Exception as e:
+            errorLogger.error(f"Errore durante il parsing degli itinerari: {e}")
+        return [], False
 
-    defaultLogger.info(f"Parsing file: {xml_path}")
     # apri/parsa usando xml_path
     try:
-        albero = ET.parse(xml_path)
+        with apri_sorgente(xml_path) as sorgente:
+            albero = ET.parse(sorgente)
         root = albero.getroot()
     except Exception as e:
         errorLogger.error(f"Errore durante il caricamento del file XML: {e}")
-        return []
+        return [], False
 
     listaItinerari = []
 
     # Navigo tutto il percorso: per trovare 'IXLItemList' e poi i vari 'IXLItem'
     try:
-        defaultLogger.info("Inizio parsing degli itinerari con plantId '164'")
-        for itinerario in root.findall('./IXLItemList/IXLItem'):
-
-            # Accedo all'attributo 'plantId' con .get()
-            if itinerario.get('plantId') == '164':
-                itinerario_dict = {
-                    "id": itinerario.get('plantId'),
-                    "name": itinerario.get('name'),
-                    "trackCircuitList": [],
-                    "SwitchMotorId": None,
-                    "SwitchMotorName": None,
-                    "SwitchMotorState": None
-                }
-
-                # Prossimo nodo a cui accedere: 'TrackCircuitList' - Ci interessano solo i nomi dei vari trackCircuit
-                trackCircuitList = itinerario.find('TrackCircuitList')
-                if trackCircuitList is not None:
-                    for trackCircuit in trackCircuitList.findall('TrackCircuit'):
-                        trackCircuit_name = trackCircuit.get('name')
-                        itinerario_dict["trackCircuitList"].append(trackCircuit_name)
-
-                # Prossimo nodo a cui accedere: Switch - protezione contro elementi mancanti
-                switch_element = None
-                point_list = itinerario.find('PointList')
-                if point_list is not None:
-                    first_point = point_list.find('Point')
-                    if first_point is not None:
-                        switch_element = first_point.find('Switch')
-
-                if switch_element is not None:
-                    itinerario_dict["SwitchMotorId"] = switch_element.get('switchMotorId')
-                    itinerario_dict["SwitchMotorName"] = switch_element.get('switchMotorName')
-                    itinerario_dict["SwitchMotorState"] = switch_element.get('switchMotorState')
-
-                listaItinerari.append(itinerario_dict)
-                defaultLogger.info(f"Parsing itinerario: {itinerario_dict.get('name')} completato con successo.")
+        defaultLogger.info(f"Inizio parsing degli itinerari con {_descrivi_plant(piante)}")
+        for itinerario in _itinerari_da_radice(root, piante, _piano(proiezione)):
+            listaItinerari.append(itinerario)
+            defaultLogger.info(f"Parsing itinerario: {itinerario.name} completato con successo.")
 
     except Exception as e:
         errorLogger.error(f"Errore durante il parsing degli itinerari: {e}")
-    return listaItinerari
+        return listaItinerari, False
+    return listaItinerari, True
+
+
+def parsing(xml_path=None, defaultLogger=None, errorLogger=None, streaming=False, backend=None, plant_ids=None,
+            usa_cache=False, cache_dir=None, proiezione=None):
+    """Analizza l'XML fornito e restituisce una lista di itinerari per plantId '164'.
+
+    La firma mette `xml_path` come primo argomento per permettere di chiamare
+    `Parser.parsing()` nei test senza passare argomenti. Se i logger non vengono
+    forniti, vengono ottenuti dal modulo `Logger`.
+
+    `backend` sceglie l'implementazione ('etree', 'iterparse', 'expat', 'lxml'):
+    tutte producono la stessa lista. Se non indicato si usa 'etree', oppure
+    'iterparse' con `streaming=True`.
+
+    Se `plant_ids` è un insieme di plantId oppure 'all', il file viene letto una sola
+    volta e il risultato è un dizionario plantId -> lista di itinerari.
+
+    Con `usa_cache=True` il risultato viene salvato su disco (vedi `ParserCache`) e,
+    se il file non è cambiato, le esecuzioni successive saltano del tutto il parsing.
+
+    I file compressi (.xml.gz, .xml.bz2, .xml.xz) vengono riconosciuti dai primi byte e
+    decompressi in streaming; con `xml_path='-'` l'XML viene letto dallo standard input
+    (in questo caso la cache non viene usata).
+
+    `proiezione` (vedi `Proiezione`) aggiunge attributi e liste figlie da estrarre, per
+    esempio `Proiezione(['direction', 'speed'], ['PointList'])`; i valori finiscono in
+    `Itinerary.extra`. Senza proiezione si estraggono solo i campi di sempre.
+    """
+    if defaultLogger is None:
+        defaultLogger = Logger.get_default_logger()
+    if errorLogger is None:
+        errorLogger = Logger.get_error_logger()
+
+    vuoto = [] if plant_ids is None else {}
+    if not xml_path:
+        errorLogger.error("Nessun percorso XML fornito a Parser.parsing.")
+        return vuoto
+
+    if backend is None:
+        backend = BACKEND_STREAMING if streaming else BACKEND_DEFAULT
+    if backend not in backend_disponibili():
+        errorLogger.error(f"Backend XML non disponibile: '{backend}'. Disponibili: {backend_disponibili()}")
+        return vuoto
+
+    piante = _normalizza_plant_ids(plant_ids)
+    defaultLogger.info(f"Parsing file: {xml_path}")
+
+    chiave_cache = None
+    if usa_cache and xml_path != STDIN:
+        try:
+            parametri = {
+                "plant_ids": None if piante is None else sorted(piante),
+                "partizionato": plant_ids is not None,
+                "proiezione": None if _piano(proiezione) is None else proiezione.parametri(),
+            }
+            chiave_cache = ParserCache.chiave(ParserCache.impronta_file(xml_path), parametri)
+            trovato, risultato = ParserCache.carica(chiave_cache, cache_dir)
+            if trovato:
+                defaultLogger.info("File XML invariato: risultato del parsing letto dalla cache.")
+                return risultato
+        except Exception as e:
+            defaultLogger.warning(f"Cache del parsing non utilizzabile, si procede con il parsing: {e}")
+
+    listaItinerari, completato = _esegui_parsing(xml_path, defaultLogger, errorLogger, backend, piante, plant_ids,
+                                                 proiezione)
+    if not completato and not listaItinerari:
+        return vuoto
+    risultato = listaItinerari if plant_ids is None else _raggruppa_per_plant(listaItinerari, piante)
+
+    # In cache finiscono solo i parsing andati a buon fine
+    if chiave_cache is not None and completato:
+        try:
+            ParserCache.salva(chiave_cache, risultato, cache_dir)
+        except Exception as e:
+            defaultLogger.warning(f"Impossibile salvare il risultato del parsing nella cache: {e}")
+    return risultato
+
+
+def leggi_group_name(xml_path):
+    """Restituisce l'attributo 'groupName' della radice (es. 'Ancona2') leggendo solo il primo tag."""
+    with apri_sorgente(xml_path) as sorgente:
+        for _, root in ET.iterparse(sorgente, events=('start',)):
+            return root.get('groupName')
+    return None
+
+
+def _espandi_sorgenti(sorgenti):
+    """Converte un percorso, un glob o una lista di percorsi/glob in una lista ordinata di file, senza duplicati."""
+    if isinstance(sorgenti, (str, os.PathLike)):
+        sorgenti = [sorgenti]
+    percorsi = []
+    for sorgente in sorgenti:
+        sorgente = os.fspath(sorgente)
+        if any(c in sorgente for c in '*?['):
+            percorsi.extend(sorted(glob.glob(sorgente)))
+        else:
+            percorsi.append(sorgente)
+    return sorted(dict.fromkeys(percorsi))
+
+
+class _MessaggiRaccolti(logging.Handler):
+    """Handler che conserva i messaggi (livello, testo) invece di scriverli."""
+
+    def __init__(self):
+        super().__init__()
+        self.messaggi = []
+
+    def emit(self, record):
+        self.messaggi.append((record.levelno, record.getMessage()))
+
+
+def _logger_raccolta(nome):
+    """Logger non registrato (nessun handler ereditato) che raccoglie i messaggi in memoria."""
+    logger = logging.Logger(nome)
+    logger.addHandler(_MessaggiRaccolti())
+    return logger
+
+
+def _parsing_worker(xml_path, opzioni):
+    """Eseguito in un processo del pool: parsing di un file e marcatura degli itinerari con file e groupName.
 
+    Nei processi avviati con spawn (Windows) i logger del modulo `Logger` non hanno handler:
+    il worker raccoglie i messaggi e li restituisce insieme al risultato, e il processo
+    principale li riporta nei propri log. Restituisce (risultato, messaggi_default, messaggi_errore).
+    """
+    defaultLogger = _logger_raccolta("DefaultLogger")
+    errorLogger = _logger_raccolta("ErrorLogger")
+    risultato = parsing(xml_path, defaultLogger, errorLogger, **opzioni)
+    try:
+        group_name = leggi_group_name(xml_path)
+    except Exception:
+        group_name = None
+
+    itinerari = risultato if isinstance(risultato, list) else [i for lista in risultato.values() for i in lista]
+    for itinerario in itinerari:
+        itinerario.source_file = xml_path
+        itinerario.group_name = group_name
+    return risultato, defaultLogger.handlers[0].messaggi, errorLogger.handlers[0].messaggi
+
+
+def parsing_multi(sorgenti, defaultLogger=None, errorLogger=None, max_workers=None, **opzioni):
+    """Analizza più file ITINERARI.xml (lista di percorsi o glob) in parallelo su un ProcessPoolExecutor.
 
+    Accetta le stesse opzioni di `parsing` (streaming, backend, plant_ids, usa_cache, ...).
+    Ogni itinerario viene marcato con 'sourceFile' e 'groupName'. L'unione dei risultati è
+    deterministica: i file vengono considerati in ordine di percorso e, all'interno di ogni
+    file, gli itinerari restano nell'ordine originale. Il tipo del risultato è lo stesso di
+    `parsing` (lista, oppure dizionario plantId -> lista se `plant_ids` è indicato).
+    """
+    if defaultLogger is None:
+        defaultLogger = Logger.get_default_logger()
+    if errorLogger is None:
+        errorLogger = Logger.get_error_logger()
+
+    partizionato = opzioni.get('plant_ids') is not None
+    unione = {} if partizionato else []
+
+    percorsi = _espandi_sorgenti(sorgenti)
+    if not percorsi:
+        errorLogger.error(f"Nessun file XML trovato per: {sorgenti}")
+        return unione
+
+    # Nei processi figli la directory di output non è configurata: fisso qui la cartella della cache
+    if opzioni.get('usa_cache') and not opzioni.get('cache_dir'):
+        opzioni['cache_dir'] = ParserCache.cartella_cache()
+
+    defaultLogger.info(f"Parsing di {len(percorsi)} file XML in parallelo...")
+    vuoto = ({} if partizionato else [], [], [])
+    if len(percorsi) == 1 or max_workers == 1:
+        risultati = [_parsing_worker(percorso, opzioni) for percorso in percorsi]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_parsing_worker, percorso, opzioni) for percorso in percorsi]
+            risultati = []
+            for percorso, future in zip(percorsi, futures):
+                try:
+                    risultati.append(future.result())
+                except Exception as e:
+                    errorLogger.error(f"Errore durante il parsing del file {percorso}: {e}")
+                    risultati.append(vuoto)
+
+    for percorso, (risultato, messaggi_default, messaggi_errore) in zip(percorsi, risultati):
+        # Messaggi dei worker riportati nei log del processo principale, file per file
+        for livello, messaggio in messaggi_default:
+            defaultLogger.log(livello, messaggio)
+        for livello, messaggio in messaggi_errore:
+            errorLogger.log(livello, messaggio)
+        n = len(risultato) if not partizionato else sum(len(lista) for lista in risultato.values())
+        defaultLogger.info(f"File {percorso}: {n} itinerari.")
+        if partizionato:
+            for plant_id, lista in risultato.items():
+                unione.setdefault(plant_id, []).extend(lista)
+        else:
+            unione.extend(risultato)
+    return unione
+
+
+def fingerprints(itinerari):
+    """Impronte stabili degli itinerari: {(plantId, name): fingerprint}.
+
+    Accetta sia la lista restituita da `parsing` sia il dizionario plantId -> lista.
+    L'impronta copre nome, track circuit e attributi dello switch (vedi `Model.fingerprint`).
+    """
+    if isinstance(itinerari, dict):
+        itinerari = [i for lista in itinerari.values() for i in lista]
+    return {(itinerario.id, itinerario.name): Model.fingerprint(itinerario) for itinerario in itinerari}
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import pickle
+import re
+import time
+
+import Logger
+
+# --- CONFIGURAZIONE CACHE ---
+CACHE_DIR_NAME = "Cache"
+CACHE_FORMAT_VERSION = 5            # da incrementare se cambia la forma degli itinerari salvati
+MAX_ETA_GIORNI = 30                 # le voci più vecchie vengono eliminate
+MAX_DIMENSIONE_TOTALE = 512 * 1024 * 1024  # byte complessivi oltre i quali si eliminano le voci meno recenti
+ESTENSIONE = ".pkl"
+# ----------------------------
+
+_CHUNK_SIZE = 1024 * 1024
+_SOVRAPPOSIZIONE = 512  # byte del blocco precedente riesaminati, per non perdere match a cavallo di due blocchi
+_RE_SOURCE_HASH = re.compile(rb'sourceHASH="([^"]*)"')
+_RE_VERSIONE = re.compile(rb'<versioneGraphConsole>([^<]*)</versioneGraphConsole>')
+
+
+def cartella_cache():
+    """Cartella della cache: 'Cache' accanto alla directory di output (Results)."""
+    output_dir = Logger.get_output_dir()
+    if not output_dir:
+        return os.path.abspath(CACHE_DIR_NAME)
+    return os.path.join(os.path.dirname(os.path.abspath(output_dir)), CACHE_DIR_NAME)
+
+
+def impronta_file(xml_path):
+    """Legge il file una volta e ne restituisce l'impronta usata come chiave della cache.
+
+    Comprende dimensione, mtime, hash SHA-256 del contenuto e i valori di
+    'sourceHASH' (GraphNodePlant) e 'versioneGraphConsole' presenti nel file.
+    """
+    stat = os.stat(xml_path)
+    sha = hashlib.sha256()
+    source_hash = set()
+    versione = None
+    coda = b""
+    with open(xml_path, "rb") as f:
+        while True:
+            blocco = f.read(_CHUNK_SIZE)
+            if not blocco:
+                break
+            sha.update(blocco)
+            finestra = coda + blocco
+            source_hash.update(m.decode("utf-8", "replace") for m in _RE_SOURCE_HASH.findall(finestra))
+            for m in _RE_VERSIONE.findall(finestra):
+                versione = m.decode("utf-8", "replace").strip()
+            coda = finestra[-_SOVRAPPOSIZIONE:]
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": sha.hexdigest(),
+        "sourceHASH": sorted(source_hash),
+        "versioneGraphConsole": versione,
+    }
+
+
+def chiave(impronta, parametri):
+    """Chiave della voce in cache: impronta del file + parametri del parsing + versione del formato."""
+    dati = {"formato": CACHE_FORMAT_VERSION, "file": impronta, "parametri": parametri}
+    return hashlib.sha256(json.dumps(dati, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _percorso_voce(chiave_voce, cartella):
+    return os.path.join(cartella, chiave_voce + ESTENSIONE)
+
+
+def carica(chiave_voce, cartella=None):
+    """Restituisce (True, valore) se la voce esiste, altrimenti (False, None)."""
+    cartella = cartella or cartella_cache()
+    percorso = _percorso_voce(chiave_voce, cartella)
+    if not os.path.exists(percorso):
+        return False, None
+    with open(percorso, "rb") as f:
+        valore = pickle.load(f)
+    # Aggiorno la data di modifica: l'eliminazione per dimensione parte dalle voci usate meno di recente
+    os.utime(percorso, None)
+    return True, valore
+
+
+def salva(chiave_voce, valore, cartella=None):
+    """Salva la voce in modo atomico (file temporaneo + rename) e applica le politiche di eliminazione."""
+    cartella = cartella or cartella_cache()
+    os.makedirs(cartella, exist_ok=True)
+    percorso = _percorso_voce(chiave_voce, cartella)
+    temporaneo = f"{percorso}.{os.getpid()}.tmp"
+    with open(temporaneo, "wb") as f:
+        pickle.dump(valore, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporaneo, percorso)
+    pulisci(cartella)
+
+
+def pulisci(cartella=None, max_eta_giorni=MAX_ETA_GIORNI, max_dimensione=MAX_DIMENSIONE_TOTALE):
+    """Elimina le voci più vecchie di `max_eta_giorni` e, se serve, le meno recenti fino a rientrare in `max_dimensione`.
+
+    Restituisce il numero di voci eliminate.
+    """
+    cartella = cartella or cartella_cache()
+    if not os.path.isdir(cartella):
+        return 0
+
+    voci = []
+    for nome in os.listdir(cartella):
+        if nome.endswith(ESTENSIONE):
+            percorso = os.path.join(cartella, nome)
+            stat = os.stat(percorso)
+            voci.append((stat.st_mtime, stat.st_size, percorso))
+    voci.sort()  # dalla meno recente alla più recente
+
+    limite_eta = time.time() - max_eta_giorni * 24 * 3600
+    totale = sum(dimensione for _, dimensione, _ in voci)
+    eliminate = 0
+    for mtime, dimensione, percorso in voci:
+        if mtime >= limite_eta and totale <= max_dimensione:
+            break
+        os.remove(percorso)
+        totale -= dimensione
+        eliminate += 1
+    return eliminate
@@ -0,0 +1,76 @@
+import json
+
+import Model
+
+
+def testo_differenza(differenza):
+    """Messaggio di una `Model.Differenza`, come compare nel report e nei log."""
+    tipo = differenza.tipo
+    if tipo == Model.TC_MANCANTE_DB:
+        return f"TrackCircuit {differenza.valore_xml} non trovato nel DB."
+    if tipo == Model.TC_MANCANTE_XML:
+        return f"TrackCircuit {differenza.valore_db} non trovato nell'XML."
+    if tipo == Model.SWITCH_DIVERSO:
+        return f"{differenza.campo} non corrispondente. XML: {differenza.valore_xml}, DB: {differenza.valore_db}"
+    if tipo == Model.ITINERARIO_MANCANTE_DB:
+        return "Itinerario presente in XML ma assente nel DB."
+    return f"{tipo}: {differenza.campo} XML: {differenza.valore_xml}, DB: {differenza.valore_db}"
+
+
+def _mancante(differenze):
+    return len(differenze) == 1 and differenze[0].tipo == Model.ITINERARIO_MANCANTE_DB
+
+
+def scrivi_report(esito, scrivi):
+    """Scrive in Report.txt il dettaglio di un `Model.Esito`; `scrivi` scrive una riga (es. ReportWriter.write)."""
+    for nome, differenze in esito.itinerari:
+        scrivi(f"• Itinerario {nome}\n")
+        if not differenze:
+            scrivi("    Stato: OK\n\n")
+        elif _mancante(differenze):
+            scrivi("    Stato: MANCANTE (presente in XML ma assente nel DB)\n\n")
+        else:
+            scrivi("    Stato: DIFFERENZE\n")
+            scrivi("    Dettagli:\n")
+            for differenza in differenze:
+                scrivi(f"      - {testo_differenza(differenza)}\n")
+            scrivi("\n")
+
+
+def scrivi_tc_mancanti(esito, indice, scrivi):
+    """Per ogni TrackCircuit dell'XML non trovato nel DB elenca tutti gli itinerari della rete che lo
+    attraversano (`indice` è un `TcIndex.IndiceTc`), non solo quelli in cui è stato segnalato."""
+    tc_mancanti = dict.fromkeys(d.valore_xml for d in esito.differenze if d.tipo == Model.TC_MANCANTE_DB)
+    if not tc_mancanti:
+        scrivi("  - Nessun TrackCircuit dell'XML mancante nel DB.\n")
+    for tc in tc_mancanti:
+        nomi = [itinerario.name for itinerario in indice.itinerari_con_tc(tc)]
+        scrivi(f"  - TrackCircuit {tc}: attraversato da {len(nomi)} itinerari ({', '.join(nomi)})\n")
+
+
+def registra_log(esito, defaultLogger, errorLogger):
+    """Riporta nei log gli itinerari mancanti (warning) e le differenze (errori)."""
+    for nome, differenze in esito.itinerari:
+        if not differenze:
+            continue
+        if _mancante(differenze):
+            defaultLogger.warning(f"Itinerario '{nome}' presente in XML ma assente nel DB.")
+            continue
+        for differenza in differenze:
+            errorLogger.error(f"DIFF. Itinerario '{nome}': {testo_differenza(differenza)}")
+
+
+def come_dizionari(esito):
+    """Differenze di un `Model.Esito` come lista di dizionari (per JSON, CSV, ...)."""
+    return [{a: getattr(d, a) for a in Model.Differenza.__slots__} for d in esito.differenze]
+
+
+def scrivi_json(esito, percorso):
+    """Salva in `percorso` conteggi e differenze di un `Model.Esito` in formato JSON."""
+    dati = {
+        "ok": esito.ok_count,
+        "con_differenze": esito.diff_count,
+        "differenze": come_dizionari(esito),
+    }
+    with open(percorso, "w", encoding="utf-8") as f:
+        json.dump(dati, f, ensure_ascii=False, indent=1)
@@ -0,0 +1,120 @@
+from array import array
+
+
+class DizionarioTc:
+    """Dizionario dei track circuit: ogni nome riceve un codice intero denso (0, 1, 2, ...).
+
+    Con i codici un insieme di TC diventa un bitset (un int Python, bit i = TC con codice i)
+    e le differenze tra insiemi diventano operazioni bit a bit.
+    """
+    __slots__ = ('_codici', '_nomi')
+
+    def __init__(self):
+        self._codici = {}
+        self._nomi = []
+
+    def codice(self, nome):
+        """Codice del TC, assegnato al primo uso."""
+        codice = self._codici.get(nome)
+        if codice is None:
+            codice = self._codici[nome] = len(self._nomi)
+            self._nomi.append(nome)
+        return codice
+
+    def codice_esistente(self, nome):
+        """Codice del TC, oppure None se il nome non è mai stato codificato."""
+        return self._codici.get(nome)
+
+    def nome(self, codice):
+        return self._nomi[codice]
+
+    def codici(self, track_circuits):
+        """Codici ordinati e senza ripetizioni dei TC indicati (None escluso), come array compatto."""
+        return array('I', sorted({self.codice(tc) for tc in track_circuits if tc is not None}))
+
+    def bitset(self, track_circuits):
+        """Bitset dei TC indicati (None escluso)."""
+        bitset = 0
+        for tc in track_circuits:
+            if tc is not None:
+                bitset |= 1 << self.codice(tc)
+        return bitset
+
+    def nomi(self, bitset):
+        """Nomi dei TC presenti nel bitset, in ordine di codice."""
+        nomi = []
+        while bitset:
+            bit = bitset & -bitset
+            nomi.append(self._nomi[bit.bit_length() - 1])
+            bitset ^= bit
+        return nomi
+
+    def __len__(self):
+        return len(self._nomi)
+
+    def __contains__(self, nome):
+        return nome in self._codici
+
+
+class IndiceTc:
+    """Indice degli itinerari di una rete per track circuit.
+
+    Per ogni itinerario conserva i codici ordinati dei suoi TC (array compatto, da cui
+    `bitset` ricava il bitset) e per ogni TC l'elenco degli itinerari che lo attraversano
+    (indice invertito): interrogazioni come "tutti gli itinerari che toccano il TC 110"
+    non richiedono di scorrere gli itinerari.
+    """
+
+    def __init__(self, itinerari=(), dizionario=None):
+        self.dizionario = dizionario if dizionario is not None else DizionarioTc()
+        self._itinerari = []
+        self._codici = []
+        self._per_tc = {}  # codice TC -> array delle posizioni degli itinerari
+        for itinerario in itinerari:
+            self.aggiungi(itinerario)
+
+    def aggiungi(self, itinerario):
+        """Aggiunge un `Model.Itinerary` all'indice."""
+        posizione = len(self._itinerari)
+        codici = self.dizionario.codici(itinerario.track_circuits)
+        self._itinerari.append(itinerario)
+        self._codici.append(codici)
+        for codice in codici:
+            posizioni = self._per_tc.get(codice)
+            if posizioni is None:
+                posizioni = self._per_tc[codice] = array('I')
+            posizioni.append(posizione)
+
+    def bitset(self, posizione):
+        """Bitset dei TC dell'itinerario in `posizione` (ordine di inserimento)."""
+        bitset = 0
+        for codice in self._codici[posizione]:
+            bitset |= 1 << codice
+        return bitset
+
+    def _posizioni(self, nome_tc):
+        codice = self.dizionario.codice_esistente(nome_tc)
+        if codice is None:
+            return ()
+        return self._per_tc.get(codice, ())
+
+    def itinerari_con_tc(self, nome_tc):
+        """Itinerari che attraversano il TC indicato, in ordine di inserimento."""
+        return [self._itinerari[p] for p in self._posizioni(nome_tc)]
+
+    def itinerari_con_tutti(self, nomi_tc):
+        """Itinerari che attraversano tutti i TC indicati, in ordine di inserimento."""
+        elenchi = sorted((self._posizioni(nome) for nome in set(nomi_tc)), key=len)
+        if not elenchi:
+            return []
+        comuni = set(elenchi[0])
+        for posizioni in elenchi[1:]:
+            comuni.intersection_update(posizioni)
+        return [self._itinerari[p] for p in sorted(comuni)]
+
+    def conteggi(self):
+        """{nome TC: numero di itinerari che lo attraversano}."""
+        return {self.dizionario.nome(codice): len(posizioni) for codice, posizioni in self._per_tc.items()}
+
+    def __len__(self):
+        return len(self._itinerari)
@@ -0,0 +1,115 @@
+import json
+import os
+
+import Logger
+import Parser
+
+FINGERPRINT_FILE_NAME = "fingerprints.json"
+FINGERPRINT_FORMAT_VERSION = 1
+
+
+def salva_fingerprints(percorso, impronte):
+    """Salva le impronte {(plantId, name): fingerprint} in JSON, raggruppate per plantId."""
+    per_plant = {}
+    for (plant_id, nome), impronta in impronte.items():
+        per_plant.setdefault(plant_id, {})[nome] = impronta
+    dati = {"formato": FINGERPRINT_FORMAT_VERSION, "itinerari": per_plant}
+    temporaneo = f"{percorso}.{os.getpid()}.tmp"
+    with open(temporaneo, "w", encoding="utf-8") as f:
+        json.dump(dati, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(temporaneo, percorso)
+
+
+def carica_fingerprints(percorso):
+    """Legge un file di impronte; restituisce None se il file manca o ha un formato diverso."""
+    if not os.path.exists(percorso):
+        return None
+    with open(percorso, encoding="utf-8") as f:
+        dati = json.load(f)
+    if dati.get("formato") != FINGERPRINT_FORMAT_VERSION:
+        return None
+    return {
+        (plant_id, nome): impronta
+        for plant_id, itinerari in dati["itinerari"].items()
+        for nome, impronta in itinerari.items()
+    }
+
+
+def confronta_fingerprints(precedenti, attuali):
+    """Confronta le impronte di due export.
+
+    Restituisce un dizionario con le liste ordinate di chiavi (plantId, name):
+    'aggiunti' (solo nel nuovo export), 'rimossi' (solo nel precedente) e
+    'modificati' (presenti in entrambi con impronta diversa).
+    """
+    return {
+        "aggiunti": sorted(k for k in attuali if k not in precedenti),
+        "rimossi": sorted(k for k in precedenti if k not in attuali),
+        "modificati": sorted(k for k, v in attuali.items() if k in precedenti and precedenti[k] != v),
+    }
+
+
+def filtra_cambiati(itinerari, differenze):
+    """Itinerari (lista o dizionario plantId -> lista) ristretti a quelli aggiunti o modificati."""
+    cambiati = set(differenze["aggiunti"]) | set(differenze["modificati"])
+    if isinstance(itinerari, dict):
+        return {plant_id: [i for i in lista if (i.id, i.name) in cambiati] for plant_id, lista in itinerari.items()}
+    return [i for i in itinerari if (i.id, i.name) in cambiati]
+
+
+def diff_export(itinerari, percorso_fingerprints, defaultLogger=None, errorLogger=None, aggiorna=True):
+    """Confronta gli itinerari appena letti con le impronte dell'export precedente.
+
+    Restituisce le differenze (vedi `confronta_fingerprints`), oppure None se non
+    esiste un export precedente. Con `aggiorna=True` il file viene poi sovrascritto
+    con le impronte attuali, pronto per il confronto successivo; con `aggiorna=False`
+    il salvataggio è lasciato al chiamante (vedi `aggiorna_fingerprints`).
+    """
+    if defaultLogger is None:
+        defaultLogger = Logger.get_default_logger()
+    if errorLogger is None:
+        errorLogger = Logger.get_error_logger()
+
+    attuali = Parser.fingerprints(itinerari)
+    differenze = None
+    try:
+        precedenti = carica_fingerprints(percorso_fingerprints)
+    except (OSError, ValueError) as e:
+        errorLogger.error(f"Errore durante la lettura delle impronte precedenti ({percorso_fingerprints}): {e}")
+        precedenti = None
+
+    if precedenti is None:
+        defaultLogger.info("Nessuna impronta dell'export precedente: tutti gli itinerari vanno verificati.")
+    else:
+        differenze = confronta_fingerprints(precedenti, attuali)
+        defaultLogger.info(
+            f"Rispetto all'export precedente: {len(differenze['aggiunti'])} aggiunti, "
+            f"{len(differenze['rimossi'])} rimossi, {len(differenze['modificati'])} modificati."
+        )
+
+    if aggiorna:
+        aggiorna_fingerprints(itinerari, percorso_fingerprints, defaultLogger, errorLogger, impronte=attuali)
+    return differenze
+
+
+def aggiorna_fingerprints(itinerari, percorso_fingerprints, defaultLogger=None, errorLogger=None, impronte=None):
+    """Sovrascrive il file delle impronte con quelle degli itinerari indicati.
+
+    Da chiamare solo a confronto col DB riuscito: con `diff_export(aggiorna=False)` un
+    confronto interrotto non fa sparire le modifiche dall'export successivo.
+    Restituisce True se il file è stato salvato.
+    """
+    if defaultLogger is None:
+        defaultLogger = Logger.get_default_logger()
+    if errorLogger is None:
+        errorLogger = Logger.get_error_logger()
+
+    if impronte is None:
+        impronte = Parser.fingerprints(itinerari)
+    try:
+        salva_fingerprints(percorso_fingerprints, impronte)
+    except OSError as e:
+        errorLogger.error(f"Errore durante il salvataggio delle impronte ({percorso_fingerprints}): {e}")
+        return False
+    defaultLogger.info(f"Impronte dell'export salvate in {percorso_fingerprints}.")
+    return True
@@ -0,0 +1,136 @@
+import mmap
+import os
+import pickle
+from xml.parsers import expat
+
+import Logger
+import Parser
+
+# --- CONFIGURAZIONE INDICE ---
+ESTENSIONE_INDICE = ".idx"   # l'indice viene salvato accanto al file: ITINERARI.xml.idx
+INDEX_FORMAT_VERSION = 1
+# -----------------------------
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def percorso_indice(xml_path):
+    return os.fspath(xml_path) + ESTENSIONE_INDICE
+
+
+def _stato_file(xml_path):
+    stat = os.stat(xml_path)
+    return {"formato": INDEX_FORMAT_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def costruisci_indice(xml_path):
+    """Scansiona il file una volta e restituisce {(name, plantId): (offset, lunghezza)} per ogni 'IXLItem'.
+
+    Offset e lunghezza sono in byte e delimitano l'elemento completo, dal '<' di apertura
+    al '>' di chiusura. In caso di chiavi duplicate vale la prima occorrenza.
+    """
+    voci = {}
+    pila = []
+    corrente = []  # [chiave, offset di inizio] dell'IXLItem aperto
+
+    with open(xml_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as dati:
+        parser = expat.ParserCreate()
+
+        def start(tag, attributi):
+            pila.append(tag)
+            if len(pila) == 3 and tag == 'IXLItem' and pila[1] == 'IXLItemList':
+                corrente[:] = [(attributi.get('name'), attributi.get('plantId')), parser.CurrentByteIndex]
+
+        def end(tag):
+            if len(pila) == 3 and corrente:
+                chiave, inizio = corrente
+                posizione = parser.CurrentByteIndex
+                if dati[posizione:posizione + 2] == b"</":
+                    # Tag di chiusura '</IXLItem>': termina al primo '>'
+                    fine = dati.find(b">", posizione) + 1
+                else:
+                    # Elemento vuoto '<IXLItem ... />': expat indica già il byte dopo '/>'
+                    # (non basta guardare se la posizione è preceduta da '/>': lo è anche
+                    # '</IXLItem>' dopo un figlio vuoto)
+                    fine = posizione
+                voci.setdefault(chiave, (inizio, fine - inizio))
+                corrente.clear()
+            pila.pop()
+
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        for inizio_blocco in range(0, len(dati), _CHUNK_SIZE):
+            parser.Parse(dati[inizio_blocco:inizio_blocco + _CHUNK_SIZE], False)
+        parser.Parse(b"", True)
+    return voci
+
+
+def carica_indice(xml_path):
+    """Restituisce l'indice salvato accanto al file, oppure None se manca o se il file è cambiato."""
+    percorso = percorso_indice(xml_path)
+    if not os.path.exists(percorso):
+        return None
+    with open(percorso, "rb") as f:
+        intestazione, voci = pickle.load(f)
+    if intestazione != _stato_file(xml_path):
+        return None
+    return voci
+
+
+def salva_indice(xml_path, voci):
+    percorso = percorso_indice(xml_path)
+    temporaneo = f"{percorso}.{os.getpid()}.tmp"
+    with open(temporaneo, "wb") as f:
+        pickle.dump((_stato_file(xml_path), voci), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporaneo, percorso)
+
+
+def indice(xml_path, defaultLogger=None, errorLogger=None):
+    """Restituisce l'indice del file, ricostruendolo (e salvandolo) solo se manca o non è più valido."""
+    if defaultLogger is None:
+        defaultLogger = Logger.get_default_logger()
+
+    try:
+        voci = carica_indice(xml_path)
+    except Exception as e:
+        defaultLogger.warning(f"Indice di {xml_path} non leggibile, verrà ricostruito: {e}")
+        voci = None
+
+    if voci is None:
+        defaultLogger.info(f"Costruzione dell'indice degli IXLItem per: {xml_path}")
+        voci = costruisci_indice(xml_path)
+        try:
+            salva_indice(xml_path, voci)
+        except OSError as e:
+            defaultLogger.warning(f"Impossibile salvare l'indice di {xml_path}: {e}")
+    return voci
+
+
+def carica_itinerario(xml_path, name, plant_id=Parser.PLANT_ID_DEFAULT, defaultLogger=None, errorLogger=None,
+                      proiezione=None):
+    """Legge un solo itinerario senza analizzare il resto del file.
+
+    Tramite l'indice si ottiene la posizione dell'IXLItem; il file viene mappato in
+    memoria e viene analizzato solo il relativo intervallo di byte. Restituisce
+    l'`Itinerary`, oppure None se l'itinerario non esiste o non è leggibile.
+    Il file deve essere codificato in UTF-8 (come gli export ITINERARI.xml).
+    `proiezione` ha lo stesso significato che in `Parser.parsing`.
+    """
+    if defaultLogger is None:
+        defaultLogger = Logger.get_default_logger()
+    if errorLogger is None:
+        errorLogger = Logger.get_error_logger()
+
+    try:
+        voce = indice(xml_path, defaultLogger, errorLogger).get((name, str(plant_id)))
+        if voce is None:
+            defaultLogger.warning(f"Itinerario '{name}' con plantId '{plant_id}' non presente in {xml_path}.")
+            return None
+
+        offset, lunghezza = voce
+        with open(xml_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as dati:
+            frammento = dati[offset:offset + lunghezza]
+        return Parser.itinerario_da_frammento(frammento, proiezione)
+    except Exception as e:
+        errorLogger.error(f"Errore durante la lettura dell'itinerario '{name}' da {xml_path}: {e}")
+        return None
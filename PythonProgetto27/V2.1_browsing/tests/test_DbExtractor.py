@@ -10,6 +10,7 @@ if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
 import DbExtractor
+import DbSource
 
 # --- Dati Fittizi per le tre Query SQL ---
 
@@ -90,7 +91,7 @@ def test_d01_db_extraction_success(mock_pyodbc_connect, mock_loggers):
     itin_b = [i for i in risultato_estratto if i['nome'] == 'ITIN_B'][0]
     
     # Verifica Deduplica (Q2)
-    assert itin_b['trackCircuits'] == ['TC_B1'], "La lista TC deve contenere solo 'TC_B1' (deduplicato)."
+    assert itin_b['trackCircuits'] == ('TC_B1',), "La lista TC deve contenere solo 'TC_B1' (deduplicato)."
     
     # Verifica switch mancante
     assert itin_b['switch'] is None
@@ -139,4 +140,179 @@ def test_d02_db_extraction_failure(mock_pyodbc_connect, mock_loggers):
     assert "Errore durante l'accesso al database" in call_args[0]
     
     # Verifica che il logger abbia comunque registrato il tentativo di chiusura della connessione (se implementato correttamente)
-    defaultLogger.info.assert_any_call("Connessione al database chiusa.")
\ No newline at end of file
+    defaultLogger.info.assert_any_call("Connessione al database chiusa.")
+
+# Righe della query JOIN (id_itine, nome, cdb, ente, id_ente, p.id_cassa, p.nome, p.statocassa), ordinate per id_itine
+MOCK_JOIN = [
+    (101, 'ITIN_A ', 'TC_A', 'TC_A', 201, None, None, None),
+    (101, 'ITIN_A ', 'PT_A_CDB', 'PT_A_ENT', 301, 301, 'SW_A', 'R '),
+    (102, 'ITIN_B ', 'TC_B1', 'TC_B1', 401, None, None, None),
+    (102, 'ITIN_B ', 'TC_B1', 'TC_B1', 402, None, None, None),
+    (103, 'ITIN_C ', None, None, None, None, None, None),  # itinerario senza blocchi
+]
+
+@patch('pyodbc.connect')
+def test_d03_db_extraction_join(mock_pyodbc_connect, mock_loggers):
+    """
+    Verifica che la modalità 'join' produca gli stessi itinerari del merge con una sola query.
+    """
+    defaultLogger, errorLogger = mock_loggers
+    mock_conn = mock_pyodbc_connect.return_value
+    mock_cursor = mock_conn.cursor.return_value
+    mock_cursor.__iter__.return_value = iter(MOCK_JOIN)
+
+    risultato_estratto = DbExtractor.get_data("STRINGA_FITTIZIA", defaultLogger, errorLogger,
+                                              modalita=DbExtractor.MODALITA_JOIN)
+
+    mock_cursor.execute.assert_called_once_with(DbSource.SQL_SERVER.query(DbExtractor.QUERY_JOIN, filtro=""))
+    mock_cursor.fetchall.assert_not_called()
+    assert [i['nome'] for i in risultato_estratto] == ['ITIN_A', 'ITIN_B', 'ITIN_C']
+
+    itin_a, itin_b, itin_c = risultato_estratto
+    assert itin_a['trackCircuits'] == ('TC_A', 'PT_A_CDB')
+    assert itin_a['switch']['SwitchMotorId'] == 301
+    assert itin_a['switch']['SwitchMotorState'] == 2
+    assert itin_b['trackCircuits'] == ('TC_B1',)
+    assert itin_b['switch'] is None
+    assert itin_c['trackCircuits'] == ()
+    errorLogger.error.assert_not_called()
+
+@patch('pyodbc.connect')
+def test_d04_db_extraction_join_fallback(mock_pyodbc_connect, mock_loggers):
+    """
+    Se la query JOIN fallisce si ripiega sulle tre query con merge lato Python.
+    """
+    defaultLogger, errorLogger = mock_loggers
+    mock_conn = mock_pyodbc_connect.return_value
+    mock_cursor = mock_conn.cursor.return_value
+    mock_cursor.execute.side_effect = [pyodbc.Error("JOIN non supportata"), None, None, None]
+    mock_cursor.fetchall.side_effect = [MOCK_ITINERARI, MOCK_BLOCCHI, MOCK_SWITCH]
+
+    risultato_estratto = DbExtractor.get_data("STRINGA_FITTIZIA", defaultLogger, errorLogger,
+                                              modalita=DbExtractor.MODALITA_JOIN)
+
+    assert len(risultato_estratto) == 2
+    assert mock_cursor.execute.call_count == 4
+    defaultLogger.warning.assert_called_once()
+    errorLogger.error.assert_not_called()
+
+@patch('pyodbc.connect')
+def test_d05_db_extraction_filtro_nomi(mock_pyodbc_connect, mock_loggers, monkeypatch):
+    """
+    Con `nomi` le query sono filtrate lato server: lista IN parametrizzata per pochi nomi,
+    tabella temporanea oltre MAX_NOMI_IN_LISTA.
+    """
+    defaultLogger, errorLogger = mock_loggers
+    mock_cursor = mock_pyodbc_connect.return_value.cursor.return_value
+
+    # Pochi nomi: lista IN con i nomi come parametri
+    mock_cursor.__iter__.return_value = iter(MOCK_JOIN[:2])
+    risultato = DbExtractor.get_data("STRINGA_FITTIZIA", defaultLogger, errorLogger,
+                                     modalita=DbExtractor.MODALITA_JOIN, nomi={'ITIN_A', 'ITIN_Z'})
+    assert [i['nome'] for i in risultato] == ['ITIN_A']
+    sql, parametri = mock_cursor.execute.call_args[0]
+    assert "LTRIM(RTRIM(i.nome)) IN (?, ?)" in sql and "FROM dbo.itinerari" in sql
+    assert parametri == ('ITIN_A', 'ITIN_Z')
+    mock_cursor.executemany.assert_not_called()
+
+    # Molti nomi: tabella temporanea, nessun parametro nelle query
+    monkeypatch.setattr(DbExtractor, 'MAX_NOMI_IN_LISTA', 1)
+    mock_cursor.reset_mock()
+    mock_cursor.fetchall.side_effect = [MOCK_ITINERARI, MOCK_BLOCCHI, MOCK_SWITCH]
+    DbExtractor.get_data("STRINGA_FITTIZIA", defaultLogger, errorLogger, nomi=['ITIN_A', 'ITIN_B'])
+    mock_cursor.executemany.assert_called_once_with("INSERT INTO #nomi_xml (nome) VALUES (?);", [('ITIN_A',), ('ITIN_B',)])
+    eseguite = [c[0] for c in mock_cursor.execute.call_args_list]
+    assert eseguite[0] == (DbSource.SorgenteSqlServer.QUERY_CREA_TABELLA_NOMI,)
+    assert all(len(c) == 1 and "#nomi_xml" in c[0] for c in eseguite[1:])
+    errorLogger.error.assert_not_called()
+
+@patch('pyodbc.connect')
+def test_d06_get_nomi(mock_pyodbc_connect, mock_loggers):
+    """
+    `get_nomi` restituisce la lista ordinata dei nomi (senza spazi) di tutti gli itinerari del DB.
+    """
+    defaultLogger, errorLogger = mock_loggers
+    mock_cursor = mock_pyodbc_connect.return_value.cursor.return_value
+    mock_cursor.__iter__.return_value = iter([('ITIN_A ',), ('ITIN_B ',)])
+
+    assert DbExtractor.get_nomi("STRINGA_FITTIZIA", defaultLogger, errorLogger) == ['ITIN_A', 'ITIN_B']
+    mock_cursor.execute.assert_called_once_with("SELECT nome FROM dbo.itinerari WHERE id_itine IS NOT NULL ORDER BY nome;")
+
+@patch('pyodbc.connect')
+def test_d07_db_extraction_fetchmany(mock_pyodbc_connect, mock_loggers):
+    """
+    Con `dimensione_batch` le righe sono lette a blocchi con fetchmany e il risultato non cambia.
+    """
+    defaultLogger, errorLogger = mock_loggers
+    mock_cursor = mock_pyodbc_connect.return_value.cursor.return_value
+
+    # Ogni query restituisce le sue righe a blocchi di 1, seguite da un blocco vuoto
+    blocchi = []
+    for righe in (MOCK_ITINERARI, MOCK_BLOCCHI, MOCK_SWITCH):
+        blocchi.extend([r] for r in righe)
+        blocchi.append([])
+    mock_cursor.fetchmany.side_effect = blocchi
+
+    risultato = DbExtractor.get_data("STRINGA_FITTIZIA", defaultLogger, errorLogger, dimensione_batch=1)
+
+    mock_cursor.fetchall.assert_not_called()
+    mock_cursor.fetchmany.assert_called_with(1)
+    assert mock_cursor.arraysize == 1
+    itin_a = [i for i in risultato if i['nome'] == 'ITIN_A'][0]
+    assert itin_a['trackCircuits'] == ('TC_A', 'PT_A_CDB')
+    assert itin_a['switch']['SwitchMotorState'] == 2
+    assert len(risultato) == 2
+    errorLogger.error.assert_not_called()
+
+def _connessione_fittizia(errore_su=None):
+    """Connessione simulata il cui cursore restituisce le righe in base alla tabella interrogata."""
+    dati = {
+        'dbo.itinerari': MOCK_ITINERARI,
+        'dbo.tc_bloccamenti_dv_itine': MOCK_BLOCCHI,
+        'dbo.tc_it_lib_dev_percorso': MOCK_SWITCH,
+    }
+    conn = MagicMock()
+    cursor = conn.cursor.return_value
+    eseguita = []
+
+    def execute(sql, *parametri):
+        if errore_su and errore_su in sql:
+            raise pyodbc.Error("Simulated query failure")
+        eseguita.append(sql)
+
+    def fetchall():
+        return next(righe for tabella, righe in dati.items() if f"FROM {tabella}" in eseguita[-1])
+
+    cursor.execute.side_effect = execute
+    cursor.fetchall.side_effect = fetchall
+    return conn
+
+@patch('pyodbc.connect')
+def test_d08_db_extraction_parallela(mock_pyodbc_connect, mock_loggers):
+    """
+    Con `parallelo=True` le tre query usano tre connessioni; il risultato è lo stesso del caso sequenziale
+    e gli errori di una query sono riportati come errori di accesso al database.
+    """
+    defaultLogger, errorLogger = mock_loggers
+    connessioni = []
+
+    def connect(conn_string):
+        connessioni.append(_connessione_fittizia())
+        return connessioni[-1]
+
+    mock_pyodbc_connect.side_effect = connect
+    risultato = DbExtractor.get_data("STRINGA_FITTIZIA", defaultLogger, errorLogger, parallelo=True)
+
+    assert len(connessioni) == 3
+    assert all(c.close.call_count == 1 for c in connessioni)
+    itin_a = [i for i in risultato if i['nome'] == 'ITIN_A'][0]
+    assert itin_a['trackCircuits'] == ('TC_A', 'PT_A_CDB')
+    assert itin_a['switch']['SwitchMotorId'] == 301
+    assert len(risultato) == 2
+    errorLogger.error.assert_not_called()
+
+    # Errore nella query degli switch, eseguita su una connessione secondaria
+    mock_pyodbc_connect.side_effect = lambda conn_string: _connessione_fittizia('tc_it_lib_dev_percorso')
+    assert DbExtractor.get_data("STRINGA_FITTIZIA", defaultLogger, errorLogger, parallelo=True) == []
+    call_args, _ = errorLogger.error.call_args
+    assert "Errore durante l'accesso al database" in call_args[0]
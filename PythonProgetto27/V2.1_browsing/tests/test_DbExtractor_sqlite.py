@@ -0,0 +1,362 @@
+import pytest
+from unittest.mock import MagicMock
+import sqlite3
+import sys
+from pathlib import Path
+
+# Configurazione per l'importazione
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import DbExtractor
+import DbPool
+import DbSource
+import Model
+
+# Stesse righe dei test con MagicMock (tests/test_DbExtractor.py), più un itinerario senza blocchi
+ITINERARI = [(101, 'ITIN_A '), (102, 'ITIN_B '), (103, 'ITIN_C ')]
+BLOCCHI = [
+    (101, 'TC_A', 'TC_A', 201),
+    (101, 'PT_A_CDB', 'PT_A_ENT', 301),
+    (102, 'TC_B1', 'TC_B1', 401),
+    (102, 'TC_B1', 'TC_B1', 402),
+]
+SWITCH = [(101, 301, 'SW_A', 'R '), (999, 901, 'SW_Z', 'N ')]
+
+
+@pytest.fixture
+def mock_loggers():
+    mock_logger = MagicMock()
+    return mock_logger, mock_logger
+
+@pytest.fixture
+def db_sqlite(tmp_path):
+    """File SQLite con le tre tabelle popolate."""
+    percorso = str(tmp_path / "itinerari.sqlite")
+    conn = sqlite3.connect(percorso)
+    DbSource.SQLITE.crea_schema(conn)
+    DbSource.SQLITE.popola(conn, ITINERARI, BLOCCHI, SWITCH)
+    conn.close()
+    return percorso
+
+
+def _estrai(percorso, loggers, **opzioni):
+    return sorted(DbExtractor.get_data(percorso, *loggers, sorgente=DbSource.SQLITE, **opzioni), key=lambda i: i.name)
+
+
+def test_s01_merge_sqlite(db_sqlite, mock_loggers):
+    """Il merge lato Python funziona end-to-end su SQLite."""
+    itin_a, itin_b, itin_c = _estrai(db_sqlite, mock_loggers)
+
+    assert (itin_a.id, itin_a.name) == (101, 'ITIN_A')
+    assert itin_a.track_circuits == ('TC_A', 'PT_A_CDB')
+    assert (itin_a.switch.motor_id, itin_a.switch.motor_name, itin_a.switch.motor_state) == (301, 'SW_A', 2)
+    assert itin_b.track_circuits == ('TC_B1',) and itin_b.switch is None
+    assert itin_c.track_circuits == () and itin_c.switch is None
+    mock_loggers[1].error.assert_not_called()
+
+
+@pytest.mark.parametrize("opzioni", [
+    {"modalita": DbExtractor.MODALITA_JOIN},
+    {"dimensione_batch": 2},
+    {"modalita": DbExtractor.MODALITA_JOIN, "dimensione_batch": 2},
+    {"parallelo": True},
+])
+def test_s02_modalita_equivalenti(db_sqlite, mock_loggers, opzioni):
+    """JOIN, fetchmany e query parallele passano dallo stesso codice e danno lo stesso risultato del merge."""
+    assert _estrai(db_sqlite, mock_loggers, **opzioni) == _estrai(db_sqlite, mock_loggers)
+    mock_loggers[1].error.assert_not_called()
+
+
+@pytest.mark.parametrize("max_nomi", [DbExtractor.MAX_NOMI_IN_LISTA, 1])
+@pytest.mark.parametrize("modalita", [DbExtractor.MODALITA_MERGE, DbExtractor.MODALITA_JOIN])
+def test_s03_filtro_nomi(db_sqlite, mock_loggers, monkeypatch, max_nomi, modalita):
+    """Il filtro sui nomi (lista IN o tabella temporanea) restituisce solo gli itinerari richiesti."""
+    monkeypatch.setattr(DbExtractor, 'MAX_NOMI_IN_LISTA', max_nomi)
+    risultato = _estrai(db_sqlite, mock_loggers, modalita=modalita, nomi={'ITIN_A', 'ITIN_C', 'ITIN_Z'})
+    assert [i.name for i in risultato] == ['ITIN_A', 'ITIN_C']
+    assert risultato[0].switch.motor_id == 301
+
+    nomi = DbExtractor.get_nomi(db_sqlite, *mock_loggers, sorgente=DbSource.SQLITE)
+    assert nomi == ['ITIN_A', 'ITIN_B', 'ITIN_C']
+
+
+def test_s04_pool_sqlite(db_sqlite, mock_loggers):
+    """Con il pool, estrazioni ripetute riusano la stessa connessione SQLite."""
+    with DbPool.PoolConnessioni(db_sqlite, sorgente=DbSource.SQLITE) as pool:
+        primo = _estrai(db_sqlite, mock_loggers, pool=pool, modalita=DbExtractor.MODALITA_JOIN)
+        voce = pool._libere[-1]
+        secondo = _estrai(db_sqlite, mock_loggers, pool=pool, modalita=DbExtractor.MODALITA_JOIN)
+        assert pool._libere == [voce]
+    assert primo == secondo == _estrai(db_sqlite, mock_loggers)
+
+
+def test_s05_errore_sqlite(tmp_path, mock_loggers):
+    """Gli errori del driver SQLite sono gestiti come quelli di pyodbc: log ed elenco vuoto (None per i nomi)."""
+    defaultLogger, errorLogger = mock_loggers
+    assert _estrai(str(tmp_path / "vuoto.sqlite"), mock_loggers) == []
+    assert DbExtractor.get_nomi(str(tmp_path / "vuoto.sqlite"), *mock_loggers, sorgente=DbSource.SQLITE) is None
+
+    call_args, _ = errorLogger.error.call_args
+    assert "Errore durante l'accesso al database" in call_args[0]
+    defaultLogger.info.assert_any_call("Connessione al database chiusa.")
+
+
+def test_s06_snapshot(db_sqlite, tmp_path):
+    """Con lo snapshot si rileggono solo le tabelle cambiate e il risultato segue i dati del DB."""
+    cartella = str(tmp_path / "Cache")
+
+    def estrai(**opzioni):
+        logger = MagicMock()
+        risultato = _estrai(db_sqlite, (logger, logger), snapshot=True, cartella_snapshot=cartella, **opzioni)
+        messaggi = [c[0][0] for c in logger.info.call_args_list]
+        logger.error.assert_not_called()
+        return risultato, next(m for m in messaggi if "Tabelle ricaricate" in m or "Nessuna tabella" in m)
+
+    # Primo giro: tutte e tre le tabelle, stesso risultato dell'estrazione senza snapshot
+    risultato, messaggio = estrai()
+    assert messaggio == "Tabelle ricaricate dal database: itinerari, tc_bloccamenti_dv_itine, tc_it_lib_dev_percorso."
+    assert risultato == _estrai(db_sqlite, (MagicMock(), MagicMock()))
+
+    # Nessuna modifica: nessuna tabella riletta
+    assert estrai() == (risultato, "Nessuna tabella modificata: uso lo snapshot locale del database.")
+
+    # La pulizia della cache del Parser non tocca lo snapshot, anche con limiti nulli
+    import ParserCache
+    assert ParserCache.pulisci(cartella, max_eta_giorni=0, max_dimensione=0) == 0
+    assert estrai() == (risultato, "Nessuna tabella modificata: uso lo snapshot locale del database.")
+
+    # Modifica di una sola tabella (stessa lunghezza del valore): si rilegge solo quella
+    conn = sqlite3.connect(db_sqlite)
+    conn.execute("UPDATE tc_it_lib_dev_percorso SET statocassa = 'N ' WHERE id_cassa = 301;")
+    conn.commit()
+    conn.close()
+    risultato, messaggio = estrai()
+    assert messaggio == "Tabelle ricaricate dal database: tc_it_lib_dev_percorso."
+    assert risultato[0].switch.motor_state == 1
+
+    # Il filtro sui nomi è applicato in locale
+    risultato, _ = estrai(nomi={'ITIN_B'})
+    assert [i.name for i in risultato] == ['ITIN_B']
+
+
+def test_s07_impronte(db_sqlite, mock_loggers, monkeypatch):
+    """Le impronte calcolate dal DB coincidono con quelle dell'XML: si leggono in dettaglio solo gli itinerari diversi."""
+    import Comparer
+    import FileWriter
+    from Model import Itinerary, Switch
+
+    xml = [
+        Itinerary("164", "ITIN_A", ["PT_A_CDB", "TC_A"], Switch("301", "SW_A", "2")),  # uguale al DB
+        Itinerary("164", "ITIN_B", ["TC_B1", "TC_B2"], None),                           # TC in più
+        Itinerary("164", "ITIN_C", [], None),                                             # uguale, senza blocchi
+    ]
+    impronte = DbExtractor.impronte_xml(xml)
+
+    for modalita in (DbExtractor.MODALITA_MERGE, DbExtractor.MODALITA_JOIN):
+        itin_a, itin_b, itin_c = _estrai(db_sqlite, mock_loggers, modalita=modalita, impronte=impronte)
+        # Impronte coincidenti: nessun dettaglio trasferito
+        assert itin_a.track_circuits == () and itin_a.switch is None
+        assert itin_a.fingerprint == Model.fingerprint(xml[0], Model.CODIFICA_SERVER)
+        assert itin_c.fingerprint == Model.fingerprint(xml[2], Model.CODIFICA_SERVER)
+        # Impronta diversa: dettagli letti dal DB
+        assert itin_b.track_circuits == ('TC_B1',)
+        assert itin_b.fingerprint is not None and itin_b.fingerprint != Model.fingerprint(xml[1], Model.CODIFICA_SERVER)
+
+    # Il Comparer considera OK gli itinerari con impronta coincidente
+    scritture = MagicMock()
+    monkeypatch.setattr(FileWriter, 'write_existing_file', scritture)
+    assert Comparer.compare_data(xml, [itin_a, itin_b, itin_c], *mock_loggers) == (2, 1)
+    messaggi = [c[0][0] for c in scritture.call_args_list]
+    assert any("TrackCircuit TC_B2 non trovato nel DB." in m for m in messaggi)
+
+
+def test_s08_impronte_switch_ambiguo(db_sqlite, mock_loggers):
+    """Con più switch candidati l'impronta del DB è NULL e l'itinerario viene letto in dettaglio."""
+    conn = sqlite3.connect(db_sqlite)
+    DbSource.SQLITE.popola(conn, blocchi=[(101, 'PT_A2_CDB', 'PT_A2_ENT', 302)], switch=[(101, 302, 'SW_A2', 'N ')])
+    conn.close()
+
+    riferimento = _estrai(db_sqlite, mock_loggers)
+    impronte = DbExtractor.impronte_xml(riferimento)
+    risultato = _estrai(db_sqlite, mock_loggers, impronte=impronte)
+
+    assert risultato[0].fingerprint is None and risultato[0].track_circuits == riferimento[0].track_circuits
+    assert [i.track_circuits for i in risultato[1:]] == [(), ()]
+
+
+def test_s09_multi_database(db_sqlite, mock_loggers, tmp_path):
+    """get_data_multi estrae da più database e restituisce i risultati per target, nell'ordine dato."""
+    secondo = str(tmp_path / "secondo.sqlite")
+    conn = sqlite3.connect(secondo)
+    DbSource.SQLITE.crea_schema(conn)
+    DbSource.SQLITE.popola(conn, [(7, 'ITIN_X ')], [(7, 'TC_X', 'TC_X', 70)])
+    conn.close()
+    mancante = str(tmp_path / "assente" / "db.sqlite")
+
+    targets = {'primo': db_sqlite, 'secondo': secondo, 'mancante': mancante}
+    risultati = DbExtractor.get_data_multi(targets, *mock_loggers, max_per_server=1, sorgente=DbSource.SQLITE)
+
+    assert list(risultati) == ['primo', 'secondo', 'mancante']
+    assert sorted(risultati['primo'], key=lambda i: i.name) == _estrai(db_sqlite, mock_loggers)
+    assert [(i.name, i.track_circuits) for i in risultati['secondo']] == [('ITIN_X', ('TC_X',))]
+    assert risultati['mancante'] == []  # errore registrato, gli altri database non ne risentono
+
+    con_nomi = DbExtractor.get_data_multi([secondo], *mock_loggers, con_nomi=True, sorgente=DbSource.SQLITE,
+                                          nomi={'ITIN_Z'})
+    assert con_nomi[secondo] == ([], ['ITIN_X'])
+
+    # Opzioni per database (es. i nomi del solo plant): sostituiscono quelle comuni
+    per_plant = DbExtractor.get_data_multi({'164': db_sqlite, '162': secondo}, *mock_loggers, con_nomi=True,
+                                           sorgente=DbSource.SQLITE, nomi={'ITIN_X'},
+                                           opzioni_target={'164': {'nomi': {'ITIN_B'}}})
+    assert [i.name for i in per_plant['164'][0]] == ['ITIN_B']
+    assert [i.name for i in per_plant['162'][0]] == ['ITIN_X']
+    assert per_plant['164'][1] == ['ITIN_A', 'ITIN_B', 'ITIN_C']
+
+
+def test_s10_server_di():
+    """Il limite per server usa la chiave SERVER della stringa di connessione (o la stringa stessa)."""
+    assert DbExtractor.server_di("DRIVER={ODBC};SERVER=Host\\SQLEXPRESS;DATABASE=A;") == "host\\sqlexpress"
+    assert DbExtractor.server_di("driver={x}; server = h1 ;database=B") == "h1"
+    assert DbExtractor.server_di("/tmp/db.sqlite") == "/tmp/db.sqlite"
+
+
+def test_s11_impronte_non_supportate(db_sqlite, mock_loggers):
+    """Una sorgente senza QUERY_FINGERPRINT ripiega sull'estrazione completa, con un avviso."""
+
+    class SenzaImpronte(DbSource.SorgenteSqlite):
+        QUERY_FINGERPRINT = None
+
+    riferimento = _estrai(db_sqlite, mock_loggers)
+    risultato = sorted(DbExtractor.get_data(db_sqlite, *mock_loggers, sorgente=SenzaImpronte(),
+                                            impronte=DbExtractor.impronte_xml(riferimento)), key=lambda i: i.name)
+
+    assert risultato == riferimento
+    mock_loggers[0].warning.assert_any_call("La sorgente 'sqlite' non calcola le impronte: leggo tutti i dettagli.")
+    mock_loggers[1].error.assert_not_called()
+
+    # La classe base è astratta: una sorgente deve fornire almeno connessione ed errori del driver
+    with pytest.raises(TypeError):
+        DbSource.SorgenteDati()
+
+
+class _ConnessioneSenzaMars:
+    """Connessione SQLite che, come SQL Server senza MARS, rifiuta una query se un altro
+    cursore ha un risultato non letto fino in fondo."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.occupata_da = None
+
+    def cursor(self):
+        return _CursoreSenzaMars(self)
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+
+class _CursoreSenzaMars:
+    def __init__(self, connessione):
+        self._connessione = connessione
+        self._righe = []
+        self.arraysize = 1
+
+    def execute(self, sql, *parametri):
+        if self._connessione.occupata_da not in (None, self):
+            raise sqlite3.OperationalError("Connection is busy with results for another hstmt")
+        self._righe = self._connessione.conn.execute(sql, *parametri).fetchall()
+        self._connessione.occupata_da = self
+        return self
+
+    def _fine(self):
+        # Il risultato è consumato solo quando una lettura arriva oltre l'ultima riga
+        if self._connessione.occupata_da is self:
+            self._connessione.occupata_da = None
+
+    def fetchone(self):
+        if not self._righe:
+            self._fine()
+            return None
+        return self._righe.pop(0)
+
+    def fetchmany(self, dimensione):
+        blocco, self._righe = self._righe[:dimensione], self._righe[dimensione:]
+        if len(blocco) < dimensione:
+            self._fine()
+        return blocco
+
+    def fetchall(self):
+        righe, self._righe = self._righe, []
+        self._fine()
+        return righe
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self._fine()
+
+
+@pytest.mark.parametrize("dimensione_batch", [None, 2])
+def test_s12_snapshot_con_pool(db_sqlite, tmp_path, dimensione_batch):
+    """Con il pool (un cursore per query) le sonde dello snapshot leggono il risultato fino in fondo."""
+    logger = MagicMock()
+    connetti = lambda conn_string: _ConnessioneSenzaMars(DbSource.SQLITE.connetti(conn_string))
+    atteso = _estrai(db_sqlite, (MagicMock(), MagicMock()))
+
+    with DbPool.PoolConnessioni(db_sqlite, sorgente=DbSource.SQLITE, connetti=connetti) as pool:
+        # Primo giro: sonde e lettura delle tabelle; secondo giro: solo le sonde
+        for _ in range(2):
+            assert _estrai(db_sqlite, (logger, logger), pool=pool, snapshot=True, dimensione_batch=dimensione_batch,
+                           cartella_snapshot=str(tmp_path / "Cache")) == atteso
+    logger.error.assert_not_called()
+
+
+def test_s13_join_maiuscole(tmp_path, mock_loggers):
+    """cdb ed ente che differiscono solo per le maiuscole sono diversi in ogni modalità (merge, JOIN, impronte)."""
+    percorso = str(tmp_path / "maiuscole.sqlite")
+    conn = sqlite3.connect(percorso)
+    DbSource.SQLITE.crea_schema(conn)
+    DbSource.SQLITE.popola(conn, ITINERARI + [(104, 'ITIN_D ')],
+                           BLOCCHI + [(104, 'PT_d', 'PT_D', 501), (104, 'TC_D', 'TC_D', 502), (104, 'tc_d', 'TC_D', 502)],
+                           SWITCH + [(104, 501, 'SW_D', 'N ')])
+    conn.close()
+
+    merge = _estrai(percorso, mock_loggers)
+    assert _estrai(percorso, mock_loggers, modalita=DbExtractor.MODALITA_JOIN) == merge
+    itin_d = merge[3]
+    assert (itin_d.switch.motor_id, itin_d.switch.motor_state) == (501, 1)
+    assert itin_d.track_circuits == ('PT_d', 'TC_D', 'tc_d')
+
+    # L'impronta calcolata dal DB coincide con quella dell'itinerario letto in dettaglio
+    impronte = _estrai(percorso, mock_loggers, impronte=DbExtractor.impronte_xml(merge))
+    assert impronte[3].fingerprint == Model.fingerprint(itin_d, Model.CODIFICA_SERVER)
+    mock_loggers[1].error.assert_not_called()
+
+    # Su SQL Server (collation del database di solito case-insensitive) il confronto è forzato a BIN2
+    sql = DbSource.SQL_SERVER.query(DbExtractor.QUERY_JOIN, filtro='')
+    assert ("LTRIM(RTRIM(b.cdb)) COLLATE Latin1_General_BIN2 <> LTRIM(RTRIM(b.ente)) COLLATE Latin1_General_BIN2"
+            in sql)
+
+
+@pytest.mark.parametrize("max_nomi", [DbExtractor.MAX_NOMI_IN_LISTA, 1])
+@pytest.mark.parametrize("modalita", [DbExtractor.MODALITA_MERGE, DbExtractor.MODALITA_JOIN])
+def test_s14_filtro_nomi_spazi_iniziali(tmp_path, mock_loggers, monkeypatch, max_nomi, modalita):
+    """Un nome con spazi iniziali nel DB viene trovato dal filtro sui nomi (lista IN o tabella temporanea)."""
+    percorso = str(tmp_path / "spazi.sqlite")
+    conn = sqlite3.connect(percorso)
+    DbSource.SQLITE.crea_schema(conn)
+    DbSource.SQLITE.popola(conn, ITINERARI + [(104, '  ITIN_D ')], BLOCCHI + [(104, 'TC_D', 'TC_D', 501)], SWITCH)
+    conn.close()
+
+    monkeypatch.setattr(DbExtractor, 'MAX_NOMI_IN_LISTA', max_nomi)
+    risultato = _estrai(percorso, mock_loggers, modalita=modalita, nomi={'ITIN_A', ' ITIN_D'})
+    assert [i.name for i in risultato] == ['ITIN_A', 'ITIN_D']
+    assert risultato == [i for i in _estrai(percorso, mock_loggers) if i.name in ('ITIN_A', 'ITIN_D')]
+    assert risultato[1].track_circuits == ('TC_D',)
+    mock_loggers[1].error.assert_not_called()
@@ -0,0 +1,110 @@
+import pytest
+from unittest.mock import MagicMock, patch
+import sys
+from pathlib import Path
+import pyodbc
+
+# Configurazione per l'importazione
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import DbPool
+import DbExtractor
+
+
+@pytest.fixture
+def connessioni():
+    """Funzione di connessione fittizia che tiene traccia delle connessioni aperte."""
+    aperte = []
+
+    def connetti(conn_string):
+        conn = MagicMock()
+        conn.cursor.side_effect = lambda: MagicMock()
+        aperte.append(conn)
+        return conn
+
+    return aperte, connetti
+
+
+def test_b01_riuso_connessione_e_cursori(connessioni):
+    """La connessione restituita viene riusata, verificata con SELECT 1 e mantiene un cursore per ogni SQL."""
+    aperte, connetti = connessioni
+    pool = DbPool.PoolConnessioni("STRINGA_FITTIZIA", connetti=connetti)
+
+    voce = pool.acquisisci()
+    voce.cursore.execute("SELECT a;")
+    primo = voce.cursore._corrente
+    pool.rilascia(voce)
+
+    voce_bis = pool.acquisisci()
+    assert voce_bis is voce and len(aperte) == 1
+    voce_bis.cursore.execute("SELECT a;")
+    assert voce_bis.cursore._corrente is primo
+    primo.execute.assert_called_with("SELECT a;")
+    # Il controllo di salute ha un suo cursore dedicato
+    assert DbPool.QUERY_VERIFICA in voce_bis.cursore._cursori
+    # ...e il suo risultato viene letto fino in fondo, per non lasciare la connessione occupata
+    voce_bis.cursore._cursori[DbPool.QUERY_VERIFICA].fetchall.assert_called()
+    pool.rilascia(voce_bis)
+
+    pool.chiudi()
+    aperte[0].close.assert_called_once()
+
+
+def test_b02_scarto_connessioni_non_valide(connessioni):
+    """Connessioni inattive da troppo tempo, che non rispondono o rilasciate dopo un errore vengono chiuse."""
+    aperte, connetti = connessioni
+    pool = DbPool.PoolConnessioni("STRINGA_FITTIZIA", connetti=connetti, timeout_inattivita=60)
+
+    # Inattiva oltre il timeout
+    voce = pool.acquisisci()
+    pool.rilascia(voce)
+    voce.ultimo_uso -= 120
+    assert pool.acquisisci() is not voce
+    aperte[0].close.assert_called_once()
+
+    # Controllo di salute fallito
+    voce = pool.acquisisci()
+    voce.cursore._cursore_per(DbPool.QUERY_VERIFICA).execute.side_effect = pyodbc.Error("Connessione persa")
+    pool.rilascia(voce)
+    assert pool.acquisisci() is not voce
+    voce.connessione.close.assert_called_once()
+
+    # Rilascio dopo un errore
+    voce = pool.acquisisci()
+    pool.rilascia(voce, valida=False)
+    voce.connessione.close.assert_called_once()
+    assert voce not in pool._libere
+
+
+def test_b03_dimensione_massima(connessioni):
+    """Oltre `max_connessioni` il prestito attende e, scaduto il tempo, solleva TimeoutError."""
+    aperte, connetti = connessioni
+    pool = DbPool.PoolConnessioni("STRINGA_FITTIZIA", max_connessioni=1, timeout_attesa=0.01, connetti=connetti)
+
+    voce = pool.acquisisci()
+    with pytest.raises(TimeoutError):
+        pool.acquisisci()
+    pool.rilascia(voce)
+    assert pool.acquisisci() is voce
+
+
+@patch('pyodbc.connect')
+def test_b04_get_data_con_pool(mock_pyodbc_connect):
+    """Due estrazioni con lo stesso pool aprono una sola connessione."""
+    logger = MagicMock()
+    mock_cursor = MagicMock()
+    mock_pyodbc_connect.return_value.cursor.return_value = mock_cursor
+    # Tra le due estrazioni il pool verifica la connessione (SELECT 1 letto con fetchall)
+    mock_cursor.fetchall.side_effect = [[(101, 'ITIN_A ')], [], [], [(1,)], [(101, 'ITIN_A ')], [], []]
+
+    pool = DbPool.PoolConnessioni("STRINGA_FITTIZIA")
+    for _ in range(2):
+        risultato = DbExtractor.get_data("STRINGA_FITTIZIA", logger, logger, pool=pool)
+        assert [i.name for i in risultato] == ['ITIN_A']
+
+    mock_pyodbc_connect.assert_called_once()
+    mock_pyodbc_connect.return_value.close.assert_not_called()
+    logger.info.assert_any_call("Connessione al database restituita al pool.")
+    logger.error.assert_not_called()
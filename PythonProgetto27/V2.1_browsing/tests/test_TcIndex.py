@@ -0,0 +1,65 @@
+import sys
+from pathlib import Path
+
+# Configurazione per l'importazione
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import TcIndex
+from Model import Itinerary
+
+
+def test_t01_dizionario_e_bitset():
+    """I nomi ricevono codici densi; le differenze tra insiemi di TC sono operazioni sui bitset."""
+    dizionario = TcIndex.DizionarioTc()
+    xml = dizionario.bitset(["TC_B", "TC_A", None, "TC_B"])
+    db = dizionario.bitset(["TC_A", "TC_C"])
+
+    assert [dizionario.codice(n) for n in ("TC_B", "TC_A", "TC_C")] == [0, 1, 2]
+    assert len(dizionario) == 3 and "TC_C" in dizionario and None not in dizionario
+    assert dizionario.nomi(xml & ~db) == ["TC_B"]
+    assert dizionario.nomi(db & ~xml) == ["TC_C"]
+    assert list(dizionario.codici(["TC_C", "TC_B", "TC_C"])) == [0, 2]
+
+
+def test_t02_indice_invertito():
+    """L'indice trova gli itinerari che attraversano uno o più TC senza scorrere tutti gli itinerari."""
+    itinerari = [
+        Itinerary("164", "IT_1", ["110", "111"]),
+        Itinerary("164", "IT_2", ["111", "112"]),
+        Itinerary("164", "IT_3", ["110", "112", "111"]),
+    ]
+    indice = TcIndex.IndiceTc(itinerari)
+
+    assert len(indice) == 3
+    assert [it.name for it in indice.itinerari_con_tc("110")] == ["IT_1", "IT_3"]
+    assert [it.name for it in indice.itinerari_con_tutti(["111", "112"])] == ["IT_2", "IT_3"]
+    assert indice.itinerari_con_tc("999") == [] and indice.itinerari_con_tutti(["110", "999"]) == []
+    assert indice.dizionario.nomi(indice.bitset(1)) == ["111", "112"]
+    assert indice.conteggi() == {"110": 2, "111": 3, "112": 2}
+
+
+def test_t03_report_tc_mancanti():
+    """Per ogni TC mancante nel DB il report elenca tutti gli itinerari della rete che lo attraversano."""
+    import Model
+    import Renderer
+
+    indice = TcIndex.IndiceTc([
+        Itinerary("164", "IT_1", ["110", "111"]),
+        Itinerary("164", "IT_2", ["111", "112"]),
+        Itinerary("164", "IT_3", ["110", "112"]),
+    ])
+    esito = Model.Esito([
+        ("IT_1", (Model.Differenza(Model.TC_MANCANTE_DB, "IT_1", "TrackCircuit", "110", None),
+                  Model.Differenza(Model.TC_MANCANTE_XML, "IT_1", "TrackCircuit", None, "999"))),
+        ("IT_3", (Model.Differenza(Model.TC_MANCANTE_DB, "IT_3", "TrackCircuit", "110", None),)),
+    ])
+
+    righe = []
+    Renderer.scrivi_tc_mancanti(esito, indice, righe.append)
+    assert righe == ["  - TrackCircuit 110: attraversato da 2 itinerari (IT_1, IT_3)\n"]
+
+    righe = []
+    Renderer.scrivi_tc_mancanti(Model.Esito(), indice, righe.append)
+    assert righe == ["  - Nessun TrackCircuit dell'XML mancante nel DB.\n"]
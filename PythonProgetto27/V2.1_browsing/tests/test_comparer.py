@@ -194,4 +194,139 @@ def test_c04_check_missing_itinerari(mock_loggers, mock_file_writer):
     assert found, f"Ci aspettavamo una riga che segnala l'itinerario mancante 'C' nelle chiamate: {call_messages}"
 
     # Verifica che il logger abbia emesso un warning per l'itinerario mancante
-    defaultLogger.warning.assert_called()
\ No newline at end of file
+    defaultLogger.warning.assert_called()
+
+def test_c05_model_condiviso(mock_loggers, mock_file_writer):
+    """Il Comparer accetta direttamente gli `Itinerary` prodotti da Parser e DbExtractor, anche mescolati ai vecchi dizionari."""
+    import sys
+    from Model import Itinerary, Switch
+
+    defaultLogger, errorLogger = mock_loggers
+
+    xml = [
+        Itinerary("164", "ITIN_1", ["TC_X", "TC_Y"], Switch("101", "SW_A", "1")),
+        MOCK_XML_PERFECT[1],
+    ]
+    db = [
+        Itinerary(1, "ITIN_1", ("TC_Y", "TC_X"), Switch(101, "SW_A", 2)),
+        Itinerary(2, "ITIN_2", ("TC_Z",), None),
+    ]
+
+    ok_count, diff_count = Comparer.compare_data(xml, db, defaultLogger, errorLogger)
+    assert (ok_count, diff_count) == (1, 1)
+
+    call_messages = [c[0][0] for c in mock_file_writer.call_args_list]
+    assert any("SwitchMotorState non corrispondente. XML: 1, DB: 2" in m for m in call_messages)
+
+    # Tuple di nomi internati e accesso compatibile con le vecchie chiavi
+    assert xml[0].track_circuits == ("TC_X", "TC_Y")
+    assert xml[0].track_circuits[0] is sys.intern("TC_X")
+    assert xml[0]["SwitchMotorId"] == "101" and db[0]["switch"]["SwitchMotorId"] == 101
+
+def test_c06_check_missing_con_nomi_db(mock_loggers, mock_file_writer):
+    """Con il DB filtrato sui nomi dell'XML, mancanti e conteggi si basano sull'elenco completo `db_nomi`."""
+    defaultLogger, errorLogger = mock_loggers
+
+    xml_items = [{'name': 'A'}, {'name': 'B'}]
+    db_items = [{'nome': 'A'}, {'nome': 'B'}]  # estrazione limitata ai nomi dell'XML
+
+    Comparer.check_missing_itinerari(xml_items, db_items, defaultLogger, errorLogger, db_nomi=['A', 'B', 'C'])
+
+    call_messages = [c[0][0] for c in mock_file_writer.call_args_list]
+    assert any('MANCANTE' in m and 'Itinerario C' in m for m in call_messages)
+    assert any('Il DB ha più itinerari (3) del XML (2)' in m for m in call_messages)
+
+def test_c07_esito_strutturato(mock_loggers, mock_file_writer, tmp_path):
+    """compare_data restituisce differenze strutturate; i Renderer producono report, log e JSON dallo stesso esito."""
+    import json
+    import Model
+    import Renderer
+    from Model import Itinerary, Switch
+
+    defaultLogger, errorLogger = mock_loggers
+    xml = [
+        Itinerary("164", "IT_OK", ["A"]),
+        Itinerary("164", "IT_DIFF", ["B"], Switch("7", "SW", "1")),
+        Itinerary("164", "IT_ASSENTE", ["C"]),
+    ]
+    db = [Itinerary(1, "IT_OK", ("A",)), Itinerary(2, "IT_DIFF", ("B",), Switch(7, "SW", 2))]
+
+    esito = Comparer.compare_data(xml, db, defaultLogger, errorLogger)
+    ok_count, diff_count = esito
+    assert (ok_count, diff_count) == (1, 1) and esito == (1, 1)
+    assert [nome for nome, _ in esito.itinerari] == ["IT_OK", "IT_DIFF", "IT_ASSENTE"]
+    assert esito.differenze == [
+        Model.Differenza(Model.SWITCH_DIVERSO, "IT_DIFF", "SwitchMotorState", "1", "2"),
+        Model.Differenza(Model.ITINERARIO_MANCANTE_DB, "IT_ASSENTE"),
+    ]
+
+    # Il report testuale resta quello di prima
+    call_messages = [c[0][0] for c in mock_file_writer.call_args_list]
+    assert call_messages == [
+        "• Itinerario IT_OK\n", "    Stato: OK\n\n",
+        "• Itinerario IT_DIFF\n", "    Stato: DIFFERENZE\n", "    Dettagli:\n",
+        "      - SwitchMotorState non corrispondente. XML: 1, DB: 2\n", "\n",
+        "• Itinerario IT_ASSENTE\n", "    Stato: MANCANTE (presente in XML ma assente nel DB)\n\n",
+    ]
+    errorLogger.error.assert_any_call("DIFF. Itinerario 'IT_DIFF': SwitchMotorState non corrispondente. XML: 1, DB: 2")
+
+    # Stesso esito in formato strutturato, senza ripetere il confronto
+    percorso = tmp_path / "differenze.json"
+    Renderer.scrivi_json(esito, str(percorso))
+    dati = json.loads(percorso.read_text(encoding="utf-8"))
+    assert (dati["ok"], dati["con_differenze"]) == (1, 1)
+    assert dati["differenze"][0] == {"tipo": "switch_diverso", "itinerario": "IT_DIFF", "campo": "SwitchMotorState",
+                                     "valore_xml": "1", "valore_db": "2"}
+
+def test_c08_forma_confronto(mock_loggers, mock_file_writer, monkeypatch):
+    """Con forma di confronto uguale l'itinerario è OK senza confronto dettagliato; la forma è calcolata una volta."""
+    import Model
+    from Model import Itinerary, Switch
+
+    defaultLogger, errorLogger = mock_loggers
+    xml = [Itinerary("164", "IT_1", ["TC_B", "TC_A", None], Switch("101", " SW ", "1")),
+           Itinerary("164", "IT_2", ["TC_C"])]
+    db = [Itinerary(1, "IT_1", ("TC_A", "TC_B", "TC_A"), Switch(101, "SW", 1)),
+          Itinerary(2, "IT_2", ("TC_D",))]
+
+    assert xml[0].forma == db[0].forma and xml[1].forma != db[1].forma
+    assert xml[0].forma is xml[0].forma  # calcolata una volta sola
+    # L'impronta resta quella della forma canonica di sempre (confrontata con quella del DB)
+    assert Model.forma_canonica(xml[0]) == "IT_1\x1fTC_A\x1eTC_B\x1f101\x1fSW\x1f1"
+
+    dettagliati = []
+    originale = Comparer._differenze
+    monkeypatch.setattr(Comparer, '_differenze', lambda x, d: dettagliati.append(x.name) or originale(x, d))
+    assert Comparer.compare_data(xml, db, defaultLogger, errorLogger) == (1, 1)
+    assert dettagliati == ["IT_2"]
+
+@pytest.mark.parametrize("avvio", ["fork", "spawn"])
+def test_c09_confronto_parallelo(mock_loggers, monkeypatch, avvio):
+    """Il confronto su più processi produce lo stesso esito e lo stesso report del confronto sequenziale."""
+    import multiprocessing
+    from Model import Itinerary, Switch
+
+    defaultLogger, errorLogger = mock_loggers
+    xml = [Itinerary("164", f"IT_{i}", [f"TC_{i}", f"TC_{i + 1}", "TC_X"], Switch(str(i), f"SW_{i}", "1"))
+           for i in range(300)]
+    db = [Itinerary(i, f"IT_{i}", [f"TC_{i}", f"TC_{i + 2}"] if i % 3 else [f"TC_{i}", f"TC_{i + 1}", "TC_X"],
+                    Switch(i, f"SW_{i}", 2 if i % 5 == 0 else 1))
+          for i in range(0, 300, 2)]
+
+    def report(processi, contesto=None):
+        righe = []
+        esito = Comparer.compare_data(xml, db, defaultLogger, errorLogger, writer=MagicMock(write=righe.append),
+                                      processi=processi, contesto=contesto)
+        return esito, righe
+
+    sequenziale, righe_sequenziale = report(None)
+    monkeypatch.setattr(Comparer, 'MIN_ITINERARI_PER_PROCESSO', 10)
+    # 'spawn': processi avviati da zero, che ricevono le coppie ridotte a tuple invece di ereditarle
+    parallelo, righe_parallelo = report(3, multiprocessing.get_context(avvio))
+
+    # Nessun ripiego silenzioso sul confronto sequenziale
+    assert not any("confronto parallelo" in str(c) for c in errorLogger.error.call_args_list)
+
+    assert parallelo == sequenziale and (parallelo.ok_count, parallelo.diff_count) == (40, 110)
+    assert righe_parallelo == righe_sequenziale
+    assert sum("MANCANTE" in r for r in righe_parallelo) == 150
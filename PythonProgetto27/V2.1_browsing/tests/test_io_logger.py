@@ -16,6 +16,8 @@ from utils.file_dialog import choose_output_directory, choose_xml_file
 import FileWriter
 import Logger
 
+_WRITE_EXISTING_FILE = FileWriter.write_existing_file
+
 
 def test_io1_choose_output_directory_no_selection(tmp_path, monkeypatch):
     """Simula ambiente senza filedialog/tkinter e input vuoto -> None restituito"""
@@ -68,6 +70,42 @@ def test_io3_file_create_and_overwrite(tmp_path):
     assert os.path.exists(report_path)
 
 
+def test_io4_report_writer_bufferizzato(tmp_path, monkeypatch):
+    """ReportWriter produce lo stesso Report.txt della scrittura riga per riga e intercetta write_existing_file."""
+    # Altri test sostituiscono write_existing_file con un mock: si usa la funzione originale
+    monkeypatch.setattr(FileWriter, 'write_existing_file', _WRITE_EXISTING_FILE)
+    defaultLogger, errorLogger = Logger.setup_directory_and_logger(str(tmp_path))
+    report_path = os.path.join(Logger.get_output_dir(), 'Report.txt')
+    righe = ["\n=== CONFRONTO ITINERARI ===", "• Itinerario A\n", "    Stato: OK\n\n"]
+
+    def leggi_report():
+        with open(report_path, encoding='utf-8') as f:
+            return f.read()
+
+    FileWriter.file_create(defaultLogger, errorLogger)
+    for riga in righe:
+        FileWriter.write_existing_file(riga, errorLogger, defaultLogger)
+    riga_per_riga = leggi_report()
+
+    FileWriter.file_create(defaultLogger, errorLogger)
+    intestazione = leggi_report()
+    with FileWriter.ReportWriter(errorLogger=errorLogger, defaultLogger=defaultLogger, intervallo_flush=3600) as report:
+        assert FileWriter.writer_attivo() is report
+        report.write(righe[0])
+        FileWriter.write_existing_file(righe[1], errorLogger)  # passa dal buffer del writer
+        report.write(righe[2])
+        assert leggi_report() == intestazione  # ancora nel buffer
+    assert FileWriter.writer_attivo() is None
+    atteso = intestazione + "".join(riga + "\n" for riga in righe)
+    assert leggi_report() == atteso
+    assert riga_per_riga.endswith("".join(riga + "\n" for riga in righe))
+
+    # Superata la dimensione del buffer le righe vengono scritte subito
+    with FileWriter.ReportWriter(errorLogger=errorLogger, dimensione_buffer=1, intervallo_flush=3600) as report:
+        report.write("fine")
+        assert leggi_report() == atteso + "fine\n"
+
+
 def test_l01_logger_setup_directory_and_logger(tmp_path):
     out_dir = str(tmp_path)
     defaultLogger, errorLogger = Logger.setup_directory_and_logger(out_dir)
@@ -1,4 +1,5 @@
 import pytest
+import logging
 import os
 import sys
 from unittest.mock import MagicMock
@@ -131,7 +132,7 @@ def test_p01_parsing_xml_valido(valid_xml_file, mock_loggers):
     assert itin_b["id"] == '164'
     assert itin_b["name"] == 'ITIN_VAL_B'
     # Verifica che il campo mancante sia stato inizializzato correttamente a lista vuota
-    assert itin_b["trackCircuitList"] == [] 
+    assert itin_b["trackCircuitList"] == () 
     assert itin_b["SwitchMotorId"] == 'SM_002'
     assert itin_b["SwitchMotorState"] == 'REVERSE'
 
@@ -181,3 +182,341 @@ def test_p03_parsing_xml_malformed(malformed_xml_file, mock_loggers):
     call_args, _ = errorLogger.error.call_args
     assert "Errore durante il caricamento del file XML" in call_args[0]
     
+
+def test_p04_parsing_streaming_equivalente(valid_xml_file, mock_loggers):
+    """Verifica che la modalità streaming (iterparse) produca la stessa lista del parsing classico."""
+
+    defaultLogger, errorLogger = mock_loggers
+
+    attesa = Parser.parsing(valid_xml_file, defaultLogger, errorLogger)
+    ottenuta = Parser.parsing(valid_xml_file, defaultLogger, errorLogger, streaming=True)
+    assert ottenuta == attesa
+
+    # Stesso confronto sul file di esempio reale
+    xml_reale = str(ROOT_DIR / "Input" / "ITINERARI.xml")
+    assert Parser.parsing(xml_reale, defaultLogger, errorLogger, streaming=True) == \
+        Parser.parsing(xml_reale, defaultLogger, errorLogger)
+
+    errorLogger.error.assert_not_called()
+
+def test_p05_parsing_streaming_malformed(malformed_xml_file, mock_loggers):
+    """Anche in modalità streaming un XML mal formattato restituisce lista vuota e un solo errore."""
+
+    defaultLogger, errorLogger = mock_loggers
+
+    listaItinerari = Parser.parsing(malformed_xml_file, defaultLogger, errorLogger, streaming=True)
+
+    assert listaItinerari == []
+    errorLogger.error.assert_called_once()
+    call_args, _ = errorLogger.error.call_args
+    assert "Errore durante il caricamento del file XML" in call_args[0]
+
+def test_p06_backend_equivalenti(valid_xml_file, mock_loggers):
+    """Tutti i backend disponibili (etree, iterparse, expat, lxml) devono produrre gli stessi itinerari."""
+
+    defaultLogger, errorLogger = mock_loggers
+    xml_reale = str(ROOT_DIR / "Input" / "ITINERARI.xml")
+
+    for xml_path in (valid_xml_file, xml_reale):
+        attesa = Parser.parsing(xml_path, defaultLogger, errorLogger, backend='etree')
+        for backend in Parser.backend_disponibili():
+            ottenuta = Parser.parsing(xml_path, defaultLogger, errorLogger, backend=backend)
+            assert ottenuta == attesa, f"Il backend '{backend}' produce un risultato diverso su {xml_path}"
+
+    errorLogger.error.assert_not_called()
+
+def test_p07_backend_expat_malformed(malformed_xml_file, mock_loggers):
+    """Il backend expat segnala l'XML mal formattato come errore di caricamento."""
+
+    defaultLogger, errorLogger = mock_loggers
+
+    assert Parser.parsing(malformed_xml_file, defaultLogger, errorLogger, backend='expat') == []
+    errorLogger.error.assert_called_once()
+    call_args, _ = errorLogger.error.call_args
+    assert "Errore durante il caricamento del file XML" in call_args[0]
+
+def test_p08_parsing_multi_plant(valid_xml_file, mock_loggers):
+    """Con plant_ids il file viene letto una volta e il risultato è partizionato per plantId."""
+
+    defaultLogger, errorLogger = mock_loggers
+
+    per_plant = Parser.parsing(valid_xml_file, defaultLogger, errorLogger, plant_ids='all')
+    assert list(per_plant) == ['164', '999']
+    assert [i["name"] for i in per_plant['164']] == ['ITIN_VAL_A', 'ITIN_VAL_B']
+    assert [i["name"] for i in per_plant['999']] == ['ITIN_NON_VAL']
+
+    # Insieme esplicito: i plant senza itinerari compaiono con lista vuota, gli altri sono scartati
+    xml_reale = str(ROOT_DIR / "Input" / "ITINERARI.xml")
+    for backend in Parser.backend_disponibili():
+        per_plant = Parser.parsing(xml_reale, defaultLogger, errorLogger, backend=backend, plant_ids={'162', '164', '1'})
+        assert sorted(per_plant) == ['1', '162', '164']
+        assert per_plant['1'] == []
+        assert len(per_plant['162']) == 14
+        assert per_plant['164'] == Parser.parsing(xml_reale, defaultLogger, errorLogger)
+
+    errorLogger.error.assert_not_called()
+
+def test_p09_cache_parsing(valid_xml_file, mock_loggers, tmp_path, monkeypatch):
+    """Con usa_cache=True un secondo parsing dello stesso file non rilegge l'XML; se il file cambia la cache è invalidata."""
+
+    defaultLogger, errorLogger = mock_loggers
+    cache_dir = str(tmp_path / "cache")
+
+    attesa = Parser.parsing(valid_xml_file, defaultLogger, errorLogger, usa_cache=True, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+
+    # Se il parsing venisse eseguito fallirebbe: il risultato deve arrivare dalla cache
+    def parsing_vietato(*args, **kwargs):
+        raise AssertionError("Il parsing non doveva essere eseguito")
+    monkeypatch.setattr(Parser, "_esegui_parsing", parsing_vietato)
+    assert Parser.parsing(valid_xml_file, defaultLogger, errorLogger, usa_cache=True, cache_dir=cache_dir) == attesa
+    monkeypatch.undo()
+
+    # Parametri diversi -> voce diversa
+    per_plant = Parser.parsing(valid_xml_file, defaultLogger, errorLogger, plant_ids='all', usa_cache=True, cache_dir=cache_dir)
+    assert set(per_plant) == {'164', '999'}
+    assert len(os.listdir(cache_dir)) == 2
+
+    # Contenuto modificato -> chiave diversa, nuovo parsing
+    with open(valid_xml_file, "a") as f:
+        f.write("<!-- modificato -->")
+    assert Parser.parsing(valid_xml_file, defaultLogger, errorLogger, usa_cache=True, cache_dir=cache_dir) == attesa
+    assert len(os.listdir(cache_dir)) == 3
+
+    errorLogger.error.assert_not_called()
+
+def test_p10_cache_eliminazione(tmp_path):
+    """Le voci troppo vecchie o oltre la dimensione massima vengono eliminate, partendo dalle meno recenti."""
+    import ParserCache
+
+    cache_dir = str(tmp_path)
+    for nome in ("vecchia", "media", "nuova"):
+        ParserCache.salva(nome, list(range(1000)), cache_dir)
+    os.utime(os.path.join(cache_dir, "vecchia" + ParserCache.ESTENSIONE), (1000, 1000))
+
+    # La voce 'vecchia' ha mtime nel 1970: eliminata per età
+    assert ParserCache.pulisci(cache_dir) == 1
+    assert ParserCache.carica("vecchia", cache_dir) == (False, None)
+
+    # Limite di dimensione pari a una sola voce: resta solo l'ultima usata
+    os.utime(os.path.join(cache_dir, "media" + ParserCache.ESTENSIONE), (2000, 2000))
+    dimensione = os.path.getsize(os.path.join(cache_dir, "nuova" + ParserCache.ESTENSIONE))
+    assert ParserCache.pulisci(cache_dir, max_eta_giorni=100000, max_dimensione=dimensione) == 1
+    assert ParserCache.carica("nuova", cache_dir) == (True, list(range(1000)))
+
+def test_p11_parsing_multi_file(tmp_path, mock_loggers):
+    """Più file analizzati in parallelo: unione deterministica e itinerari marcati con file e groupName."""
+
+    defaultLogger, errorLogger = mock_loggers
+    xml_reale = (ROOT_DIR / "Input" / "ITINERARI.xml").read_text(encoding="utf-8")
+
+    # Due copie dello stesso export con groupName diversi
+    for gruppo in ("Ancona2", "Ancona1"):
+        (tmp_path / f"ITINERARI_{gruppo}.xml").write_text(
+            xml_reale.replace('groupName="Ancona2"', f'groupName="{gruppo}"'), encoding="utf-8")
+
+    risultato = Parser.parsing_multi(str(tmp_path / "*.xml"), defaultLogger, errorLogger, max_workers=2)
+    singolo = Parser.parsing(str(ROOT_DIR / "Input" / "ITINERARI.xml"), defaultLogger, errorLogger)
+
+    # I file sono uniti in ordine di percorso: prima Ancona1, poi Ancona2
+    assert len(risultato) == 2 * len(singolo)
+    assert [i["groupName"] for i in risultato] == ["Ancona1"] * len(singolo) + ["Ancona2"] * len(singolo)
+    assert risultato[0]["sourceFile"].endswith("ITINERARI_Ancona1.xml")
+    assert [i["name"] for i in risultato] == [i["name"] for i in singolo] * 2
+
+    # I messaggi dei worker arrivano ai logger del processo principale
+    percorso_ancona1 = str(tmp_path / "ITINERARI_Ancona1.xml")
+    defaultLogger.log.assert_any_call(logging.INFO, f"Parsing file: {percorso_ancona1}")
+
+    # Anche una lista esplicita viene unita in ordine di percorso
+    invertito = Parser.parsing_multi([str(tmp_path / "ITINERARI_Ancona2.xml"), percorso_ancona1],
+                                     defaultLogger, errorLogger, max_workers=2)
+    assert [i["groupName"] for i in invertito] == [i["groupName"] for i in risultato]
+
+    # Con plant_ids il risultato resta partizionato per plant
+    per_plant = Parser.parsing_multi([str(tmp_path / "ITINERARI_Ancona2.xml")], defaultLogger, errorLogger, plant_ids='all')
+    assert len(per_plant['162']) == 14
+    assert per_plant['164'][0]["groupName"] == "Ancona2"
+
+    errorLogger.error.assert_not_called()
+
+def test_p12_indice_accesso_diretto(tmp_path, mock_loggers):
+    """L'indice a offset permette di leggere un singolo IXLItem; se il file cambia l'indice viene ricostruito."""
+    import XmlIndex
+
+    defaultLogger, errorLogger = mock_loggers
+    xml_path = str(tmp_path / "ITINERARI.xml")
+    (tmp_path / "ITINERARI.xml").write_bytes((ROOT_DIR / "Input" / "ITINERARI.xml").read_bytes())
+
+    completi = Parser.parsing(xml_path, defaultLogger, errorLogger, plant_ids='all')
+    for plant_id, lista in completi.items():
+        for atteso in lista:
+            assert XmlIndex.carica_itinerario(xml_path, atteso.name, plant_id, defaultLogger, errorLogger) == atteso
+    assert os.path.exists(XmlIndex.percorso_indice(xml_path))
+
+    assert XmlIndex.carica_itinerario(xml_path, "INESISTENTE", '164', defaultLogger, errorLogger) is None
+
+    # Modifico il file (offset spostati e un nome cambiato): l'indice salvato non è più valido
+    with open(xml_path, "r+b") as f:
+        contenuto = f.read().replace(b'name="01-45"', b'name="01-46"', 1)
+        f.seek(0)
+        f.write(contenuto.replace(b"<IXLItemList>", b"<IXLItemList>\n    <!-- nuovo export -->", 1))
+    assert XmlIndex.carica_indice(xml_path) is None
+    assert XmlIndex.carica_itinerario(xml_path, "01-46", '164', defaultLogger, errorLogger).name == "01-46"
+
+    # IXLItem vuoti ('<IXLItem ... />'), accanto ad altri elementi e dopo un figlio vuoto
+    vuoti = tmp_path / "VUOTI.xml"
+    vuoti.write_bytes(
+        b'<Root>\n <IXLItemList>\n'
+        b'  <IXLItem plantId="164" name="A"><Altro/></IXLItem>\n'
+        b'  <IXLItem plantId="164" name="B"/>\n'
+        b'  <Other>\n  </Other>\n'
+        b' </IXLItemList>\n</Root>\n')
+    voci = XmlIndex.costruisci_indice(str(vuoti))
+    contenuto = vuoti.read_bytes()
+    assert [contenuto[o:o + n] for o, n in voci.values()] == [
+        b'<IXLItem plantId="164" name="A"><Altro/></IXLItem>', b'<IXLItem plantId="164" name="B"/>']
+    itinerario = XmlIndex.carica_itinerario(str(vuoti), "B", '164', defaultLogger, errorLogger)
+    assert (itinerario.name, itinerario.track_circuits, itinerario.switch) == ("B", (), None)
+
+    errorLogger.error.assert_not_called()
+
+def test_p13_fingerprint_e_diff(tmp_path, mock_loggers):
+    """Le impronte sono stabili e il diff tra due export individua aggiunti, rimossi e modificati."""
+    import XmlDiff
+
+    defaultLogger, errorLogger = mock_loggers
+    percorso_fp = str(tmp_path / "fingerprints.json")
+    xml_reale = (ROOT_DIR / "Input" / "ITINERARI.xml").read_text(encoding="utf-8")
+    precedente = tmp_path / "precedente.xml"
+    precedente.write_text(xml_reale, encoding="utf-8")
+
+    itinerari = Parser.parsing(str(precedente), defaultLogger, errorLogger, plant_ids='all')
+    # Impronte indipendenti dal backend usato
+    assert Parser.fingerprints(itinerari) == \
+        Parser.fingerprints(Parser.parsing(str(precedente), defaultLogger, errorLogger, backend='expat', plant_ids='all'))
+
+    # Primo export: nessun confronto possibile, le impronte vengono salvate
+    assert XmlDiff.diff_export(itinerari, percorso_fp, defaultLogger, errorLogger) is None
+
+    # Nuovo export: 01-45 cambia un TC, 01-43 viene rinominato (rimosso + aggiunto)
+    nuovo = tmp_path / "nuovo.xml"
+    nuovo.write_text(
+        xml_reale.replace('id="4046" name="110"', 'id="4046" name="999"', 1).replace('name="01-43"', 'name="01-43B"', 1),
+        encoding="utf-8")
+    nuovi = Parser.parsing(str(nuovo), defaultLogger, errorLogger, plant_ids='all')
+    differenze = XmlDiff.diff_export(nuovi, percorso_fp, defaultLogger, errorLogger, aggiorna=False)
+
+    assert differenze == {
+        "aggiunti": [('164', '01-43B')],
+        "rimossi": [('164', '01-43')],
+        "modificati": [('164', '01-45')],
+    }
+    cambiati = XmlDiff.filtra_cambiati(nuovi, differenze)
+    assert [i.name for i in cambiati['164']] == ['01-45', '01-43B']
+    assert cambiati['162'] == []
+
+    # Senza aggiornamento (confronto col DB non completato) le differenze restano
+    assert XmlDiff.diff_export(nuovi, percorso_fp, defaultLogger, errorLogger, aggiorna=False) == differenze
+
+    # Impronte salvate a confronto riuscito: lo stesso export rieseguito non ha differenze
+    assert XmlDiff.aggiorna_fingerprints(nuovi, percorso_fp, defaultLogger, errorLogger)
+    assert XmlDiff.diff_export(nuovi, percorso_fp, defaultLogger, errorLogger) == \
+        {"aggiunti": [], "rimossi": [], "modificati": []}
+    errorLogger.error.assert_not_called()
+
+def test_p14_sorgenti_compresse_e_stdin(tmp_path, mock_loggers, monkeypatch):
+    """Gli export compressi (gzip/bzip2/xz) e lo standard input producono gli stessi itinerari del file in chiaro."""
+    import bz2
+    import gzip
+    import io
+    import lzma
+
+    defaultLogger, errorLogger = mock_loggers
+    xml_reale = ROOT_DIR / "Input" / "ITINERARI.xml"
+    dati = xml_reale.read_bytes()
+    attesa = Parser.parsing(str(xml_reale), defaultLogger, errorLogger)
+
+    # La compressione è riconosciuta dai magic bytes: le estensioni sono volutamente fuorvianti
+    for nome, compressore in (("a.xml", gzip.compress), ("b.xml.gz", bz2.compress), ("c.dat", lzma.compress)):
+        percorso = tmp_path / nome
+        percorso.write_bytes(compressore(dati))
+        for backend in Parser.backend_disponibili():
+            assert Parser.parsing(str(percorso), defaultLogger, errorLogger, backend=backend) == attesa, (nome, backend)
+
+    # Lettura da standard input con '-'
+    stdin_finto = io.TextIOWrapper(io.BufferedReader(io.BytesIO(gzip.compress(dati))))
+    monkeypatch.setattr(sys, "stdin", stdin_finto)
+    assert Parser.parsing(Parser.STDIN, defaultLogger, errorLogger, streaming=True, usa_cache=True) == attesa
+
+    # Pipe che consegna pochi byte per lettura: la firma xz (6 byte) va comunque riconosciuta
+    class PipeLenta(io.RawIOBase):
+        def __init__(self, contenuto):
+            self.contenuto = contenuto
+
+        def readable(self):
+            return True
+
+        def readinto(self, buffer):
+            dati, self.contenuto = self.contenuto[:2], self.contenuto[2:]
+            buffer[:len(dati)] = dati
+            return len(dati)
+
+    for backend in Parser.backend_disponibili():
+        stdin_finto = io.TextIOWrapper(io.BufferedReader(PipeLenta(lzma.compress(dati))))
+        monkeypatch.setattr(sys, "stdin", stdin_finto)
+        assert Parser.parsing(Parser.STDIN, defaultLogger, errorLogger, backend=backend) == attesa, backend
+
+    errorLogger.error.assert_not_called()
+
+    # Archivio troncato: errore di caricamento, nessuna eccezione
+    troncato = tmp_path / "troncato.xml.gz"
+    troncato.write_bytes(gzip.compress(dati)[:500])
+    assert Parser.parsing(str(troncato), defaultLogger, errorLogger, streaming=True) == []
+    call_args, _ = errorLogger.error.call_args
+    assert "Errore durante il caricamento del file XML" in call_args[0]
+
+def test_p15_proiezione_campi(mock_loggers, tmp_path):
+    """La proiezione estrae attributi e liste aggiuntive, con lo stesso risultato per ogni backend."""
+
+    defaultLogger, errorLogger = mock_loggers
+    xml_reale = str(ROOT_DIR / "Input" / "ITINERARI.xml")
+    proiezione = Parser.Proiezione(
+        attributi=['direction', 'speed', 'signalId', 'startPointId', 'endPointId', 'inesistente'],
+        liste=['PointList', 'Plants', 'ListaMancante'],
+    )
+
+    attesa = Parser.parsing(xml_reale, defaultLogger, errorLogger, proiezione=proiezione)
+    for backend in Parser.backend_disponibili():
+        assert Parser.parsing(xml_reale, defaultLogger, errorLogger, backend=backend, proiezione=proiezione) == attesa, backend
+
+    primo = attesa[0]
+    assert (primo["direction"], primo["speed"], primo["signalId"]) == ('D', '30', '4453')
+    assert primo["inesistente"] is None
+    assert primo["ListaMancante"] == []
+    assert primo["PointList"] == [
+        {'progId': '0', 'id': '944',
+         'Switch': [{'side': '1', 'switchMotorId': '1286', 'switchMotorName': '01',
+                     'switchMotorNumber': '01', 'switchMotorState': '2'}]}
+    ]
+    graph_node = primo["Plants"][0]
+    assert graph_node['name'] == 'Stroncone' and graph_node['plantID'] == [{'#text': '164'}]
+
+    # I campi di base restano identici a quelli del parsing senza proiezione
+    base = Parser.parsing(xml_reale, defaultLogger, errorLogger)
+    assert [(i.name, i.track_circuits, i.switch) for i in attesa] == [(i.name, i.track_circuits, i.switch) for i in base]
+    assert base[0].extra is None
+
+    # Un campo con il nome di un campo di base non sarebbe raggiungibile da Itinerary[...]
+    with pytest.raises(ValueError):
+        Parser.Proiezione(attributi=['direction', 'name'])
+    with pytest.raises(ValueError):
+        Parser.Proiezione(liste=['switch'])
+
+    # La proiezione fa parte della chiave della cache
+    cache_dir = str(tmp_path / "cache")
+    Parser.parsing(xml_reale, defaultLogger, errorLogger, usa_cache=True, cache_dir=cache_dir)
+    assert Parser.parsing(xml_reale, defaultLogger, errorLogger, proiezione=proiezione,
+                          usa_cache=True, cache_dir=cache_dir) == attesa
+
+    errorLogger.error.assert_not_called()
@@ -0,0 +1,129 @@
+"""Benchmark delle modalità di estrazione di DbExtractor su un database SQLite sintetico.
+
+Genera un database SQLite con le stesse tre tabelle di dbo (vedi DbSource.SorgenteSqlite),
+con N itinerari ciascuno con alcuni track circuit e uno switch, e misura per ogni
+modalità di estrazione il tempo, gli itinerari/s e il picco di memoria (tracemalloc), verificando che tutte producano
+gli stessi itinerari. Non serve un SQL Server.
+
+Uso:
+    python utils/benchmark_db.py [n_itinerari1 n_itinerari2 ...]
+"""
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+# Rende importabili i moduli del progetto anche lanciando lo script da utils/
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import DbExtractor
+import DbPool
+import DbSource
+
+DIMENSIONI_DEFAULT = (1000, 10000, 100000)
+TC_PER_ITINERARIO = 8
+RIPETIZIONI = 3
+
+# Modalità confrontate: nome -> opzioni di DbExtractor.get_data
+MODALITA = {
+    "merge": {},
+    "merge+batch": {"dimensione_batch": 5000},
+    "merge+parallelo": {"parallelo": True},
+    "join": {"modalita": DbExtractor.MODALITA_JOIN},
+    "join+batch": {"modalita": DbExtractor.MODALITA_JOIN, "dimensione_batch": 5000},
+}
+
+
+def genera_db(percorso, n_itinerari, tc_per_itinerario=TC_PER_ITINERARIO):
+    """Crea in `percorso` un database SQLite con `n_itinerari` itinerari sintetici.
+
+    Ogni itinerario ha `tc_per_itinerario` blocchi, l'ultimo dei quali (cdb != ente)
+    è collegato a uno switch; la tabella degli switch contiene anche righe non usate.
+    """
+    sorgente = DbSource.SQLITE
+    conn = sqlite3.connect(percorso)
+    try:
+        sorgente.crea_schema(conn)
+        itinerari = [(i, f"ITIN_{i:06d} ") for i in range(1, n_itinerari + 1)]
+        blocchi = []
+        switch = []
+        for id_itine, _ in itinerari:
+            for k in range(tc_per_itinerario - 1):
+                cdb = f"TC_{id_itine:06d}_{k}"
+                blocchi.append((id_itine, cdb, cdb, id_itine * 100 + k))
+            id_ente = id_itine * 100 + 99
+            blocchi.append((id_itine, f"PT_{id_itine:06d}", f"DV_{id_itine:06d}", id_ente))
+            switch.append((id_itine, id_ente, f"SW_{id_itine:06d}", "R " if id_itine % 2 else "N "))
+            switch.append((id_itine, id_ente + 1, f"SW_{id_itine:06d}_X", "N "))
+        sorgente.popola(conn, itinerari, blocchi, switch)
+    finally:
+        conn.close()
+
+
+def misura_modalita(percorso, opzioni, logger, pool=None):
+    """Esegue l'estrazione con le opzioni indicate e restituisce (secondi migliori, picco MB, itinerari)."""
+    migliore = None
+    itinerari = None
+    for _ in range(RIPETIZIONI):
+        itinerari = None
+        inizio = time.perf_counter()
+        itinerari = DbExtractor.get_data(percorso, logger, logger, sorgente=DbSource.SQLITE, pool=pool, **opzioni)
+        durata = time.perf_counter() - inizio
+        migliore = durata if migliore is None else min(migliore, durata)
+
+    # Il picco di memoria si misura a parte: tracemalloc rallenta l'esecuzione
+    itinerari = None
+    tracemalloc.start()
+    itinerari = DbExtractor.get_data(percorso, logger, logger, sorgente=DbSource.SQLITE, pool=pool, **opzioni)
+    picco = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    tracemalloc.stop()
+    return migliore, picco, sorted(itinerari, key=lambda i: i.name)
+
+
+def esegui_benchmark(dimensioni=DIMENSIONI_DEFAULT):
+    """Esegue il benchmark e restituisce una lista di dizionari con i risultati."""
+    # Logger silenzioso: non vogliamo misurare la scrittura dei log
+    logger = logging.getLogger("BenchmarkDb")
+    logger.setLevel(logging.CRITICAL)
+    logger.propagate = False
+
+    risultati = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_itinerari in dimensioni:
+            percorso = os.path.join(tmp, f"itinerari_{n_itinerari}.sqlite")
+            genera_db(percorso, n_itinerari)
+
+            riferimento = None
+            with DbPool.PoolConnessioni(percorso, sorgente=DbSource.SQLITE) as pool:
+                for nome, opzioni in MODALITA.items():
+                    for con_pool in (False, True):
+                        secondi, picco, itinerari = misura_modalita(percorso, opzioni, logger, pool if con_pool else None)
+                        if riferimento is None:
+                            riferimento = itinerari
+                        risultati.append({
+                            "itinerari": n_itinerari,
+                            "modalita": nome + ("+pool" if con_pool else ""),
+                            "secondi": secondi,
+                            "item_s": n_itinerari / secondi if secondi else float("inf"),
+                            "picco_mb": picco,
+                            "identico": itinerari == riferimento,
+                        })
+    return risultati
+
+
+def stampa_risultati(risultati):
+    print(f"{'itinerari':>10} {'modalita':>22} {'s':>9} {'item/s':>11} {'picco MB':>9}  identico")
+    for r in risultati:
+        print(f"{r['itinerari']:>10} {r['modalita']:>22} {r['secondi']:>9.4f} {r['item_s']:>11.0f} "
+              f"{r['picco_mb']:>9.1f}  {'si' if r['identico'] else 'NO'}")
+
+
+if __name__ == "__main__":
+    dimensioni = tuple(int(a) for a in sys.argv[1:]) or DIMENSIONI_DEFAULT
+    stampa_risultati(esegui_benchmark(dimensioni))
@@ -0,0 +1,100 @@
+"""Benchmark dei backend XML di Parser.
+
+Genera copie scalate di Input/ITINERARI.xml (gli 'IXLItem' vengono ripetuti N volte)
+e misura per ogni backend disponibile il throughput in MB/s e in item/s, verificando
+che tutti producano gli stessi itinerari.
+
+Uso:
+    python utils/benchmark_parser.py [percorso_xml] [fattore1 fattore2 ...]
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Rende importabili i moduli del progetto anche lanciando lo script da utils/
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import Parser
+
+XML_DEFAULT = ROOT_DIR / "Input" / "ITINERARI.xml"
+FATTORI_DEFAULT = (1, 10, 100)
+RIPETIZIONI = 3
+
+
+def genera_xml_scalato(sorgente, destinazione, fattore):
+    """Scrive in `destinazione` una copia di `sorgente` con il contenuto di 'IXLItemList' ripetuto `fattore` volte.
+
+    Restituisce il numero di 'IXLItem' presenti nel file generato.
+    """
+    dati = Path(sorgente).read_bytes()
+    apertura = dati.index(b"<IXLItemList>") + len(b"<IXLItemList>")
+    chiusura = dati.rindex(b"</IXLItemList>")
+    corpo = dati[apertura:chiusura]
+    with open(destinazione, "wb") as f:
+        f.write(dati[:apertura])
+        for _ in range(fattore):
+            f.write(corpo)
+        f.write(dati[chiusura:])
+    return corpo.count(b"<IXLItem ") * fattore
+
+
+def misura_backend(xml_path, backend, logger):
+    """Esegue il parsing con il backend indicato e restituisce (secondi migliori, itinerari)."""
+    migliore = None
+    itinerari = None
+    for _ in range(RIPETIZIONI):
+        inizio = time.perf_counter()
+        itinerari = Parser.parsing(xml_path, logger, logger, backend=backend)
+        durata = time.perf_counter() - inizio
+        migliore = durata if migliore is None else min(migliore, durata)
+    return migliore, itinerari
+
+
+def esegui_benchmark(xml_path=XML_DEFAULT, fattori=FATTORI_DEFAULT):
+    """Esegue il benchmark e restituisce una lista di dizionari con i risultati."""
+    # Logger silenzioso: non vogliamo misurare la scrittura dei log
+    logger = logging.getLogger("BenchmarkParser")
+    logger.setLevel(logging.CRITICAL)
+    logger.propagate = False
+
+    risultati = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for fattore in fattori:
+            scalato = os.path.join(tmp, f"ITINERARI_x{fattore}.xml")
+            n_item = genera_xml_scalato(xml_path, scalato, fattore)
+            mb = os.path.getsize(scalato) / (1024 * 1024)
+
+            riferimento = None
+            for backend in Parser.backend_disponibili():
+                secondi, itinerari = misura_backend(scalato, backend, logger)
+                if riferimento is None:
+                    riferimento = itinerari
+                risultati.append({
+                    "fattore": fattore,
+                    "backend": backend,
+                    "mb": mb,
+                    "item": n_item,
+                    "secondi": secondi,
+                    "mb_s": mb / secondi if secondi else float("inf"),
+                    "item_s": n_item / secondi if secondi else float("inf"),
+                    "identico": itinerari == riferimento,
+                })
+    return risultati
+
+
+def stampa_risultati(risultati):
+    print(f"{'fattore':>8} {'backend':>10} {'MB':>9} {'item':>9} {'s':>9} {'MB/s':>9} {'item/s':>11}  identico")
+    for r in risultati:
+        print(f"{r['fattore']:>8} {r['backend']:>10} {r['mb']:>9.2f} {r['item']:>9} {r['secondi']:>9.4f} "
+              f"{r['mb_s']:>9.2f} {r['item_s']:>11.0f}  {'si' if r['identico'] else 'NO'}")
+
+
+if __name__ == "__main__":
+    xml = sys.argv[1] if len(sys.argv) > 1 else XML_DEFAULT
+    fattori = tuple(int(a) for a in sys.argv[2:]) or FATTORI_DEFAULT
+    stampa_risultati(esegui_benchmark(xml, fattori))
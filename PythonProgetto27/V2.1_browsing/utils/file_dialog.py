@@ -14,7 +14,7 @@ def choose_xml_file(initial_dir=None, title="Seleziona il file ITINERARI.xml:"):
         path = filedialog.askopenfilename(
             title=title,
             initialdir=initial_dir,
-            filetypes=[("XML files", "*.xml"), ("All files", "*.*")]
+            filetypes=[("XML files", "*.xml *.xml.gz *.xml.bz2 *.xml.xz"), ("All files", "*.*")]
         )
         root.destroy()
         if path: